@@ -30,8 +30,58 @@ def get_policy_file(fn):
     clickreviews.remote.get_remote_file(fn, AA_POLICY_DATA_URL)
 
 
+# The lookup indexes of the shared policy of each file, with the parsed
+# policy they were built from
+POLICY_INDEX_CACHE = dict()
+
+
+def build_policy_index(policy):
+    '''Return the lookup indexes of policy, of the form:
+         {vendor: {version: {'policy_groups': {type: sorted groups},
+                             'policy_group_types': {group: type},
+                             'templates': {type: sorted templates},
+                             'template_types': {template: type}}}}
+       where the 'all' type has the groups (or templates) of all the types.
+       When a group is of more than one type, the first type is used.
+    '''
+    index = dict()
+    for vendor in policy:
+        index[vendor] = dict()
+        for version in policy[vendor]:
+            d = dict()
+            for kind, types_key in [('policy_groups', 'policy_group_types'),
+                                    ('templates', 'template_types')]:
+                d[kind] = {'all': []}
+                d[types_key] = dict()
+                for t in policy[vendor][version].get(kind, {}):
+                    names = policy[vendor][version][kind][t]
+                    d[kind][t] = sorted(names)
+                    d[kind]['all'] += names
+                    for name in names:
+                        d[types_key].setdefault(name, t)
+                d[kind]['all'].sort()
+            index[vendor][version] = d
+    return index
+
+
 class ApparmorPolicy(object):
-    def __init__(self, local_copy_fn=None):
+    def __init__(self, local_copy_fn=None, shared=False):
+        # with shared=True, policy and index are shared by all the
+        # instances and must not be modified
         self.policy = clickreviews.remote.read_cr_file(USER_DATA_FILE,
                                                        AA_POLICY_DATA_URL,
-                                                       local_copy_fn)
+                                                       local_copy_fn,
+                                                       copy_data=not shared)
+        if not shared:
+            self.index = build_policy_index(self.policy)
+            return
+
+        key = local_copy_fn
+        if not key or not os.path.exists(key):
+            key = USER_DATA_FILE
+        # the parsed policy is a new object when the file changed
+        if key not in POLICY_INDEX_CACHE or \
+                POLICY_INDEX_CACHE[key][0] is not self.policy:
+            POLICY_INDEX_CACHE[key] = (self.policy,
+                                       build_policy_index(self.policy))
+        self.index = POLICY_INDEX_CACHE[key][1]
@@ -17,23 +17,37 @@
 from __future__ import print_function
 import atexit
 import codecs
+import concurrent.futures
+import copy
+import fnmatch
+import hashlib
 import inspect
 import json
 import logging
 import magic
+import mmap
 import os
 import re
 import shutil
+import stat
 import subprocess
 import sys
 import tempfile
+import threading
 import types
 
+from clickreviews import profiling, streaming
+from clickreviews.squashfs import SquashfsError, SquashfsImage
+
 
 DEBUGGING = False
 UNPACK_DIR = None
 RAW_UNPACK_DIR = None
 TMP_DIR = None
+# Unpack squashfs snaps lazily (see LazyUnpack)
+LAZY_UNPACK = False
+# LazyUnpacks keyed by unpack directory
+LAZY_UNPACKS = dict()
 VALID_SYSCALL = r'^[a-z0-9_]{2,64}$'
 # This needs to match up with snapcraft
 MKSQUASHFS_OPTS = ['-noappend', '-comp', 'xz', '-all-root', '-no-xattrs']
@@ -52,21 +66,67 @@ AA_PROFILE_NAME_MAXLEN = 230  # 245 minus a bit for child profiles
 AA_PROFILE_NAME_ADVLEN = 100
 # Store enforces this length for snap v2
 STORE_PKGNAME_SNAPV2_MAXLEN = 40
+# Size of the reads when hashing files
+HASH_BUFSIZE = 1024 * 1024
+# Size of the reads when scanning file contents. The first block is also
+# what is used to decide if a file is text.
+SCAN_BUFSIZE = 64 * 1024
+# Start of the only files libmagic reports as one of
+# Review.magic_binary_file_descriptions (ELF and OMF objects). Others aren't
+# given to libmagic when looking for compiled binaries.
+BINARY_MAGICS = (b'\x7fELF', b'\x80')
+# Version of the file indexes of PackageContext.get_file_index()
+FILE_INDEX_VERSION = 2
+# The digest telling whether a file is the same as in the baseline. sha256
+# is the cheapest of the secure ones, being hardware accelerated on most
+# CPUs.
+BASELINE_DIGEST = 'sha256'
+# What the checks of a review class may need besides the unpacked package
+# (see Review.needs):
+#   raw_unpack        the members of click packages (ar x)
+#   binaries      the compiled binaries (libmagic on the package files)
+#   network_data  data files which are kept up to date from the network
+REVIEW_RESOURCES = ['raw_unpack', 'binaries', 'network_data']
+# Bytes that may appear in text files (like file(1), anything but NUL and
+# most of the control characters)
+TEXT_CHARS = bytes({7, 8, 9, 10, 12, 13, 27}.union(range(0x20, 0x7f),
+                                                   range(0x80, 0x100)))
+
+# Files from version control systems. These are glob patterns matched
+# against the top-level entries of the package.
+VCS_FILES = ['.bzr*',
+             # '.excludes',  # autogenerated by SDK
+             '.git*',
+             '.idea',
+             '.svn*',
+             '.hg',
+             '.project',
+             'CVS*',
+             'RCS*'
+             ]
+# Potentially sensitive files. These are regexes searched for in the names
+# of all the files of the package.
+IFFY_FILES = [r'^\..+\.swp$',  # vim
+              ]
 
 
 def cleanup_unpack():
     global UNPACK_DIR
-    if UNPACK_DIR is not None and os.path.isdir(UNPACK_DIR):
+    if UNPACK_DIR in LAZY_UNPACKS:
+        LAZY_UNPACKS.pop(UNPACK_DIR).close()
+    if UNPACK_DIR and os.path.isdir(UNPACK_DIR):
         recursive_rm(UNPACK_DIR)
-        UNPACK_DIR = None
+    UNPACK_DIR = None
+    # raw_unpack_pkg() returns '' for squashfs snaps, which must not leave
+    # the next package in a batch without its raw unpack
     global RAW_UNPACK_DIR
-    if RAW_UNPACK_DIR is not None and os.path.isdir(RAW_UNPACK_DIR):
+    if RAW_UNPACK_DIR and os.path.isdir(RAW_UNPACK_DIR):
         recursive_rm(RAW_UNPACK_DIR)
-        RAW_UNPACK_DIR = None
+    RAW_UNPACK_DIR = None
     global TMP_DIR
-    if TMP_DIR is not None and os.path.isdir(TMP_DIR):
+    if TMP_DIR and os.path.isdir(TMP_DIR):
         recursive_rm(TMP_DIR)
-        TMP_DIR = None
+    TMP_DIR = None
 
 
 atexit.register(cleanup_unpack)
@@ -75,6 +135,124 @@ atexit.register(cleanup_unpack)
 #
 # Utility classes
 #
+class PathMatcher(object):
+    '''Match names against several categories of patterns at once. Each
+       category is a list of regexes which are searched for in the names
+       (like re.search()). All the categories are compiled into a single
+       regex so that each name is only matched once.
+    '''
+    def __init__(self, categories):
+        self.categories = sorted(categories.keys())
+        groups = []
+        for (i, c) in enumerate(self.categories):
+            alternatives = '|'.join(['(?:%s)' % p for p in categories[c]])
+            # an optional lookahead per category so that a name can be in
+            # several of them
+            groups.append('(?:(?=(?P<c%d>.*?(?:%s))))?' % (i, alternatives))
+        self.regex = re.compile(''.join(groups), re.DOTALL)
+
+    def match(self, name):
+        '''Return the set of categories that name matches'''
+        m = self.regex.match(name)
+        return set([c for (i, c) in enumerate(self.categories)
+                    if m.group('c%d' % i) is not None])
+
+
+PACKAGE_FILE_MATCHER = PathMatcher({
+    'vcs': ['^%s' % fnmatch.translate(x) for x in VCS_FILES],
+    'iffy': IFFY_FILES,
+})
+
+
+class StopPolicy(object):
+    '''When to stop reviewing a package, skipping the checks and modules
+       not run yet. conditions are any of:
+         error          any error
+         warn           any warning or error
+         manual_review  any error needing manual review
+         <check name>   an error of that check (review_type:check, like in
+                        check-names.list)
+    '''
+    severities = ['error', 'warn', 'manual_review']
+
+    def __init__(self, conditions):
+        self.conditions = set(conditions)
+        self.reset()
+
+    def reset(self):
+        '''Prepare for reviewing another package'''
+        # the name of the result which stopped the review
+        self.stopped_by = None
+
+    def match(self, result_type, name, result):
+        '''Return whether the result 'name' of type result_type stops the
+           review'''
+        if result_type == 'warn':
+            return 'warn' in self.conditions
+        elif result_type != 'error':
+            return False
+        if self.conditions & set(['error', 'warn']):
+            return True
+        if 'manual_review' in self.conditions and \
+                result.get('manual_review', False):
+            return True
+        return ':'.join(name.split(':')[:2]) in self.conditions
+
+    def add_result(self, result_type, name, result):
+        '''Stop the review if the result 'name' matches'''
+        if self.stopped_by is None and self.match(result_type, name, result):
+            self.stopped_by = name
+
+    def add_report(self, report):
+        '''Stop the review if any result of report matches'''
+        for result_type in ['error', 'warn']:
+            for name in sorted(report.get(result_type, {})):
+                self.add_result(result_type, name, report[result_type][name])
+
+
+# The StopPolicy of the review, None to always run all the checks
+STOP_POLICY = None
+
+
+class CheckFilter(object):
+    '''Which results to report, from glob patterns of check names
+       (review_type:check, like in check-names.list). Without only, all
+       the checks that aren't skipped are selected.'''
+    def __init__(self, only=None, skip=None):
+        self.only = list(only) if only else []
+        self.skip = list(skip) if skip else []
+
+    def match(self, name):
+        '''Return whether the result 'name' is selected'''
+        name = ':'.join(name.split(':')[:2])
+        if self.only and \
+                not [p for p in self.only if fnmatch.fnmatchcase(name, p)]:
+            return False
+        return not [p for p in self.skip if fnmatch.fnmatchcase(name, p)]
+
+    def may_match(self, review_type):
+        '''Return whether some results of the review_type may be selected,
+           ie whether the review class needs to run at all'''
+        for p in self.skip:
+            # 'review_type:*' skips all of them
+            (p_type, sep, p_check) = p.partition(':')
+            if sep and p_check == '*' and \
+                    fnmatch.fnmatchcase(review_type, p_type):
+                return False
+        if not self.only:
+            return True
+        for p in self.only:
+            (p_type, sep, p_check) = p.partition(':')
+            # without review_type, any review class may match
+            if not sep or fnmatch.fnmatchcase(review_type, p_type):
+                return True
+        return False
+
+
+# The CheckFilter of the review, None to report all the results
+CHECK_FILTER = None
+
+
 class ReviewException(Exception):
     '''This class represents Review exceptions'''
     def __init__(self, value):
@@ -84,6 +262,425 @@ class ReviewException(Exception):
         return repr(self.value)
 
 
+class PackageContext(object):
+    '''Per-package data shared by all the reviews of a single package.
+
+       The package is unpacked, detected and walked once and the results
+       (file list, stat information, libmagic results and parsed metadata)
+       are cached here so that each review class doesn't have to redo
+       this work.
+    '''
+    def __init__(self, fn, unpack_dir=None, needs=None):
+        '''needs are the REVIEW_RESOURCES the reviews of the package need,
+           None for all of them'''
+        self.pkg_filename = fn
+
+        if unpack_dir is not None:
+            # not the package being reviewed (see build_file_index())
+            self.unpack_dir = unpack_dir
+            self.raw_unpack_dir = None
+        else:
+            global UNPACK_DIR
+            if UNPACK_DIR is None:
+                UNPACK_DIR = unpack_pkg(fn)
+            self.unpack_dir = UNPACK_DIR
+
+            global RAW_UNPACK_DIR
+            if RAW_UNPACK_DIR is None and \
+                    (needs is None or 'raw_unpack' in needs):
+                RAW_UNPACK_DIR = raw_unpack_pkg(fn)
+            self.raw_unpack_dir = RAW_UNPACK_DIR
+
+        self.pkgfmt = None
+        self.pkg_files = None
+        self.symlinks = None
+        self.statinfo = dict()
+        self.mime = None
+        self.mime_types = dict()
+        self.parsed = dict()
+        self.digests = dict()
+        self.found = dict()
+        self.scans = dict()
+        self.shared = dict()
+        # the file index entries of the previous revision of the package
+        # not looked at yet, keyed by path (see use_baseline())
+        self.baseline = dict()
+
+    def detect_package(self):
+        '''Return the (type, version) of the package'''
+        if self.pkgfmt is None:
+            self.pkgfmt = detect_package(self.pkg_filename, self.unpack_dir)
+        return self.pkgfmt
+
+    def _walk(self, top):
+        '''Add the files under top to pkg_files, like os.walk(), and the
+           symlinks with their target to symlinks'''
+        try:
+            entries = list(os.scandir(top))
+        except OSError:
+            return
+        dirs = []
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if is_dir:
+                # like os.walk(), symlinks to directories aren't followed
+                if not entry.is_symlink():
+                    dirs.append(entry.path)
+                continue
+            self.pkg_files.append(entry.path)
+            if entry.is_symlink():
+                try:
+                    self.symlinks[entry.path] = os.readlink(entry.path)
+                except OSError:
+                    pass
+        for d in dirs:
+            self._walk(d)
+
+    def list_all_files(self):
+        '''List all files in the unpacked package'''
+        if self.pkg_files is None:
+            self.pkg_files = []
+            self.symlinks = dict()
+            if self.unpack_dir is not None:
+                self._walk(self.unpack_dir)
+        return self.pkg_files
+
+    def list_all_symlinks(self):
+        '''Return a dict of the symlinks in the file list of the unpacked
+           package and their target'''
+        self.list_all_files()
+        return self.symlinks
+
+    def get_statinfo(self, fn):
+        '''Return os.stat() of fn or None if it can't be stat()d'''
+        if fn not in self.statinfo:
+            try:
+                self.statinfo[fn] = os.stat(fn)
+            except Exception:
+                self.statinfo[fn] = None
+        return self.statinfo[fn]
+
+    def get_mime_type(self, fn):
+        '''Return the libmagic mime type of fn'''
+        if fn not in self.mime_types:
+            if self.mime is None:
+                self.mime = magic.open(magic.MAGIC_MIME)
+                self.mime.load()
+            # libmagic doesn't detect the same types from the start of a
+            # file as from the file itself (eg, for PIE executables)
+            materialize(fn)
+            self.mime_types[fn] = self.mime.file(fn)
+        return self.mime_types[fn]
+
+    def may_be_compiled_binary(self, fn):
+        '''Return whether the start of fn is that of a compiled binary. Only
+           these need to be checked with libmagic.'''
+        head = lazy_read_head(fn, 4)
+        if head is None:
+            try:
+                with open(fn, 'rb') as f:
+                    head = f.read(4)
+            except (IOError, OSError):
+                # let libmagic decide
+                return True
+        return head.startswith(BINARY_MAGICS)
+
+    def _find_compiled_binaries(self):
+        '''Find the compiled binaries in the package'''
+        bins = []
+        for i in self.list_all_files():
+            # message catalogs are never compiled binaries
+            if i.endswith('.mo') or not self.may_be_compiled_binary(i):
+                continue
+
+            try:
+                res = self.get_mime_type(i)
+            except Exception:  # pragma: nocover
+                # workaround for zesty python3-magic
+                debug("could not detemine mime type of '%s'" % i)
+                continue
+
+            if res in Review.magic_binary_file_descriptions:
+                bins.append(i)
+        return bins
+
+    def list_compiled_binaries(self):
+        '''Return the compiled binaries in the package, found once for all
+           its reviews'''
+        return self.get_shared('compiled_binaries',
+                               self._find_compiled_binaries)
+
+    def get_digest(self, fn, algo='sha512'):
+        '''Return the hex digest of fn or None if it can't be read. Each
+           file is only hashed once per algorithm.'''
+        if algo != BASELINE_DIGEST:
+            self._use_baseline_for([fn])
+        if (fn, algo) not in self.digests:
+            self.digests[(fn, algo)] = get_file_digest(fn, algo)
+        return self.digests[(fn, algo)]
+
+    def get_digests(self, fns, algo='sha512'):
+        '''Return a dict of the hex digests of fns. The files not already
+           hashed are hashed in parallel (hashlib releases the GIL).'''
+        if algo != BASELINE_DIGEST:
+            self._use_baseline_for(fns)
+        todo = [fn for fn in set(fns) if (fn, algo) not in self.digests]
+        if len(todo) > 1:
+            with concurrent.futures.ThreadPoolExecutor() as executor:
+                digests = executor.map(lambda fn: get_file_digest(fn, algo),
+                                       todo)
+                for (fn, digest) in zip(todo, digests):
+                    self.digests[(fn, algo)] = digest
+        return dict((fn, self.get_digest(fn, algo)) for fn in fns)
+
+    def find_in_file(self, fn, needles):
+        '''Return the first of needles (bytes) found in fn or None, like
+           find_in_file(). Each file is only searched once for needles.'''
+        key = (fn, tuple(needles))
+        if key not in self.found:
+            self.found[key] = find_in_file(fn, needles)
+        return self.found[key]
+
+    def scan_file(self, fn, scanner):
+        '''Return the set of strings of the ContentScanner found in fn, like
+           scanner.scan(). Each file is only scanned once for the same
+           strings.'''
+        self._use_baseline_for([fn])
+        key = (fn, tuple(scanner.strings))
+        if key not in self.scans:
+            self.scans[key] = scanner.scan(fn)
+        if self.scans[key] is None:
+            return None
+        return set(self.scans[key])
+
+    def get_file_index(self):
+        '''Return the index of the regular files of the package, suitable
+           for json: for each path relative to unpack_dir, its mode, size,
+           digests, libmagic mime type, find_in_file() and scan_file()
+           results, the latter as far as they were already determined. The
+           BASELINE_DIGEST of every file is determined.'''
+        fns = [fn for fn in self.list_all_files()
+               if fn not in self.symlinks]
+        sums = self.get_digests(fns, BASELINE_DIGEST)
+
+        files = dict()
+        for fn in fns:
+            st = self.get_statinfo(fn)
+            if st is None or not stat.S_ISREG(st.st_mode) or \
+                    sums[fn] is None:
+                continue
+            files[fn] = {'mode': st.st_mode,
+                         'size': st.st_size,
+                         'digests': dict()}
+            if fn in self.mime_types:
+                files[fn]['mime'] = self.mime_types[fn]
+        for ((fn, algo), digest) in self.digests.items():
+            if fn in files and digest is not None:
+                files[fn]['digests'][algo] = digest
+        for ((fn, needles), res) in self.found.items():
+            if fn in files:
+                files[fn].setdefault('found', []).append(
+                    [[x.hex() for x in needles],
+                     None if res is None else res.hex()])
+        for ((fn, strings), res) in self.scans.items():
+            if fn in files:
+                files[fn].setdefault('scans', []).append(
+                    [[x.hex() for x in strings],
+                     None if res is None else sorted(res)])
+
+        return {'version': FILE_INDEX_VERSION,
+                'files': dict((os.path.relpath(fn, self.unpack_dir),
+                               files[fn]) for fn in files)}
+
+    def use_baseline(self, index):
+        '''Reuse what is in the file index of a previous revision of the
+           package (see get_file_index()) for its files which didn't
+           change. A file is unchanged if its path, mode, size and
+           BASELINE_DIGEST are the same. The digest is only determined when
+           a result costing more is needed (another digest or a content
+           scan) and the mode and size match. The libmagic types and
+           find_in_file() results, which cost less, are only reused for the
+           files found unchanged that way.'''
+        self.baseline = dict()
+        if not isinstance(index, dict) or \
+                index.get('version') != FILE_INDEX_VERSION:
+            debug("ignoring baseline with unsupported version")
+            return
+        for rel in index['files']:
+            self.baseline[os.path.join(self.unpack_dir, rel)] = \
+                index['files'][rel]
+
+    def _use_baseline_for(self, fns):
+        '''Fill the caches with what the baseline has for those of fns
+           which didn't change'''
+        if not self.baseline:
+            return
+        self.list_all_files()
+        todo = []
+        for fn in fns:
+            # each file is only compared once
+            entry = self.baseline.pop(fn, None)
+            if entry is None or fn in self.symlinks:
+                continue
+            st = self.get_statinfo(fn)
+            if st is None or not stat.S_ISREG(st.st_mode) or \
+                    entry['mode'] != st.st_mode or \
+                    entry['size'] != st.st_size:
+                continue
+            todo.append((fn, entry))
+        if not todo:
+            return
+
+        sums = self.get_digests([fn for (fn, entry) in todo], BASELINE_DIGEST)
+        for (fn, entry) in todo:
+            if sums[fn] is None or \
+                    sums[fn] != entry['digests'].get(BASELINE_DIGEST):
+                continue
+            for algo in entry['digests']:
+                self.digests.setdefault((fn, algo), entry['digests'][algo])
+            if 'mime' in entry:
+                self.mime_types.setdefault(fn, entry['mime'])
+            for (needles, res) in entry.get('found', []):
+                if res is not None:
+                    res = bytes.fromhex(res)
+                self.found.setdefault(
+                    (fn, tuple([bytes.fromhex(x) for x in needles])), res)
+            for (strings, res) in entry.get('scans', []):
+                if res is not None:
+                    res = set(res)
+                self.scans.setdefault(
+                    (fn, tuple([bytes.fromhex(x) for x in strings])), res)
+
+    def get_parsed(self, name, parser):
+        '''Return a copy of the parsed metadata file 'name'. parser() is
+           only called the first time 'name' is requested. A copy is returned
+           since the review classes are free to modify what they get.
+        '''
+        if name not in self.parsed:
+            self.parsed[name] = parser()
+        return copy.deepcopy(self.parsed[name])
+
+    def get_shared(self, name, builder):
+        '''Return the object 'name', calling builder() to create it the
+           first time. Unlike get_parsed(), no copy is made (these can be
+           large) so callers must not modify what they get.
+        '''
+        if name not in self.shared:
+            self.shared[name] = builder()
+        return self.shared[name]
+
+
+class LazyUnpack(object):
+    '''A squashfs image unpacked to a directory without the contents of its
+       files. Directories and symlinks are created as usual but regular
+       files are created sparse (with their size, mode and mtime) and only
+       filled in when materialize() is called for them, so checks that only
+       need names, modes and sizes never cause anything to be extracted.
+
+       Everything that reads the contents of files of the unpacked package
+       must call materialize() (see open_file_read()).
+    '''
+    def __init__(self, pkg, unpack_dir):
+        self.image = SquashfsImage(pkg)
+        self.unpack_dir = unpack_dir
+        self.real_unpack_dir = os.path.realpath(unpack_dir)
+        # the inodes of the files not extracted yet, keyed by real path
+        self.pending = dict()
+        self.lock = threading.Lock()
+
+        dirs = [(unpack_dir, self.image.root)]
+        for (rel, inode) in self.image.walk():
+            path = self._get_path(rel)
+            if inode.is_file():
+                # never write through anything already there
+                flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_NOFOLLOW
+                fd = os.open(path, flags, 0o600)
+                with os.fdopen(fd, 'wb') as f:
+                    f.truncate(inode.size)
+                    os.fchmod(fd, inode.mode)
+                    os.utime(fd, (inode.mtime, inode.mtime))
+                self.pending[path] = inode
+            else:
+                self.image.extract(inode, path)
+                if inode.is_dir():
+                    dirs.append((path, inode))
+
+        # set the directories as in the image once they are populated
+        for (path, inode) in reversed(dirs):
+            os.chmod(path, inode.mode)
+            os.utime(path, (inode.mtime, inode.mtime))
+
+    def _is_inside(self, real):
+        '''Check that the real path is in the unpack dir'''
+        return real.startswith(self.real_unpack_dir + os.sep)
+
+    def _get_path(self, rel):
+        '''Return the real path of the entry rel of the image in the unpack
+           dir. Raises SquashfsError if it would be anywhere else.'''
+        for name in rel.split('/'):
+            if name in ['', '.', '..'] or '\0' in name:
+                raise SquashfsError("invalid path '%s'" % rel)
+        path = os.path.join(self.real_unpack_dir, rel)
+        # the parents must be the directories created from the image, not
+        # symlinks
+        parent = os.path.dirname(path)
+        if not self._is_inside(path) or os.path.realpath(parent) != parent:
+            raise SquashfsError("'%s' is outside of the unpack dir" % rel)
+        return path
+
+    def close(self):
+        self.image.close()
+
+    def materialize(self, path):
+        '''Extract the contents of path (following symlinks inside the
+           unpack dir) if they haven't been yet'''
+        if not self.pending:
+            return
+        real = os.path.realpath(path)
+        if not self._is_inside(real):
+            return
+        with self.lock:
+            inode = self.pending.pop(real, None)
+            if inode is None:
+                return
+            os.chmod(real, inode.mode | stat.S_IWUSR)
+            fd = os.open(real, os.O_WRONLY | os.O_NOFOLLOW)
+            with self.image.open(inode) as src, os.fdopen(fd, 'wb') as f:
+                shutil.copyfileobj(src, f, self.image.block_size)
+                f.flush()
+                os.fchmod(fd, inode.mode)
+                os.utime(fd, (inode.mtime, inode.mtime))
+
+    def read_head(self, path, size):
+        '''Return the first size bytes of path if it wasn't extracted yet,
+           otherwise None'''
+        inode = self.pending.get(os.path.realpath(path))
+        if inode is None:
+            return None
+        with self.image.open(inode) as f:
+            return f.read(size)
+
+
+def materialize(path):
+    '''Make sure the contents of path were extracted if the package was
+       unpacked lazily'''
+    for lazy in list(LAZY_UNPACKS.values()):
+        lazy.materialize(path)
+
+
+def lazy_read_head(path, size):
+    '''Return the first size bytes of path from the package if it was
+       unpacked lazily and path wasn't extracted yet, otherwise None'''
+    for lazy in list(LAZY_UNPACKS.values()):
+        head = lazy.read_head(path, size)
+        if head is not None:
+            return head
+    return None
+
+
 class Review(object):
     '''Common review class'''
     magic_binary_file_descriptions = [
@@ -91,8 +688,19 @@ class Review(object):
         'application/x-sharedlib; charset=binary',
         'application/x-object; charset=binary',
     ]
-
-    def __init__(self, fn, review_type, overrides=None):
+    # The prefix of the names of the results of the checks, set by the
+    # review classes
+    review_type = None
+    # The REVIEW_RESOURCES the checks of the review class need, so that
+    # click-review only prepares those of the review classes it runs
+    needs = []
+    # The names (without the review_type) of all the results of the check
+    # methods which aren't worth running when CHECK_FILTER selects none of
+    # them, eg {'check_foo': ['foo_valid']}. The other check methods are
+    # always run (only their results are filtered).
+    check_names = dict()
+
+    def __init__(self, fn, review_type, overrides=None, context=None):
         self.pkg_filename = fn
         self._check_package_exists()
 
@@ -108,22 +716,20 @@ class Review(object):
 
         self.click_report_output = "json"
 
-        global UNPACK_DIR
-        if UNPACK_DIR is None:
-            UNPACK_DIR = unpack_pkg(fn)
-        self.unpack_dir = UNPACK_DIR
-
-        global RAW_UNPACK_DIR
-        if RAW_UNPACK_DIR is None:
-            RAW_UNPACK_DIR = raw_unpack_pkg(fn)
-        self.raw_unpack_dir = RAW_UNPACK_DIR
+        # When run via click-review, the context is shared by all the
+        # reviews of the package. Otherwise, create one just for us.
+        if context is None:
+            context = PackageContext(fn)
+        self.context = context
+        self.unpack_dir = self.context.unpack_dir
+        self.raw_unpack_dir = self.context.raw_unpack_dir
 
         self.is_click = False
         self.is_snap1 = False
         self.is_snap2 = False
         self.pkgfmt = {"type": "", "version": ""}
 
-        (self.pkgfmt["type"], pkgver) = detect_package(fn, self.unpack_dir)
+        (self.pkgfmt["type"], pkgver) = self.context.detect_package()
 
         if self._pkgfmt_type() == "snap":
             if pkgver < 2:
@@ -143,8 +749,6 @@ class Review(object):
         self._list_all_files()
 
         # Setup what is needed to get a list of all unpacked compiled binaries
-        self.mime = magic.open(magic.MAGIC_MIME)
-        self.mime.load()
         self.pkg_bin_files = []
         # Don't run this here since only cr_lint.py and cr_functional.py need
         # it now
@@ -160,11 +764,7 @@ class Review(object):
 
     def _extract_statinfo(self, fn):
         '''Extract statinfo from file'''
-        try:
-            st = os.stat(fn)
-        except Exception:
-            return None
-        return st
+        return self.context.get_statinfo(fn)
 
     def _extract_file(self, rel):
         '''Extract file'''
@@ -178,10 +778,7 @@ class Review(object):
 
     def _get_sha512sum(self, fn):
         '''Get sha512sum of file'''
-        (rc, out) = cmd(['sha512sum', fn])
-        if rc != 0:
-            return None
-        return out.split()[0]
+        return self.context.get_digest(fn, 'sha512')
 
     def _pkgfmt_type(self):
         '''Return the package format type'''
@@ -202,9 +799,12 @@ class Review(object):
 
     def _list_all_files(self):
         '''List all files included in this click package.'''
-        for root, dirnames, filenames in os.walk(self.unpack_dir):
-            for f in filenames:
-                self.pkg_files.append(os.path.join(root, f))
+        self.pkg_files += self.context.list_all_files()
+
+    def _list_all_symlinks(self):
+        '''List all symlinks in the file list of this package'''
+        symlinks = self.context.list_all_symlinks()
+        return [i for i in self.pkg_files if i in symlinks]
 
     def _check_if_message_catalog(self, fn):
         '''Check if file is a message catalog (.mo file).'''
@@ -212,20 +812,44 @@ class Review(object):
             return True
         return False
 
+    def _match_files(self):
+        '''Find the VCS and iffy files in this package'''
+        matches = {'vcs': [], 'iffy': []}
+        for path in self.pkg_files:
+            rel = os.path.relpath(path, self.unpack_dir)
+            found = PACKAGE_FILE_MATCHER.match(os.path.basename(rel))
+            if 'vcs' in found and '/' not in rel:
+                matches['vcs'].append(rel)
+            if 'iffy' in found:
+                matches['iffy'].append(rel)
+        # top-level directories (eg, .git) aren't in the file list
+        entries = []
+        if self.unpack_dir is not None and os.path.isdir(self.unpack_dir):
+            entries = os.listdir(self.unpack_dir)
+        for rel in entries:
+            if os.path.isdir(os.path.join(self.unpack_dir, rel)) and \
+                    'vcs' in PACKAGE_FILE_MATCHER.match(rel):
+                matches['vcs'].append(rel)
+        matches['vcs'].sort()
+        return matches
+
+    def _get_matching_files(self):
+        '''Return a dict of the relative paths of the VCS files ('vcs') and
+           potentially sensitive files ('iffy') in this package. These are
+           all found in a single pass over the package and shared by all
+           its reviews.
+        '''
+        return self.context.get_shared('matching_files', self._match_files)
+
     def _list_all_compiled_binaries(self):
         '''List all compiled binaries in this click package.'''
-        for i in self.pkg_files:
-            try:
-                res = self.mime.file(i)
-            except Exception:  # pragma: nocover
-                # workaround for zesty python3-magic
-                debug("could not detemine mime type of '%s'" % i)
-                continue
-
-            if res in self.magic_binary_file_descriptions and \
-               not self._check_if_message_catalog(i) and \
-               i not in self.pkg_bin_files:
+        # shared by all the reviews of the package
+        bins = self.context.list_compiled_binaries()
+        seen = set(self.pkg_bin_files)
+        for i in bins:
+            if i not in seen:
                 self.pkg_bin_files.append(i)
+                seen.add(i)
 
     def _get_check_name(self, name, app='', extra=''):
         name = ':'.join([self.review_type, name])
@@ -266,6 +890,9 @@ class Review(object):
         if result_type not in self.result_types:
             error("Invalid result type '%s'" % result_type)
 
+        if CHECK_FILTER is not None and not CHECK_FILTER.match(review_name):
+            return
+
         prefix = ""
         if override_result_type is not None:
             if override_result_type not in self.result_types:
@@ -292,6 +919,17 @@ class Review(object):
         if link is not None:
             report[result_type][review_name]["link"] = link
 
+        if not stage:
+            self._result_added(result_type, review_name)
+
+    def _result_added(self, result_type, review_name):
+        '''Let those following the review know about a result added to the
+           report'''
+        result = self.click_report[result_type][review_name]
+        streaming.emit(result_type, review_name, result)
+        if STOP_POLICY is not None:
+            STOP_POLICY.add_result(result_type, review_name, result)
+
     def _apply_staged_results(self):
         '''Merge the staged report into the main report'''
         for result_type in self.stage_report:
@@ -304,9 +942,15 @@ class Review(object):
                 for key in self.stage_report[result_type][review_name]:
                     self.click_report[result_type][review_name][key] = \
                         self.stage_report[result_type][review_name][key]
+                self._result_added(result_type, review_name)
             # reset the staged report
             self.stage_report[result_type] = dict()
 
+    def _discard_staged_results(self):
+        '''Reset the staged report without merging it'''
+        for result_type in self.stage_report:
+            self.stage_report[result_type] = dict()
+
     def do_report(self):
         '''Print report'''
         if self.click_report_output == "console":
@@ -327,6 +971,16 @@ class Review(object):
             rc = 1
         return rc
 
+    def _check_selected(self, methodname):
+        '''Return whether CHECK_FILTER may select results of the check
+           method'''
+        if CHECK_FILTER is None or methodname not in self.check_names:
+            return True
+        for name in self.check_names[methodname]:
+            if CHECK_FILTER.match(self._get_check_name(name)):
+                return True
+        return False
+
     def do_checks(self):
         '''Run all methods that start with check_'''
         methodList = [name for name, member in
@@ -335,8 +989,14 @@ class Review(object):
         for methodname in methodList:
             if not methodname.startswith("check_"):
                 continue
+            if not self._check_selected(methodname):
+                continue
+            if STOP_POLICY is not None and STOP_POLICY.stopped_by:
+                # the remaining checks are cancelled
+                break
             func = getattr(self, methodname)
-            func()
+            profiling.run('%s.%s' % (self.__class__.__name__, methodname),
+                          func)
 
     def set_review_type(self, name):
         '''Set review name'''
@@ -392,6 +1052,7 @@ def cmd(command):
                               stderr=subprocess.STDOUT)
     except OSError as ex:
         return [127, str(ex)]
+    profiling.count_subprocess()
 
     if sys.version_info[0] >= 3:
         out = sp.communicate()[0].decode('ascii', 'ignore')
@@ -408,6 +1069,7 @@ def cmd_pipe(command1, command2):
         sp2 = subprocess.Popen(command2, stdin=sp1.stdout)
     except OSError as ex:
         return [127, str(ex)]
+    profiling.count_subprocess(2)
 
     if sys.version_info[0] >= 3:
         out = sp2.communicate()[0].decode('ascii', 'ignore')
@@ -445,14 +1107,34 @@ def _unpack_snap_squashfs(snap_pkg, dest):
                         os.path.abspath(snap_pkg)], d, dest)
 
 
+def _unpack_snap_squashfs_lazy(snap_pkg, dest):
+    '''Unpack a squashfs based snap package to dest without extracting the
+       contents of the files (see LazyUnpack)'''
+    if dest is None:
+        d = tempfile.mkdtemp(prefix='review-')
+    else:
+        d = dest
+        os.mkdir(d)
+    try:
+        LAZY_UNPACKS[d] = LazyUnpack(os.path.abspath(snap_pkg), d)
+    except (SquashfsError, OSError) as e:
+        recursive_rm(d)
+        debug("could not unpack '%s' lazily (%s), using unsquashfs" %
+              (snap_pkg, str(e)))
+        return _unpack_snap_squashfs(snap_pkg, dest)
+    return d
+
+
 def _unpack_click_deb(pkg, dest):
     d = tempfile.mkdtemp(prefix='review-')
     return _unpack_cmd(['dpkg-deb', '-R',
                         os.path.abspath(pkg), d], d, dest)
 
 
-def unpack_pkg(fn, dest=None):
-    '''Unpack package'''
+def unpack_pkg(fn, dest=None, lazy=None):
+    '''Unpack package. With lazy, the contents of the files of squashfs
+       snaps are only extracted when needed (see LazyUnpack). The default
+       is LAZY_UNPACK.'''
     if not os.path.isfile(fn):
         error("Could not find '%s'" % fn)
     pkg = fn
@@ -463,7 +1145,12 @@ def unpack_pkg(fn, dest=None):
         error("'%s' exists. Aborting." % dest)
 
     # check if its a squashfs based snap
+    if lazy is None:
+        lazy = LAZY_UNPACK
+
     if is_squashfs(pkg):
+        if lazy:
+            return _unpack_snap_squashfs_lazy(fn, dest)
         return _unpack_snap_squashfs(fn, dest)
 
     return _unpack_click_deb(fn, dest)
@@ -510,6 +1197,114 @@ def raw_unpack_pkg(fn, dest=None):
     return dest
 
 
+def get_file_digest(fn, algo='sha512'):
+    '''Return the hex digest of fn or None if it can't be read'''
+    h = hashlib.new(algo)
+    try:
+        materialize(fn)
+        with open(fn, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_BUFSIZE), b''):
+                h.update(chunk)
+    except (IOError, OSError):
+        return None
+    return h.hexdigest()
+
+
+def is_text_block(block):
+    '''Guess if block, the start of a file, is text'''
+    if not block:
+        return False
+    return not block.translate(None, TEXT_CHARS)
+
+
+class ContentScanner(object):
+    '''Search the contents of text files for any of a list of strings. All
+       the strings are matched at once with a single regex and files are read
+       in blocks, so they are only read once and never fully in memory.
+    '''
+    def __init__(self, strings):
+        encoded = sorted(set([x.encode('UTF-8') for x in strings]),
+                         key=len, reverse=True)
+        self.strings = encoded
+        # Use a lookahead so that overlapping matches are all found. Only
+        # the longest string is matched at a given position, the others
+        # starting there are prefixes of it (see scan()).
+        alternatives = b'|'.join([re.escape(x) for x in encoded])
+        self.regex = re.compile(b'(?=(%s))' % alternatives)
+        # keep the end of the previous block to find the matches that span
+        # two blocks
+        self.overlap = len(encoded[0]) - 1 if encoded else 0
+
+    def scan(self, fn):
+        '''Return the set of strings found in fn. None is returned if fn is
+           not a text file or can't be read.'''
+        found = set()
+        try:
+            materialize(fn)
+            with open(fn, 'rb') as f:
+                block = f.read(SCAN_BUFSIZE)
+                if not is_text_block(block):
+                    return None
+                tail = b''
+                while block and self.strings:
+                    buf = tail + block
+                    for m in self.regex.finditer(buf):
+                        match = m.group(1)
+                        found.update([x for x in self.strings
+                                      if match.startswith(x)])
+                    tail = buf[max(0, len(buf) - self.overlap):]
+                    block = f.read(SCAN_BUFSIZE)
+        except (IOError, OSError):
+            return None
+        return set([x.decode('UTF-8') for x in found])
+
+
+def find_in_file(fn, needles):
+    '''Return the first of needles (bytes) found in fn or None. The file is
+       searched through an mmap so it is never read into memory.'''
+    try:
+        materialize(fn)
+        with open(fn, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for needle in needles:
+                    if mm.find(needle) != -1:
+                        return needle
+    except ValueError:
+        # empty files can't be mapped
+        pass
+    except (IOError, OSError):
+        pass
+    return None
+
+
+def build_file_index(fn):
+    '''Return the file index (see PackageContext.get_file_index()) of
+       package fn, which isn't the package being reviewed, including the
+       libmagic mime type of the files which may be compiled binaries since
+       every review needs those'''
+    d = tempfile.mkdtemp(prefix='review-', dir=create_tempdir())
+    try:
+        unpack_dir = unpack_pkg(fn, os.path.join(d, 'unpack'), lazy=False)
+        context = PackageContext(fn, unpack_dir)
+        context.list_compiled_binaries()
+        return context.get_file_index()
+    finally:
+        recursive_rm(d)
+
+
+def read_file_index(fn):
+    '''Return the file index (see PackageContext.get_file_index()) in fn,
+       or None if fn isn't one (eg, it is a package)'''
+    try:
+        with open(fn, 'r') as f:
+            index = json.load(f)
+    except (IOError, OSError, UnicodeDecodeError, ValueError):
+        return None
+    if not isinstance(index, dict) or 'files' not in index:
+        return None
+    return index
+
+
 def create_tempdir():
     '''Create/reuse a temporary directory that is automatically cleaned up'''
     global TMP_DIR
@@ -521,6 +1316,7 @@ def create_tempdir():
 def open_file_read(path):
     '''Open specified file read-only'''
     try:
+        materialize(path)
         orig = codecs.open(path, 'r', "UTF-8")
     except Exception:
         raise
@@ -606,62 +1402,54 @@ def detect_package(fn, dir=None):
     return (pkgtype, pkgver)
 
 
-def find_external_symlinks(unpack_dir, pkg_files, pkgname):
+# Symlinks to the libc6 libraries are expected to point outside of the
+# package
+LIBC6_LIBS = ['ld-*.so',
+              'libanl',
+              'libBrokenLocale',
+              'libc',
+              'libcidn',
+              'libcrypt',
+              'libdl',
+              'libmemusage',
+              'libm',
+              'libmvec',
+              'libnsl',
+              'libnss_compat',
+              'libnss_dns',
+              'libnss_files',
+              'libnss_hesiod',
+              'libnss_nisplus',
+              'libnss_nis',
+              'libpcprofile',
+              'libpthread',
+              'libresolv',
+              'librt',
+              'libSegFault',
+              'libthread_db',
+              'libutil',
+              ]
+LIBC6_PATS = [r'%s(-[0-9.]+)?\.so(\.[0-9.]+)?' % lib for lib in LIBC6_LIBS]
+LIBC6_PATS += [r'ld-*.so$',
+               r'ld-linux-.*.so\.[0-9.]+$',
+               r'ld64.so\.[0-9.]+$',  # ppc64el
+               ]
+LIBC6_PAT = re.compile('|'.join(LIBC6_PATS))
+
+
+def find_external_symlinks(unpack_dir, symlinks, pkgname):
     '''Check if symlinks in the package go out to the system.'''
-    common = '(-[0-9.]+)?\.so(\.[0-9.]+)?'
-    libc6_libs = ['ld-*.so',
-                  'libanl',
-                  'libBrokenLocale',
-                  'libc',
-                  'libcidn',
-                  'libcrypt',
-                  'libdl',
-                  'libmemusage',
-                  'libm',
-                  'libmvec',
-                  'libnsl',
-                  'libnss_compat',
-                  'libnss_dns',
-                  'libnss_files',
-                  'libnss_hesiod',
-                  'libnss_nisplus',
-                  'libnss_nis',
-                  'libpcprofile',
-                  'libpthread',
-                  'libresolv',
-                  'librt',
-                  'libSegFault',
-                  'libthread_db',
-                  'libutil',
-                  ]
-    libc6_pats = []
-    for lib in libc6_libs:
-        libc6_pats.append(re.compile(r'%s%s' % (lib, common)))
-    libc6_pats.append(re.compile(r'ld-*.so$'))
-    libc6_pats.append(re.compile(r'ld-linux-.*.so\.[0-9.]+$'))
-    libc6_pats.append(re.compile(r'ld64.so\.[0-9.]+$'))  # ppc64el
-
-    def _in_patterns(pats, f):
-        for pat in pats:
-            if pat.search(f):
-                return True
-        return False
-
-    def _is_external(link, pats, pkgname):
-        rp = os.path.realpath(link)
-        if not rp.startswith(unpack_dir + "/") and \
-                not rp.startswith(os.path.join("/snap", pkgname) + "/") and \
-                not rp.startswith(
-                    os.path.join("/var/snap", pkgname) + "/") and \
-                not _in_patterns(pats, os.path.basename(link)):
-            return True
-        return False
+    allowed = (unpack_dir + "/",
+               os.path.join("/snap", pkgname) + "/",
+               os.path.join("/var/snap", pkgname) + "/")
 
-    external_symlinks = list(filter(lambda link:
-                             _is_external(link, libc6_pats, pkgname),
-                             pkg_files))
+    def _is_external(link):
+        if LIBC6_PAT.search(os.path.basename(link)):
+            return False
+        return not os.path.realpath(link).startswith(allowed)
 
-    return [os.path.relpath(i, unpack_dir) for i in external_symlinks]
+    return [os.path.relpath(i, unpack_dir) for i in symlinks
+            if _is_external(i)]
 
 
 # check_results(report, expected_counts, expected)
@@ -22,9 +22,12 @@ import os
 
 class ClickReviewBinPath(ClickReview):
     '''This class represents click lint reviews'''
-    def __init__(self, fn, overrides=None):
+    review_type = "bin-path"
+
+    def __init__(self, fn, overrides=None, context=None):
         # bin-path is ignored by snappy install so don't bother with peerhooks
-        ClickReview.__init__(self, fn, "bin-path", overrides=overrides)
+        ClickReview.__init__(self, fn, self.review_type, overrides=overrides,
+                             context=context)
 
         self.bin_paths_files = dict()
         self.bin_paths = dict()
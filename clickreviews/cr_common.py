@@ -94,8 +94,9 @@ class ClickReview(Review):
                            "security-policy"]
 
     def __init__(self, fn, review_type, peer_hooks=None, overrides=None,
-                 peer_hooks_link=None):
-        Review.__init__(self, fn, review_type, overrides=overrides)
+                 peer_hooks_link=None, context=None):
+        Review.__init__(self, fn, review_type, overrides=overrides,
+                        context=context)
 
         # The cr_* scripts only support 15.04 snaps (v1). Use sr_* scripts for
         # 16.04 (v2) or higher
@@ -119,15 +120,9 @@ class ClickReview(Review):
         self.peer_hooks_link = peer_hooks_link
 
         if self.is_snap1:
-            pkg_yaml = self._extract_package_yaml()
-            if pkg_yaml:
-                try:
-                    self.pkg_yaml = yaml.safe_load(pkg_yaml)
-                except Exception:
-                    error("Could not load package.yaml. Is it properly formatted?")
-                self._verify_package_yaml_structure()
-            else:
-                error("Could not load package.yaml.")
+            self.pkg_yaml = self.context.get_parsed('package.yaml',
+                                                    self._load_package_yaml)
+            self._verify_package_yaml_structure()
 
             #  default to 'app'
             if 'type' not in self.pkg_yaml:
@@ -150,11 +145,8 @@ class ClickReview(Review):
 
         if self.is_click or self.is_snap1:
             # Get some basic information from the control file
-            control_file = self._extract_control_file()
-            tmp = list(Deb822.iter_paragraphs(control_file))
-            if len(tmp) != 1:
-                error("malformed control file: too many paragraphs")
-            control = tmp[0]
+            control = self.context.get_parsed('control',
+                                              self._load_control_file)
             self.click_pkgname = control['Package']
             self.click_version = control['Version']
             if self.is_click:
@@ -163,15 +155,38 @@ class ClickReview(Review):
                 self.pkgfmt["version"] = str(control['Click-Version'])
 
             # Parse and store the manifest
-            manifest_json = self._extract_manifest_file()
-            try:
-                self.manifest = json.load(manifest_json)
-            except Exception:
-                error("Could not load manifest file. Is it properly formatted?")
+            self.manifest = self.context.get_parsed('manifest',
+                                                    self._load_manifest_file)
             self._verify_manifest_structure()
 
             self.valid_frameworks = self._extract_click_frameworks()
 
+    def _load_package_yaml(self):
+        '''Load the snappy 15.04 package.yaml'''
+        pkg_yaml = self._extract_package_yaml()
+        if not pkg_yaml:
+            error("Could not load package.yaml.")
+        try:
+            return yaml.safe_load(pkg_yaml)
+        except Exception:
+            error("Could not load package.yaml. Is it properly formatted?")
+
+    def _load_control_file(self):
+        '''Load the control file'''
+        control_file = self._extract_control_file()
+        tmp = list(Deb822.iter_paragraphs(control_file))
+        if len(tmp) != 1:
+            error("malformed control file: too many paragraphs")
+        return tmp[0]
+
+    def _load_manifest_file(self):
+        '''Load the manifest file'''
+        manifest_json = self._extract_manifest_file()
+        try:
+            return json.load(manifest_json)
+        except Exception:
+            error("Could not load manifest file. Is it properly formatted?")
+
     def _extract_click_frameworks(self):
         '''Extract installed click frameworks'''
         # TODO: update to use libclick API when available
@@ -405,14 +420,7 @@ class ClickReview(Review):
         if not self.aa_policy:
             return None
 
-        templates = []
-        if aa_type == "all":
-            for k in self.aa_policy[vendor][version]['templates'].keys():
-                templates += self.aa_policy[vendor][version]['templates'][k]
-        else:
-            templates = self.aa_policy[vendor][version]['templates'][aa_type]
-
-        return sorted(templates)
+        return list(self.aa_policy_index[vendor][version]['templates'][aa_type])
 
     def _has_policy_version(self, vendor, version):
         '''Determine if has specified policy version'''
@@ -442,32 +450,23 @@ class ClickReview(Review):
             return groups
 
         v = str(version)
-        if aa_type == "all":
-            for k in self.aa_policy[vendor][v]['policy_groups'].keys():
-                groups += self.aa_policy[vendor][v]['policy_groups'][k]
-        else:
-            groups = self.aa_policy[vendor][v]['policy_groups'][aa_type]
-
-        return sorted(groups)
+        return list(self.aa_policy_index[vendor][v]['policy_groups'][aa_type])
 
     def _get_policy_group_type(self, vendor, version, policy_group):
         '''Return policy group type'''
         if not self.aa_policy:
             return None
 
-        for t in self.aa_policy[vendor][version]['policy_groups']:
-            if policy_group in self.aa_policy[vendor][version]['policy_groups'][t]:
-                return t
-        return None
+        index = self.aa_policy_index[vendor][version]
+        return index['policy_group_types'].get(policy_group)
 
     def _get_template_type(self, vendor, version, template):
         '''Return template type'''
         if not self.aa_policy:
             return None
 
-        for t in self.aa_policy[vendor][version]['templates']:
-            if template in self.aa_policy[vendor][version]['templates'][t]:
-                return t
+        index = self.aa_policy_index[vendor][version]
+        return index['template_types'].get(template)
 
     def check_peer_hooks(self, hooks_sublist=[]):
         '''Check if peer hooks are valid'''
@@ -24,8 +24,11 @@ import re
 
 class ClickReviewFramework(ClickReview):
     '''This class represents click framework reviews'''
-    def __init__(self, fn, overrides=None):
-        ClickReview.__init__(self, fn, "framework", overrides=overrides)
+    review_type = "framework"
+
+    def __init__(self, fn, overrides=None, context=None):
+        ClickReview.__init__(self, fn, self.review_type, overrides=overrides,
+                             context=context)
 
         self.frameworks_file = dict()
         self.frameworks = dict()
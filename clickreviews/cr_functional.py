@@ -15,7 +15,6 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from __future__ import print_function
-import binascii
 import os
 import re
 
@@ -27,8 +26,12 @@ from clickreviews.cr_common import ClickReview, open_file_read
 
 class ClickReviewFunctional(ClickReview):
     '''This class represents click lint reviews'''
-    def __init__(self, fn, overrides=None):
-        ClickReview.__init__(self, fn, "functional", overrides=overrides)
+    review_type = "functional"
+    needs = ['binaries']
+
+    def __init__(self, fn, overrides=None, context=None):
+        ClickReview.__init__(self, fn, self.review_type, overrides=overrides,
+                             context=context)
         if not self.is_click and not self.is_snap1:
             return
 
@@ -65,10 +68,7 @@ class ClickReviewFunctional(ClickReview):
         # LP: #1256841 - QML apps with C++ using QSettings shouldn't
         # typically set applicationName in the QML
         for i in self.pkg_bin_files:
-            f = open(i, 'rb')
-            data = str(binascii.b2a_qp(f.read()))
-            f.close()
-            if 'QSettings' in data:
+            if self.context.find_in_file(i, [b'QSettings']):
                 s = "OK (binary uses QSettings)"
                 self._add_result(t, n, s)
                 return
@@ -28,8 +28,8 @@ from clickreviews.cr_common import (
 )
 from clickreviews.common import (
     open_file_read,
-    cmd,
     error,
+    ContentScanner,
 )
 from clickreviews.common import (
     find_external_symlinks,
@@ -41,17 +41,33 @@ MINIMUM_CLICK_FRAMEWORK_VERSION = "0.4"
 
 class ClickReviewLint(ClickReview):
     '''This class represents click lint reviews'''
-
-    def __init__(self, fn, overrides=None):
+    review_type = "lint"
+    needs = ['raw_unpack', 'binaries']
+    check_names = {
+        'check_md5sums': ['md5sums'],
+        'check_contents_for_hardcoded_paths': ['hardcoded_paths'],
+        'check_snappy_hashes': ['hashes_archive-sha512_present',
+                                'hashes_archive-sha512_valid',
+                                'hashes_files_present',
+                                'sha512sums',
+                                'file_mode',
+                                'hashes_extra_files'],
+    }
+
+    def __init__(self, fn, overrides=None, context=None):
         '''Set up the class.'''
-        ClickReview.__init__(self, fn, "lint", overrides=overrides)
+        ClickReview.__init__(self, fn, self.review_type, overrides=overrides,
+                             context=context)
         if not self.is_click and not self.is_snap1:
             return
 
-        if self.is_click and "md5sums" not in CONTROL_FILE_NAMES:
-            CONTROL_FILE_NAMES.append("md5sums")
+        # don't modify CONTROL_FILE_NAMES so that it is the same for every
+        # package reviewed by the process (eg, click-review --batch)
+        self.control_file_names = list(CONTROL_FILE_NAMES)
+        if self.is_click:
+            self.control_file_names.append("md5sums")
         elif self.is_snap1:
-            CONTROL_FILE_NAMES.append("hashes.yaml")
+            self.control_file_names.append("hashes.yaml")
         self.control_files = dict()
         self._list_control_files()
         # Valid values for Architecture in DEBIAN/control. Note:
@@ -71,17 +87,6 @@ class ClickReviewLint(ClickReview):
         self.valid_control_architectures = ['all',
                                             'multi',
                                             ] + self.valid_compiled_architectures
-        self.vcs_files = ['.bzr*',
-                          # '.excludes',  # autogenerated by SDK
-                          '.git*',
-                          '.idea',
-                          '.svn*',
-                          '.hg',
-                          '.project',
-                          'CVS*',
-                          'RCS*'
-                          ]
-
         if self.manifest is not None and 'maintainer' in self.manifest:
             maintainer = self.manifest['maintainer']
             self.email = maintainer.partition('<')[2].rstrip('>')
@@ -154,7 +159,7 @@ class ClickReviewLint(ClickReview):
 
     def _list_control_files(self):
         '''List all control files with their full path.'''
-        for i in CONTROL_FILE_NAMES:
+        for i in self.control_file_names:
             self.control_files[i] = os.path.join(self.unpack_dir,
                                                  "DEBIAN/%s" % i)
 
@@ -360,18 +365,24 @@ class ClickReviewLint(ClickReview):
                     self._add_result(t, n, s)
                     return
 
-        curdir = os.getcwd()
         fh = open_file_read(self.control_files["md5sums"])
-        badsums = []
-        os.chdir(self.unpack_dir)
-        for line in fh.readlines():
+        lines = fh.readlines()
+        fh.close()
+
+        entries = []
+        for line in lines:
             split_line = line.strip().split()
-            fn = " ".join(split_line[1:])
-            (rc, out) = cmd(['md5sum', fn])
+            entries.append((line, " ".join(split_line[1:])))
+        sums = self.context.get_digests(
+            [os.path.join(self.unpack_dir, fn) for (line, fn) in entries],
+            'md5')
+
+        badsums = []
+        for (line, fn) in entries:
+            # the line must be exactly what 'md5sum <fn>' would output
+            out = "%s  %s\n" % (sums[os.path.join(self.unpack_dir, fn)], fn)
             if line != out:
                 badsums.append(fn)
-        fh.close()
-        os.chdir(curdir)
 
         s = 'OK'
         if len(badsums) > 0:
@@ -577,7 +588,8 @@ exit 1
                     self._add_result(t, n, s)
                     return
 
-        links = find_external_symlinks(self.unpack_dir, self.pkg_files,
+        links = find_external_symlinks(self.unpack_dir,
+                                       self._list_all_symlinks(),
                                        self.click_pkgname)
         if len(links) > 0:
             t = 'error'
@@ -848,12 +860,7 @@ exit 1
         t = 'info'
         n = self._get_check_name('vcs_files')
         s = 'OK'
-        found = []
-        for d in self.vcs_files:
-            entries = glob.glob("%s/%s" % (self.unpack_dir, d))
-            if len(entries) > 0:
-                for i in entries:
-                    found.append(os.path.relpath(i, self.unpack_dir))
+        found = self._get_matching_files()['vcs']
         if len(found) > 0:
             t = 'warn'
             s = 'found VCS files in package: %s' % ", ".join(found)
@@ -901,23 +908,20 @@ exit 1
         t = 'info'
         n = self._get_check_name('hardcoded_paths')
         s = 'OK'
-        for dirpath, dirnames, filenames in os.walk(self.unpack_dir):
-            for filename in filenames:
-                full_fn = os.path.join(dirpath, filename)
-                (rc, out) = cmd(['file', '-b', full_fn])
-                if 'text' not in out:
-                    continue
-                try:
-                    lines = open_file_read(full_fn).readlines()
-                    for bad_path in PATH_BLACKLIST:
-                        if list(filter(lambda line: bad_path in line, lines)):
-                            t = 'error'
-                            s = "Hardcoded path '%s' found in '%s'." % (
-                                bad_path, full_fn)
-                except FileNotFoundError:
-                    pass
-                except UnicodeDecodeError:
-                    pass
+        scanner = ContentScanner(PATH_BLACKLIST)
+        found = []
+        for full_fn in sorted(self.pkg_files):
+            if os.path.islink(full_fn):
+                continue
+            bad_paths = self.context.scan_file(full_fn, scanner)
+            if not bad_paths:
+                continue
+            for bad_path in sorted(bad_paths):
+                found.append("Hardcoded path '%s' found in '%s'." % (
+                    bad_path, os.path.relpath(full_fn, self.unpack_dir)))
+        if found:
+            t = 'error'
+            s = " ".join(found)
         self._add_result(t, n, s)
 
     def _verify_architecture(self, my_dict, test_str):
@@ -1248,6 +1252,7 @@ exit 1
         # verify the individual files
         errors = []
         badsums = []
+        to_hash = []
         hash_files = set([])  # used to check with extra files
         for entry in hashes_yaml['files']:
             if 'name' not in entry:
@@ -1325,6 +1330,11 @@ exit 1
 
             # ok, now all the cheap tests are done so we can check if we have a
             # valid sha512sum
+            to_hash.append((entry, fn))
+
+        # hash all the files at once so it can be done in parallel
+        self.context.get_digests([fn for (entry, fn) in to_hash], 'sha512')
+        for (entry, fn) in to_hash:
             sum = self._get_sha512sum(fn)
             if entry['sha512'] != sum:
                 badsums.append("'%s' != '%s' for '%s'" % (entry['sha512'], sum,
@@ -26,7 +26,9 @@ import lxml.etree as etree
 
 class ClickReviewAccounts(ClickReview):
     '''This class represents click lint reviews'''
-    def __init__(self, fn, overrides=None):
+    review_type = "online_accounts"
+
+    def __init__(self, fn, overrides=None, context=None):
         peer_hooks = dict()
         peer_hooks['account-application'] = dict()
         peer_hooks['account-application']['allowed'] = \
@@ -65,10 +67,11 @@ class ClickReviewAccounts(ClickReview):
 
         ClickReview.__init__(self,
                              fn,
-                             "online_accounts",
+                             self.review_type,
                              peer_hooks=peer_hooks,
                              overrides=overrides,
-                             peer_hooks_link="https://wiki.ubuntu.com/SecurityTeam/Specifications/OnlineAccountsConfinement")
+                             peer_hooks_link="https://wiki.ubuntu.com/SecurityTeam/Specifications/OnlineAccountsConfinement",
+                             context=context)
         if not self.is_click and not self.is_snap1:
             return
 
@@ -23,15 +23,17 @@ import os
 
 class ClickReviewPushHelper(ClickReview):
     '''This class represents click lint reviews'''
-    def __init__(self, fn, overrides=None):
+    review_type = "push_helper"
+
+    def __init__(self, fn, overrides=None, context=None):
         peer_hooks = dict()
         my_hook = 'push-helper'
         peer_hooks[my_hook] = dict()
         peer_hooks[my_hook]['allowed'] = ['apparmor']
         peer_hooks[my_hook]['required'] = ['apparmor']
 
-        ClickReview.__init__(self, fn, "push_helper", peer_hooks=peer_hooks,
-                             overrides=overrides)
+        ClickReview.__init__(self, fn, self.review_type, peer_hooks=peer_hooks,
+                             overrides=overrides, context=context)
 
         if not self.is_click and not self.is_snap1:
             return
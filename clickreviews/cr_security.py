@@ -30,7 +30,10 @@ import os
 
 class ClickReviewSecurity(ClickReview):
     '''This class represents click lint reviews'''
-    def __init__(self, fn, overrides=None):
+    review_type = "security"
+    needs = ['network_data']
+
+    def __init__(self, fn, overrides=None, context=None):
         peer_hooks = dict()
         my_hook = 'apparmor'
         peer_hooks[my_hook] = dict()
@@ -48,8 +51,8 @@ class ClickReviewSecurity(ClickReview):
             ClickReview.service_allowed_peer_hooks
         peer_hooks[my_hook2]['required'] = []
 
-        ClickReview.__init__(self, fn, "security", peer_hooks=peer_hooks,
-                             overrides=overrides)
+        ClickReview.__init__(self, fn, self.review_type, peer_hooks=peer_hooks,
+                             overrides=overrides, context=context)
 
         if not self.is_click and not self.is_snap1:
             return
@@ -62,8 +65,12 @@ class ClickReviewSecurity(ClickReview):
                                  '../data/apparmor-easyprof-ubuntu.json')
         if os.path.exists(branch_fn):
             local_copy = branch_fn
-        p = apparmor_policy.ApparmorPolicy(local_copy)
-        self.aa_policy = p.policy
+        p = apparmor_policy.ApparmorPolicy(local_copy, shared=True)
+        # framework overrides only add vendors and versions to the policy,
+        # so the shared policy is copied down to the versions
+        self.aa_policy = dict((vendor, dict(p.policy[vendor]))
+                              for vendor in p.policy)
+        self.aa_policy_index = p.index
 
         self.all_fields = ['abstractions',
                            'author',
@@ -21,7 +21,9 @@ from clickreviews.cr_common import ClickReview
 
 class ClickReviewSkeleton(ClickReview):
     '''This class represents click lint reviews'''
-    def __init__(self, fn, overrides=None):
+    review_type = "skeleton"
+
+    def __init__(self, fn, overrides=None, context=None):
         # Many test classes are for verify click hooks. 'peer_hooks' is used
         # to declare what hooks may be use with my_hook. When using this
         # mechanism, ClickReview.check_peer_hooks() is run for you.
@@ -31,8 +33,8 @@ class ClickReviewSkeleton(ClickReview):
         peer_hooks[my_hook]['allowed'] = ["desktop", "apparmor", "urls"]
         peer_hooks[my_hook]['required'] = ["desktop", "apparmor"]
 
-        ClickReview.__init__(self, fn, "skeleton", peer_hooks=peer_hooks,
-                             overrides=overrides)
+        ClickReview.__init__(self, fn, self.review_type, peer_hooks=peer_hooks,
+                             overrides=overrides, context=context)
 
         if not self.is_click and not self.is_snap1:
             return
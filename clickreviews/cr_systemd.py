@@ -23,9 +23,12 @@ import re
 
 class ClickReviewSystemd(ClickReview):
     '''This class represents click lint reviews'''
-    def __init__(self, fn, overrides=None):
+    review_type = "snappy-systemd"
+
+    def __init__(self, fn, overrides=None, context=None):
         # systemd isn't implemented as a hook any more so don't setup peerhooks
-        ClickReview.__init__(self, fn, "snappy-systemd", overrides=overrides)
+        ClickReview.__init__(self, fn, self.review_type, overrides=overrides,
+                             context=context)
 
         self.systemd_files = dict()  # click-show-files and tests
         self.systemd = dict()
@@ -1,13 +1,19 @@
 import clickreviews
+from clickreviews import profiling
 import imp
 import inspect
 import os
 import pkgutil
+import traceback
 
 IRRELEVANT_MODULES = ['cr_common', 'cr_tests', 'cr_skeleton',
                       'sr_common', 'sr_tests', 'sr_skeleton',
                       'common']
 
+# Main classes already found by find_main_class(), so that long running
+# processes (eg, click-review --batch) only load each module once.
+MAIN_CLASSES = dict()
+
 
 def narrow_down_modules(modules):
     '''
@@ -46,6 +52,9 @@ def find_main_class(module_name):
     This function will find the Click*Review class in
     the specified module.
     '''
+    if module_name in MAIN_CLASSES:
+        return MAIN_CLASSES[module_name]
+
     module = imp.load_source(module_name,
                              '%s/%s.py' % (clickreviews.__path__[0],
                                            module_name))
@@ -58,24 +67,125 @@ def find_main_class(module_name):
             a[1].__module__ == module_name
     test_class = list(filter(find_test_class, classes))
     if not test_class:
-        return None
-    init_object = getattr(module, test_class[0][0])
+        init_object = None
+    else:
+        init_object = getattr(module, test_class[0][0])
+    MAIN_CLASSES[module_name] = init_object
     return init_object
 
 
-def init_main_class(module_name, click_file, overrides=None):
+def init_main_class(module_name, click_file, overrides=None, context=None):
     '''
     This function will instantiate the main Click*Review
     class of a given module and instantiate it with the
-    location of the .click file we want to inspect.
+    location of the .click file we want to inspect. If
+    given, context is the common.PackageContext shared by
+    all the modules reviewing this .click file.
     '''
 
     init_object = find_main_class(module_name)
     if not init_object:
         return None
     try:
-        ob = init_object(click_file, overrides)
+        ob = profiling.run('%s.__init__' % init_object.__name__,
+                           init_object, click_file, overrides,
+                           context=context)
     except TypeError as e:
         print('Could not init %s: %s' % (init_object, str(e)))
         raise
     return ob
+
+
+def select_modules(module_names, check_filter=None):
+    '''
+    Return those of the given modules whose review class may
+    report results selected by check_filter (a
+    common.CheckFilter), in the same order. The others don't
+    need to run at all.
+    '''
+    if check_filter is None:
+        return list(module_names)
+    selected = []
+    for module_name in module_names:
+        review = find_main_class(module_name)
+        if review and review.review_type is not None and \
+                not check_filter.may_match(review.review_type):
+            continue
+        selected.append(module_name)
+    return selected
+
+
+def get_needs(module_name):
+    '''
+    Return the common.REVIEW_RESOURCES the review class of
+    the given module needs.
+    '''
+    review = find_main_class(module_name)
+    if not review:
+        return []
+    return list(review.needs)
+
+
+def get_job_order(module_names):
+    '''
+    Return the given modules in the order to start them in
+    when running them in parallel: those needing the most
+    resources, usually the slowest, first.
+    '''
+    return sorted(module_names, key=lambda m: -len(get_needs(m)))
+
+
+def get_section(module_name):
+    '''
+    Return the name of the section of the click-review
+    report holding the results of the given module.
+    '''
+    section = module_name.replace('cr_', 'click,snap.v1_')
+    return section.replace('sr_', 'snap.v2_')
+
+
+def run_module_checks(module_name, click_file, overrides=None, context=None):
+    '''
+    Run all the checks of the given module. Returns a
+    (module_name, report, traceback) tuple where report
+    is None if the module has no review class and
+    traceback is set if the module raised an exception.
+    '''
+    try:
+        review = init_main_class(module_name, click_file,
+                                 overrides=overrides, context=context)
+        if review:
+            review.do_checks()
+            return (module_name, review.click_report, None)
+    except Exception:
+        return (module_name, None, traceback.format_exc())
+    return (module_name, None, None)
+
+
+def summarise_results(results):
+    '''
+    Return the errors, warnings and info of the reports of
+    all the modules (results, keyed by section) in a dict
+    with the same keys as the reports, each keyed by check
+    name.
+    '''
+    summary = {'error': {}, 'warn': {}, 'info': {}}
+    for section in results:
+        for result_type in summary:
+            summary[result_type].update(results[section][result_type])
+    return summary
+
+
+def get_rc(errors, warnings, rc=0):
+    '''
+    Return the return code of a review with errors and
+    warnings: rc when it is 1 (a runtime error), otherwise
+    2 with errors, 3 with warnings and rc with neither.
+    '''
+    if rc == 1:
+        return rc
+    if errors:
+        return 2
+    if warnings:
+        return 3
+    return rc
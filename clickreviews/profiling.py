@@ -0,0 +1,94 @@
+'''profiling.py: measure the resources used by the reviews'''
+#
+# Copyright (C) 2018 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import resource
+import time
+
+# The Profiler measuring the reviews, None when not profiling
+PROFILER = None
+
+
+class Profiler(object):
+    '''Record the wall time, CPU time, number of subprocesses and peak RSS
+       growth of each review class constructor and check method run.
+    '''
+    def __init__(self):
+        self.entries = dict()
+        self.subprocesses = 0
+
+    def count_subprocess(self, count=1):
+        '''Record that count subprocesses were started'''
+        self.subprocesses += count
+
+    def run(self, name, func, *args, **kwargs):
+        '''Call func(*args, **kwargs), recording what it used as 'name' '''
+        subprocesses = self.subprocesses
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu = time.process_time()
+        wall = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = time.process_time() - cpu
+            after = resource.getrusage(resource.RUSAGE_CHILDREN)
+            # only waited for children are accounted for, which cmd() does
+            children_cpu = (after.ru_utime - children.ru_utime) + \
+                (after.ru_stime - children.ru_stime)
+            # ru_maxrss is in kilobytes on Linux
+            maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - \
+                maxrss
+            self._add(name, {'wall': wall,
+                             'cpu': cpu,
+                             'children_cpu': children_cpu,
+                             'subprocesses': self.subprocesses - subprocesses,
+                             'maxrss_delta_kb': maxrss})
+
+    def _add(self, name, entry):
+        '''Add entry to what was recorded for name, so that a method called
+           more than once is reported once'''
+        if name not in self.entries:
+            self.entries[name] = dict(entry, calls=1)
+            return
+        prev = self.entries[name]
+        for k in entry:
+            prev[k] += entry[k]
+        prev['calls'] += 1
+
+    def report(self):
+        '''Return what was recorded, suitable for json'''
+        report = dict()
+        for name in self.entries:
+            entry = self.entries[name]
+            report[name] = dict(entry)
+            for k in ['wall', 'cpu', 'children_cpu']:
+                report[name][k] = round(entry[k], 6)
+        return report
+
+
+def run(name, func, *args, **kwargs):
+    '''Call func(*args, **kwargs), recording what it used as 'name' if
+       profiling'''
+    if PROFILER is None:
+        return func(*args, **kwargs)
+    return PROFILER.run(name, func, *args, **kwargs)
+
+
+def count_subprocess(count=1):
+    '''Record that count subprocesses were started if profiling'''
+    if PROFILER is not None:
+        PROFILER.count_subprocess(count)
@@ -13,19 +13,36 @@
 #  You should have received a copy of the GNU General Public License
 #  along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import copy
+import hashlib
 import json
 import os
 import re
 from socket import timeout
 import sys
+import tempfile
 import time
 from urllib import request, parse
 from urllib.error import HTTPError, URLError
 import yaml
+try:
+    # libyaml is much faster
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:  # pragma: nocover
+    from yaml import SafeLoader as YamlLoader
 
 DATA_DIR = os.path.join(os.path.expanduser('~/.cache/click-reviewers-tools/'))
 UPDATE_INTERVAL = 60 * 60 * 24 * 7
 
+# The parsed yaml files are also saved as json, keyed by the sha256 of the
+# yaml, since loading json is many times faster than parsing yaml
+COMPILED_DIR = os.path.join(DATA_DIR, 'compiled')
+
+# Parsed files, keyed by filename, so that long running processes (eg,
+# click-review --batch) only parse them once. An entry is reparsed when
+# the mtime or size of its file changes.
+CR_FILE_CACHE = dict()
+
 
 def _update_is_necessary(fn):
     return (not os.path.exists(fn)) or \
@@ -88,30 +105,86 @@ def get_remote_file(fn, url, data_dir=DATA_DIR):
         local_file.write(data)
 
 
-def read_cr_file(fn, url, local_copy_fn=None, as_yaml=False):
+def _save_compiled(fn, d):
+    '''Save d as json in fn if json can represent it'''
+    try:
+        if json.loads(json.dumps(d)) != d:
+            return
+        if not os.path.isdir(COMPILED_DIR):
+            os.makedirs(COMPILED_DIR)
+        # write atomically since other processes may be reading it
+        (fd, tmp) = tempfile.mkstemp(dir=COMPILED_DIR)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(d, f)
+            os.rename(tmp, fn)
+        except (IOError, OSError):
+            os.unlink(tmp)
+            raise
+    except (IOError, OSError, TypeError, ValueError):
+        pass
+
+
+def _load_yaml(fn):
+    '''Return the parsed contents of the yaml file fn, using its compiled
+       form if it was parsed before'''
+    with open(fn, 'rb') as f:
+        data = f.read()
+    compiled = os.path.join(COMPILED_DIR,
+                            '%s.json' % hashlib.sha256(data).hexdigest())
+    try:
+        with open(compiled, 'r') as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        pass
+
+    d = yaml.load(data, Loader=YamlLoader)
+    _save_compiled(compiled, d)
+    return d
+
+
+def _read_parsed_file(fn, as_yaml=False, copy_data=True):
+    '''Return a copy of the parsed contents of fn, parsing it only if it
+       changed since it was last read. With copy_data=False, the cached
+       contents are returned and must not be modified.'''
+    st = os.stat(fn)
+    stamp = (st.st_mtime, st.st_size)
+    key = (fn, as_yaml)
+    if key not in CR_FILE_CACHE or CR_FILE_CACHE[key][0] != stamp:
+        try:
+            if as_yaml:
+                d = _load_yaml(fn)
+            else:
+                d = json.loads(open(fn, 'r').read())
+        except ValueError:
+            raise ValueError("Could not parse '%s'" % fn)
+        CR_FILE_CACHE[key] = (stamp, d)
+    if not copy_data:
+        return CR_FILE_CACHE[key][1]
+    # callers are free to modify what they get
+    return copy.deepcopy(CR_FILE_CACHE[key][1])
+
+
+def update_cr_file(fn, url):
+    '''Fetch url to fn if fn is missing or out of date and url can be
+       reached'''
+    if _update_is_necessary(fn) and _update_is_possible(url):
+        get_remote_file(fn, url)
+
+
+def read_cr_file(fn, url, local_copy_fn=None, as_yaml=False, copy_data=True):
     '''read click reviews file from remote or local copy:
        - fn: where to store the cached file
        - url: url to fetch
        - local_copy_fn: force use of local copy
+       - copy_data: if False, return the contents shared with all the other
+         callers, which must not be modified
     '''
     d = {}
     if local_copy_fn and os.path.exists(local_copy_fn):
-        try:
-            if as_yaml:
-                d = yaml.safe_load(open(local_copy_fn, 'r').read())
-            else:
-                d = json.loads(open(local_copy_fn, 'r').read())
-        except ValueError:
-            raise ValueError("Could not parse '%s'" % local_copy_fn)
+        d = _read_parsed_file(local_copy_fn, as_yaml, copy_data)
     else:
-        if _update_is_necessary(fn) and _update_is_possible(url):
-            get_remote_file(fn, url)
+        update_cr_file(fn, url)
         if os.path.exists(fn):
-            try:
-                if as_yaml:
-                    d = yaml.safe_load(open(fn, 'r').read())
-                else:
-                    d = json.loads(open(fn, 'r').read())
-            except ValueError:
-                raise ValueError("Could not parse '%s'" % fn)
+            d = _read_parsed_file(fn, as_yaml, copy_data)
     return d
@@ -0,0 +1,168 @@
+'''result_cache.py: cache of the results of reviewing packages'''
+#
+# Copyright (C) 2018 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import glob
+import hashlib
+import json
+import os
+import tempfile
+
+from clickreviews import apparmor_policy, common, remote, \
+    snapd_base_declaration, sr_security
+
+CACHE_DIR = os.path.join(remote.DATA_DIR, 'results')
+
+# The cache is trimmed to this many bytes, dropping the least recently used
+# results first
+CACHE_SIZE = 64 * 1024 * 1024
+
+# The data files the checks use with where they are updated from. Like the
+# checks, those of the development tree are used if there.
+DATA_FILES = [(snapd_base_declaration.USER_DATA_FILE,
+               snapd_base_declaration.BD_DATA_URL),
+              (apparmor_policy.USER_DATA_FILE,
+               apparmor_policy.AA_POLICY_DATA_URL)]
+
+
+# The digest of the code of the checks, computed once per process
+TOOL_DIGEST = None
+
+
+def _get_tool_digest():
+    '''Return the digest of the code of the checks, so that results aren't
+       reused by another version of the checks'''
+    global TOOL_DIGEST
+    if TOOL_DIGEST is None:
+        h = hashlib.sha256()
+        topdir = os.path.dirname(os.path.abspath(__file__))
+        for fn in sorted(glob.glob(os.path.join(topdir, '*.py'))):
+            h.update(os.path.basename(fn).encode('UTF-8'))
+            h.update(str(common.get_file_digest(fn, 'sha256')).encode('UTF-8'))
+        TOOL_DIGEST = h.hexdigest()
+    return TOOL_DIGEST
+
+
+def _get_data_fn(user_fn):
+    '''Return the data file the checks use instead of user_fn'''
+    branch_dir = os.path.join(os.path.dirname(__file__), '../data')
+    fn = os.path.join(branch_dir, os.path.basename(user_fn))
+    if os.path.exists(fn):
+        return fn
+    return user_fn
+
+
+def update_data_files():
+    '''Update the data files from the network as the checks would, so that
+       the key is computed from what the checks will use'''
+    for (user_fn, url) in DATA_FILES:
+        if _get_data_fn(user_fn) == user_fn:
+            remote.update_cr_file(user_fn, url)
+
+
+def _get_data_digests():
+    '''Return the digests of the data files, None for those missing'''
+    digests = dict()
+    for (user_fn, url) in DATA_FILES:
+        name = os.path.basename(user_fn)
+        fn = _get_data_fn(user_fn)
+        digests[name] = None
+        if os.path.exists(fn):
+            digests[name] = common.get_file_digest(fn, 'sha256')
+    return digests
+
+
+def get_key(pkg_fn, overrides, checks=None):
+    '''Return the key of the results of reviewing pkg_fn with overrides and
+       the checks selected by checks (the --only and --skip patterns), or
+       None if they can't be cached. When the checks use the data files,
+       update_data_files() must be called first.'''
+    pkg_digest = common.get_file_digest(pkg_fn, 'sha512')
+    if pkg_digest is None:
+        return None
+
+    # the resquash check depends on the version of the squashfs-tools, and
+    # reports an error when they are missing
+    squashfs_tools = sr_security.get_squashfs_tools_version()
+    try:
+        key = json.dumps({'package': pkg_digest,
+                          'overrides': overrides,
+                          'checks': checks,
+                          'lazy_unpack': common.LAZY_UNPACK,
+                          'tool': _get_tool_digest(),
+                          'squashfs_tools': squashfs_tools,
+                          'data': _get_data_digests()}, sort_keys=True)
+    except (TypeError, ValueError):
+        return None
+    return hashlib.sha256(key.encode('UTF-8')).hexdigest()
+
+
+def _get_cache_fn(key):
+    return os.path.join(CACHE_DIR, '%s.json' % key)
+
+
+def load(key):
+    '''Return the cached results for key, or None if not cached'''
+    fn = _get_cache_fn(key)
+    try:
+        with open(fn, 'r') as f:
+            results = json.load(f)
+        # mark as recently used
+        os.utime(fn)
+    except (IOError, OSError, ValueError):
+        return None
+    return results
+
+
+def _trim():
+    '''Remove the least recently used results past CACHE_SIZE'''
+    entries = []
+    total = 0
+    for name in os.listdir(CACHE_DIR):
+        try:
+            st = os.stat(os.path.join(CACHE_DIR, name))
+        except OSError:
+            # removed by another process
+            continue
+        entries.append((st.st_mtime, name, st.st_size))
+        total += st.st_size
+
+    for (mtime, name, size) in sorted(entries):
+        if total <= CACHE_SIZE:
+            break
+        try:
+            os.unlink(os.path.join(CACHE_DIR, name))
+        except OSError:
+            pass
+        total -= size
+
+
+def save(key, results):
+    '''Cache results for key. Failing to is not an error.'''
+    try:
+        if not os.path.isdir(CACHE_DIR):
+            os.makedirs(CACHE_DIR)
+        # write atomically since other processes may be reading it
+        (fd, tmp) = tempfile.mkstemp(dir=CACHE_DIR)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(results, f)
+            os.rename(tmp, _get_cache_fn(key))
+        except (IOError, OSError, TypeError, ValueError):
+            os.unlink(tmp)
+            raise
+        _trim()
+    except (IOError, OSError, TypeError, ValueError):
+        pass
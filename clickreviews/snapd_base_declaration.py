@@ -30,8 +30,11 @@ def get_base_declaration_file(fn):
 
 
 class SnapdBaseDeclaration(object):
-    def __init__(self, local_copy_fn=None):
+    def __init__(self, local_copy_fn=None, shared=False):
+        # with shared=True, decl is the parsed file shared by all the
+        # instances and must not be modified
         self.decl = clickreviews.remote.read_cr_file(USER_DATA_FILE,
                                                      BD_DATA_URL,
                                                      local_copy_fn,
-                                                     as_yaml=True)
+                                                     as_yaml=True,
+                                                     copy_data=not shared)
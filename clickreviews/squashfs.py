@@ -0,0 +1,536 @@
+'''squashfs.py: read-only access to squashfs images'''
+#
+# Copyright (C) 2018 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# This reads squashfs 4.0 images (what snaps are) without unpacking them:
+# the tables are read through an mmap of the image and file data is only
+# decompressed when it is read. See squashfs-tools' squashfs_fs.h for the
+# on-disk format.
+
+import io
+import lzma
+import mmap
+import os
+import shutil
+import stat
+import struct
+import zlib
+
+SQUASHFS_MAGIC = 0x73717368
+SQUASHFS_METADATA_SIZE = 8192
+SQUASHFS_INVALID_FRAG = 0xffffffff
+
+# superblock: magic, inode_count, mkfs_time, block_size, fragments,
+# compression, block_log, flags, no_ids, s_major, s_minor, root_inode,
+# bytes_used, id_table_start, xattr_id_table_start, inode_table_start,
+# directory_table_start, fragment_table_start, lookup_table_start
+SUPERBLOCK = struct.Struct('<5I6H8Q')
+
+COMPRESSION_GZIP = 1
+COMPRESSION_LZMA = 2
+COMPRESSION_LZO = 3
+COMPRESSION_XZ = 4
+COMPRESSION_LZ4 = 5
+COMPRESSION_ZSTD = 6
+
+# inode types and the corresponding 'ls -l' type. The extended types are
+# the basic types + 7.
+INODE_TYPES = {1: 'd', 2: '-', 3: 'l', 4: 'b', 5: 'c', 6: 'p', 7: 's'}
+INODE_HEADER = struct.Struct('<HHHHII')
+DIR_HEADER = struct.Struct('<III')
+DIR_ENTRY = struct.Struct('<HhHH')
+FRAGMENT_ENTRY = struct.Struct('<QII')
+
+# metadata blocks have a 16 bit header, data blocks and fragments have the
+# size of the block in a 32 bit integer
+METADATA_UNCOMPRESSED = 0x8000
+DATA_UNCOMPRESSED = 1 << 24
+
+
+class SquashfsError(Exception):
+    '''This class represents squashfs errors'''
+
+
+def _check_name(name, number):
+    '''Raise SquashfsError if name can't be the name of an entry of the
+       directory inode number (eg, it would escape the directory)'''
+    if name in ['', '.', '..'] or '/' in name or '\0' in name:
+        raise SquashfsError("invalid name %r in directory inode %d" %
+                            (name, number))
+
+
+def _get_decompressor(compression, block_size):
+    '''Return a function to decompress blocks of the given compression.
+       lzo, lz4 and zstd need optional python modules.'''
+    if compression == COMPRESSION_GZIP:
+        return zlib.decompress
+    elif compression == COMPRESSION_XZ:
+        return lambda data: lzma.decompress(data, format=lzma.FORMAT_XZ)
+    elif compression == COMPRESSION_LZMA:
+        return lambda data: lzma.decompress(data, format=lzma.FORMAT_ALONE)
+    elif compression == COMPRESSION_LZO:
+        try:
+            import lzo
+        except ImportError:
+            raise SquashfsError("lzo compression is not supported (could "
+                                "not import lzo)")
+        return lambda data: lzo.decompress(data, False, block_size)
+    elif compression == COMPRESSION_LZ4:
+        try:
+            import lz4.block
+        except ImportError:
+            raise SquashfsError("lz4 compression is not supported (could "
+                                "not import lz4)")
+        return lambda data: lz4.block.decompress(data,
+                                                 uncompressed_size=block_size)
+    elif compression == COMPRESSION_ZSTD:
+        try:
+            import zstandard
+        except ImportError:
+            raise SquashfsError("zstd compression is not supported (could "
+                                "not import zstandard)")
+        return lambda data: zstandard.ZstdDecompressor().decompress(
+            data, max_output_size=block_size)
+    raise SquashfsError("unknown compression '%d'" % compression)
+
+
+class SquashfsInode(object):
+    '''An inode of a squashfs image. ftype is the type as shown by 'ls -l'
+       and mode has the permission bits (including suid, sgid and sticky).
+    '''
+    __slots__ = ['number', 'ftype', 'mode', 'uid', 'gid', 'mtime', 'size',
+                 'nlink', 'target', 'rdev', 'blocks_start', 'block_sizes',
+                 'fragment', 'fragment_offset', 'dir_start', 'dir_offset']
+
+    def __init__(self):
+        self.size = 0
+        self.target = None
+        self.rdev = None
+        self.blocks_start = None
+        self.block_sizes = None
+        self.fragment = SQUASHFS_INVALID_FRAG
+        self.fragment_offset = 0
+        self.dir_start = None
+        self.dir_offset = None
+
+    def is_dir(self):
+        return self.ftype == 'd'
+
+    def is_file(self):
+        return self.ftype == '-'
+
+    def is_symlink(self):
+        return self.ftype == 'l'
+
+    def major(self):
+        return (self.rdev & 0xfff00) >> 8
+
+    def minor(self):
+        return (self.rdev & 0xff) | ((self.rdev >> 12) & 0xfff00)
+
+
+class _MetadataCursor(object):
+    '''Sequential reads of metadata starting at offset in the metadata block
+       at pos'''
+    def __init__(self, image, pos, offset):
+        self.image = image
+        self.pos = pos
+        self.offset = offset
+
+    def read(self, length):
+        (data, self.pos, self.offset) = self.image._read_metadata(
+            self.pos, self.offset, length)
+        return data
+
+    def unpack(self, fmt):
+        # the formats depend on the image (eg, the number of blocks of a
+        # file), so a corrupted one may not even be a valid format
+        try:
+            if not isinstance(fmt, struct.Struct):
+                fmt = struct.Struct(fmt)
+            return fmt.unpack(self.read(fmt.size))
+        except struct.error as e:
+            raise SquashfsError("invalid metadata at %d: %s" %
+                                (self.pos, str(e)))
+
+
+class SquashfsFile(io.RawIOBase):
+    '''A regular file of a squashfs image, decompressing one block at a
+       time as it is read'''
+    def __init__(self, image, inode):
+        io.RawIOBase.__init__(self)
+        self.image = image
+        self.inode = inode
+        self.pos = 0
+        self.block_idx = None
+        self.block = b''
+
+        # offsets of the blocks in the image
+        self.offsets = []
+        offset = inode.blocks_start
+        for size in inode.block_sizes:
+            self.offsets.append(offset)
+            offset += size & ~DATA_UNCOMPRESSED
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, pos, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            pos += self.pos
+        elif whence == io.SEEK_END:
+            pos += self.inode.size
+        if pos < 0:
+            raise ValueError("negative seek position %d" % pos)
+        self.pos = pos
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+    def _get_block(self, idx):
+        '''Get the decompressed block idx of the file'''
+        if idx != self.block_idx:
+            block_size = self.image.block_size
+            if idx < len(self.inode.block_sizes):
+                length = min(block_size, self.inode.size - idx * block_size)
+                self.block = self.image._read_data_block(
+                    self.offsets[idx], self.inode.block_sizes[idx], length)
+            else:
+                # the tail end of the file is in a fragment
+                length = self.inode.size - idx * block_size
+                fragment = self.image._read_fragment(self.inode.fragment)
+                start = self.inode.fragment_offset
+                self.block = fragment[start:start + length]
+                if len(self.block) != length:
+                    raise SquashfsError("fragment too short for inode %d" %
+                                        self.inode.number)
+            self.block_idx = idx
+        return self.block
+
+    def readinto(self, b):
+        if self.pos >= self.inode.size:
+            return 0
+        (idx, offset) = divmod(self.pos, self.image.block_size)
+        block = self._get_block(idx)
+        n = min(len(b), len(block) - offset)
+        b[:n] = block[offset:offset + n]
+        self.pos += n
+        return n
+
+
+class SquashfsImage(object):
+    '''A squashfs image, opened read-only. Paths are relative to the root
+       of the image (eg, 'meta/snap.yaml').'''
+    def __init__(self, fn):
+        self.filename = fn
+        with open(fn, 'rb') as f:
+            try:
+                self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # empty file
+                raise SquashfsError("'%s' is not a squashfs image" % fn)
+
+        if len(self.mm) < SUPERBLOCK.size:
+            raise SquashfsError("'%s' is not a squashfs image" % fn)
+        (magic, self.inode_count, self.mkfs_time, self.block_size,
+         self.fragment_count, self.compression, block_log, self.flags,
+         id_count, major, minor, self.root_inode_ref, self.bytes_used,
+         id_table_start, xattr_id_table_start, self.inode_table_start,
+         self.directory_table_start, self.fragment_table_start,
+         lookup_table_start) = SUPERBLOCK.unpack_from(self.mm, 0)
+        if magic != SQUASHFS_MAGIC:
+            raise SquashfsError("'%s' is not a squashfs image" % fn)
+        if major != 4 or minor != 0:
+            raise SquashfsError("unsupported squashfs version %d.%d" %
+                                (major, minor))
+        if self.bytes_used > len(self.mm):
+            raise SquashfsError("'%s' is truncated" % fn)
+
+        self._decompress = _get_decompressor(self.compression,
+                                             self.block_size)
+        # decompressed metadata blocks keyed by position
+        self._metadata = dict()
+        self._fragment_table = None
+        # the last decompressed fragment, files in the same fragment are
+        # usually read one after the other
+        self._fragment = (None, None)
+
+        self.ids = struct.unpack('<%dI' % id_count,
+                                 self._read_table(id_table_start,
+                                                  id_count * 4))
+        self.root = self.get_inode(self.root_inode_ref)
+
+    def close(self):
+        self.mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _read_metadata_block(self, pos):
+        '''Return (data, next_pos) for the metadata block at pos'''
+        if pos not in self._metadata:
+            if pos + 2 > self.bytes_used:
+                raise SquashfsError("metadata block at %d out of range" % pos)
+            (header,) = struct.unpack_from('<H', self.mm, pos)
+            size = header & ~METADATA_UNCOMPRESSED
+            if pos + 2 + size > self.bytes_used:
+                raise SquashfsError("metadata block at %d out of range" % pos)
+            data = self.mm[pos + 2:pos + 2 + size]
+            if not header & METADATA_UNCOMPRESSED:
+                data = self._decompress_block(data)
+            self._metadata[pos] = (data, pos + 2 + size)
+        return self._metadata[pos]
+
+    def _read_metadata(self, pos, offset, length):
+        '''Read length bytes of metadata starting at offset in the block at
+           pos. Returns the data and where it ends (pos, offset).'''
+        chunks = []
+        while True:
+            (data, next_pos) = self._read_metadata_block(pos)
+            if offset >= len(data):
+                # continued in the next block
+                offset -= len(data)
+                pos = next_pos
+                continue
+            chunk = data[offset:offset + length]
+            chunks.append(chunk)
+            offset += len(chunk)
+            length -= len(chunk)
+            if length == 0:
+                break
+        return (b''.join(chunks), pos, offset)
+
+    def _read_table(self, start, length):
+        '''Read a table stored in metadata blocks listed (as 64 bit
+           positions) at start'''
+        count = (length + SQUASHFS_METADATA_SIZE - 1) // \
+            SQUASHFS_METADATA_SIZE
+        if start + count * 8 > self.bytes_used:
+            raise SquashfsError("table at %d out of range" % start)
+        chunks = []
+        for pos in struct.unpack_from('<%dQ' % count, self.mm, start):
+            chunks.append(self._read_metadata_block(pos)[0])
+        data = b''.join(chunks)
+        if len(data) < length:
+            raise SquashfsError("table at %d too short" % start)
+        return data[:length]
+
+    def _decompress_block(self, data):
+        # the optional decompressors all have their own exceptions
+        try:
+            return self._decompress(data)
+        except Exception as e:
+            raise SquashfsError("could not decompress block: %s" % str(e))
+
+    def _read_data_block(self, pos, size, length):
+        '''Read the data block of size (as stored in the inode) at pos which
+           decompresses to length bytes'''
+        compressed_size = size & ~DATA_UNCOMPRESSED
+        if compressed_size == 0:
+            # sparse block
+            return bytes(length)
+        if pos + compressed_size > self.bytes_used:
+            raise SquashfsError("data block at %d out of range" % pos)
+        data = self.mm[pos:pos + compressed_size]
+        if not size & DATA_UNCOMPRESSED:
+            data = self._decompress_block(data)
+        if len(data) != length:
+            raise SquashfsError("data block at %d has wrong size" % pos)
+        return data
+
+    def _read_fragment(self, idx):
+        '''Return the decompressed fragment block idx'''
+        if self._fragment[0] == idx:
+            return self._fragment[1]
+        if self._fragment_table is None:
+            self._fragment_table = self._read_table(
+                self.fragment_table_start,
+                self.fragment_count * FRAGMENT_ENTRY.size)
+        if idx >= self.fragment_count:
+            raise SquashfsError("invalid fragment %d" % idx)
+        (pos, size, unused) = FRAGMENT_ENTRY.unpack_from(
+            self._fragment_table, idx * FRAGMENT_ENTRY.size)
+        compressed_size = size & ~DATA_UNCOMPRESSED
+        if pos + compressed_size > self.bytes_used:
+            raise SquashfsError("fragment %d out of range" % idx)
+        data = self.mm[pos:pos + compressed_size]
+        if not size & DATA_UNCOMPRESSED:
+            data = self._decompress_block(data)
+        self._fragment = (idx, data)
+        return data
+
+    def get_inode(self, ref):
+        '''Read the inode for the given inode reference'''
+        cursor = _MetadataCursor(self, self.inode_table_start + (ref >> 16),
+                                 ref & 0xffff)
+        (itype, mode, uid_idx, gid_idx, mtime, number) = \
+            cursor.unpack(INODE_HEADER)
+        basic_type = itype - 7 if itype > 7 else itype
+        if basic_type not in INODE_TYPES:
+            raise SquashfsError("unknown inode type %d" % itype)
+
+        inode = SquashfsInode()
+        inode.number = number
+        inode.ftype = INODE_TYPES[basic_type]
+        inode.mode = mode
+        try:
+            inode.uid = self.ids[uid_idx]
+            inode.gid = self.ids[gid_idx]
+        except IndexError:
+            raise SquashfsError("invalid id for inode %d" % number)
+        inode.mtime = mtime
+
+        if itype == 1:
+            (inode.dir_start, inode.nlink, inode.size, inode.dir_offset,
+             parent) = cursor.unpack('<IIHHI')
+        elif itype == 8:
+            (inode.nlink, inode.size, inode.dir_start, parent, index_count,
+             inode.dir_offset, xattr) = cursor.unpack('<IIIIHHI')
+        elif basic_type == 2:
+            if itype == 2:
+                (inode.blocks_start, inode.fragment, inode.fragment_offset,
+                 inode.size) = cursor.unpack('<IIII')
+                inode.nlink = 1
+            else:
+                (inode.blocks_start, inode.size, sparse, inode.nlink,
+                 inode.fragment, inode.fragment_offset, xattr) = \
+                    cursor.unpack('<QQQIIII')
+            count = inode.size // self.block_size
+            if inode.fragment == SQUASHFS_INVALID_FRAG and \
+                    inode.size % self.block_size:
+                count += 1
+            inode.block_sizes = cursor.unpack('<%dI' % count)
+        elif basic_type == 3:
+            (inode.nlink, size) = cursor.unpack('<II')
+            inode.target = os.fsdecode(cursor.read(size))
+            if inode.target == '' or '\0' in inode.target:
+                raise SquashfsError("invalid symlink target for inode %d" %
+                                    number)
+            inode.size = size
+        elif basic_type == 4 or basic_type == 5:
+            (inode.nlink, inode.rdev) = cursor.unpack('<II')
+        else:
+            (inode.nlink,) = cursor.unpack('<I')
+        return inode
+
+    def iterdir(self, inode):
+        '''Yield (name, inode) for the entries of the directory inode'''
+        if not inode.is_dir():
+            raise SquashfsError("inode %d is not a directory" % inode.number)
+        cursor = _MetadataCursor(self,
+                                 self.directory_table_start + inode.dir_start,
+                                 inode.dir_offset)
+        # the size includes the '.' and '..' entries which are not stored
+        remaining = inode.size - 3
+        while remaining > 0:
+            (count, start, number) = cursor.unpack(DIR_HEADER)
+            remaining -= DIR_HEADER.size
+            for i in range(count + 1):
+                (offset, number_delta, itype, size) = \
+                    cursor.unpack(DIR_ENTRY)
+                name = os.fsdecode(cursor.read(size + 1))
+                _check_name(name, inode.number)
+                remaining -= DIR_ENTRY.size + size + 1
+                yield (name, self.get_inode((start << 16) | offset))
+
+    def listdir(self, path=''):
+        '''Return the names of the entries of the directory path'''
+        return [name for (name, inode) in self.iterdir(self.lookup(path))]
+
+    def walk(self, inode=None, path=''):
+        '''Yield (path, inode) for every entry under inode (default: the
+           root), directories before their contents'''
+        if inode is None:
+            inode = self.root
+        # a stack of the directories being walked rather than recursion, as
+        # an image may have more levels than the recursion limit
+        stack = [(path, inode.number, self.iterdir(inode))]
+        parents = set([inode.number])
+        while stack:
+            (dir_path, number, entries) = stack[-1]
+            for (name, child) in entries:
+                child_path = os.path.join(dir_path, name)
+                yield (child_path, child)
+                if child.is_dir():
+                    # a corrupted image may have a directory inside itself
+                    if child.number in parents:
+                        raise SquashfsError("directory loop at '%s'" %
+                                            child_path)
+                    stack.append((child_path, child.number,
+                                  self.iterdir(child)))
+                    parents.add(child.number)
+                    break
+            else:
+                stack.pop()
+                parents.discard(number)
+
+    def lookup(self, path):
+        '''Return the inode for path. Symlinks are not followed.'''
+        inode = self.root
+        for name in path.split('/'):
+            if name == '' or name == '.':
+                continue
+            if not inode.is_dir():
+                raise FileNotFoundError("'%s' not found" % path)
+            for (entry, child) in self.iterdir(inode):
+                if entry == name:
+                    inode = child
+                    break
+            else:
+                raise FileNotFoundError("'%s' not found" % path)
+        return inode
+
+    def open(self, path_or_inode):
+        '''Open a regular file for (binary) reading'''
+        inode = path_or_inode
+        if not isinstance(inode, SquashfsInode):
+            inode = self.lookup(path_or_inode)
+        if not inode.is_file():
+            raise SquashfsError("inode %d is not a regular file" %
+                                inode.number)
+        return io.BufferedReader(SquashfsFile(self, inode),
+                                 buffer_size=self.block_size)
+
+    def read(self, path_or_inode):
+        '''Return the contents of a regular file'''
+        with self.open(path_or_inode) as f:
+            return f.read()
+
+    def extract(self, inode, dest):
+        '''Create dest from inode. Directories are created empty and always
+           writable by the owner so they can be filled. Device nodes, fifos
+           and sockets are skipped (like unsquashfs does when not run as
+           root).'''
+        mode = inode.mode
+        if inode.is_dir():
+            os.mkdir(dest)
+            mode |= stat.S_IRWXU
+        elif inode.is_symlink():
+            os.symlink(inode.target, dest)
+            return
+        elif inode.is_file():
+            with self.open(inode) as src, open(dest, 'wb') as f:
+                shutil.copyfileobj(src, f, self.block_size)
+        else:
+            return
+        os.chmod(dest, mode)
+        os.utime(dest, (inode.mtime, inode.mtime))
@@ -30,6 +30,11 @@ from clickreviews.common import (
 import clickreviews.snapd_base_declaration as snapd_base_declaration
 
 
+# The base declaration of each series with the in-progress interfaces added,
+# with the parsed base declaration it was built from
+BASE_DECLARATION_CACHE = dict()
+
+
 #
 # Utility classes
 #
@@ -37,8 +42,90 @@ class SnapReviewException(ReviewException):
     '''This class represents SnapReview exceptions'''
 
 
+class SquashfsEntry(object):
+    '''An entry of the squashfs inventory. The fields are kept as found in
+       the unsquashfs -lls output for the checks to validate. 'error' is set
+       (and nothing else) when the line couldn't be split into fields.
+    '''
+    __slots__ = ['ftype', 'mode', 'owner', 'size', 'major', 'minor', 'date',
+                 'time', 'fname', 'error']
+
+    def __init__(self, error=None):
+        self.error = error
+
+
+class SquashfsInventory(object):
+    '''The entries of a squashfs, as listed by unsquashfs -lls. This is
+       built once per package and shared by all the squashfs checks.
+    '''
+    fname_pat = re.compile(r'.* squashfs-root')
+    mknod_pat_full = re.compile(r'.,.')
+
+    def __init__(self, rc, out):
+        self.rc = rc
+        self.entries = []
+        # number of lines of output, including the header
+        self.count = 0
+        if rc == 0:
+            self._parse(out)
+
+    def _parse(self, out):
+        '''Parse the unsquashfs -lls output'''
+        in_header = True
+        for line in out.splitlines():
+            self.count += 1
+            if in_header:
+                if len(line) < 1:
+                    in_header = False
+                continue
+
+            tmp = line.split()
+            if len(tmp) < 6:
+                self.entries.append(SquashfsEntry(
+                    "wrong number of fields in '%s'" % line))
+                continue
+
+            entry = SquashfsEntry()
+            entry.fname = self.fname_pat.sub('.', line)
+            # Also see 'info ls', but we list only the Linux ones
+            entry.ftype = line[0]
+            entry.mode = tmp[0][1:]
+            entry.owner = tmp[1]
+            entry.size = None
+            entry.major = None
+            entry.minor = None
+
+            date_idx = 3
+            time_idx = 4
+            if entry.ftype == 'b' or entry.ftype == 'c':
+                # Account for unsquashfs -lls doing:
+                # crw-rw-rw- root/root             1,  8 2016-08-09 ...
+                # crw-rw---- root/root            10,141 2016-08-09 ...
+                if self.mknod_pat_full.search(tmp[2]):
+                    (entry.major, entry.minor) = tmp[2].split(',')
+                else:
+                    date_idx = 4
+                    time_idx = 5
+                    entry.major = tmp[2][:-1]
+                    entry.minor = tmp[3]
+            else:
+                entry.size = tmp[2]
+            entry.date = tmp[date_idx]
+            entry.time = tmp[time_idx]
+            self.entries.append(entry)
+
+    def has_symlinks(self):
+        '''Return True if the squashfs contains symlinks'''
+        for entry in self.entries:
+            if entry.error is None and entry.ftype == 'l':
+                return True
+        return False
+
+
 class SnapReview(Review):
     '''This class represents snap reviews'''
+    # the snapd base declaration is updated from the network
+    needs = ['network_data']
     snappy_required = ["name",
                        "version",
                        ]
@@ -178,17 +265,15 @@ class SnapReview(Review):
         }
     }
 
-    def __init__(self, fn, review_type, overrides=None):
-        Review.__init__(self, fn, review_type, overrides=overrides)
+    def __init__(self, fn, review_type, overrides=None, context=None):
+        Review.__init__(self, fn, review_type, overrides=overrides,
+                        context=context)
 
         if not self.is_snap2:
             return
 
-        snap_yaml = self._extract_snap_yaml()
-        try:
-            self.snap_yaml = yaml.safe_load(snap_yaml)
-        except Exception:  # pragma: nocover
-            error("Could not load snap.yaml. Is it properly formatted?")
+        self.snap_yaml = self.context.get_parsed('snap.yaml',
+                                                 self._load_snap_yaml)
 
         # If local_copy is None, then this will check the server to see if
         # we are up to date. However, if we are working within the development
@@ -198,30 +283,9 @@ class SnapReview(Review):
                                  '../data/snapd-base-declaration.yaml')
         if os.path.exists(branch_fn):
             local_copy = branch_fn
-        p = snapd_base_declaration.SnapdBaseDeclaration(local_copy)
         # FIXME: don't hardcode series
         self.base_declaration_series = "16"
-        self.base_declaration = p.decl[self.base_declaration_series]
-
-        # Add in-progress interfaces
-        if self.base_declaration_series in self.inprogress_interfaces:
-            rel = self.base_declaration_series
-            for side in ['plugs', 'slots']:
-                if side not in self.base_declaration or \
-                        side not in self.inprogress_interfaces[rel]:
-                    continue
-
-                if side == 'plugs':
-                    oside = 'slots'
-                else:
-                    oside = 'plugs'
-
-                for iface in self.inprogress_interfaces[rel][side]:
-                    if iface in self.base_declaration[side] or \
-                            iface in self.base_declaration[oside]:
-                        # don't override anything in the base declaration
-                        continue
-                    self.base_declaration[side][iface] = self.inprogress_interfaces[rel][side][iface]
+        self.base_declaration = self._get_base_declaration(local_copy)
 
         # to simplify checks, gather up all the interfaces into one dict()
         for side in ['plugs', 'slots']:
@@ -259,6 +323,52 @@ class SnapReview(Review):
                 if self.snap_yaml[k][iface] is None:
                     self.snap_yaml[k][iface] = {}
 
+    def _get_base_declaration(self, local_copy):
+        '''Return the base declaration of the series with the in-progress
+           interfaces added. This is built once and shared by all the
+           reviews, so it must not be modified.
+        '''
+        p = snapd_base_declaration.SnapdBaseDeclaration(local_copy,
+                                                        shared=True)
+        rel = self.base_declaration_series
+        decl = p.decl[rel]
+        # the parsed base declaration is a new object when the file changed
+        if rel in BASE_DECLARATION_CACHE and \
+                BASE_DECLARATION_CACHE[rel][0] is decl:
+            return BASE_DECLARATION_CACHE[rel][1]
+
+        # Add in-progress interfaces, without modifying the parsed file
+        merged = dict(decl)
+        if rel in self.inprogress_interfaces:
+            for side in ['plugs', 'slots']:
+                if side not in merged or \
+                        side not in self.inprogress_interfaces[rel]:
+                    continue
+
+                if side == 'plugs':
+                    oside = 'slots'
+                else:
+                    oside = 'plugs'
+
+                merged[side] = dict(merged[side])
+                for iface in self.inprogress_interfaces[rel][side]:
+                    if iface in merged[side] or iface in merged[oside]:
+                        # don't override anything in the base declaration
+                        continue
+                    merged[side][iface] = \
+                        self.inprogress_interfaces[rel][side][iface]
+
+        BASE_DECLARATION_CACHE[rel] = (decl, merged)
+        return merged
+
+    def _load_snap_yaml(self):
+        '''Load the snappy 16.04 snap.yaml'''
+        snap_yaml = self._extract_snap_yaml()
+        try:
+            return yaml.safe_load(snap_yaml)
+        except Exception:  # pragma: nocover
+            error("Could not load snap.yaml. Is it properly formatted?")
+
     # Since coverage is looked at via the testsuite and the testsuite mocks
     # this out, don't cover this
     def _extract_snap_yaml(self):  # pragma: nocover
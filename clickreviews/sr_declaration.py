@@ -17,11 +17,36 @@
 from __future__ import print_function
 from clickreviews.sr_common import SnapReview, SnapReviewException
 from clickreviews.overrides import iface_attributes_noflag
+from collections import OrderedDict
+import functools
+import hashlib
+import itertools
+import json
 import re
 
 # Specification:
 # https://docs.google.com/document/d/1QkglVjSzHC65lPthXV3ZlQcqPpKxuGEBL-FMuGP6ogs/edit#
 
+# The number of attribute patterns of the declarations kept compiled, since
+# they are matched for every plug and slot. The least recently used are
+# dropped past it so that long running processes don't grow without bound.
+MATCH_PATTERN_CACHE_SIZE = 1024
+
+
+@functools.lru_cache(maxsize=MATCH_PATTERN_CACHE_SIZE)
+def _get_match_pattern(against):
+    '''Return the compiled regex for matching 'against' exactly (like
+       re.search(r'^(against)$'), so a trailing newline is allowed)'''
+    return re.compile(r'^(%s)$' % against)
+
+
+# The verdicts of verifying plugs and slots against the declarations, shared
+# by all the snaps reviewed by the process since many plug the same
+# interfaces the same way. The least recently used are dropped past
+# VERDICT_CACHE_SIZE.
+VERDICT_CACHE = OrderedDict()
+VERDICT_CACHE_SIZE = 4096
+
 
 class SnapDeclarationException(SnapReviewException):
     '''This class represents SnapDeclaration exceptions'''
@@ -29,9 +54,11 @@ class SnapDeclarationException(SnapReviewException):
 
 class SnapReviewDeclaration(SnapReview):
     '''This class represents click lint reviews'''
-    def __init__(self, fn, overrides=None):
-        SnapReview.__init__(self, fn, "declaration-snap-v2",
-                            overrides=overrides)
+    review_type = "declaration-snap-v2"
+
+    def __init__(self, fn, overrides=None, context=None):
+        SnapReview.__init__(self, fn, self.review_type,
+                            overrides=overrides, context=context)
 
         if not self.is_snap2:
             return
@@ -339,7 +366,7 @@ class SnapReviewDeclaration(SnapReview):
         matched = False
 
         if isinstance(val, str):
-            if re.search(r'^(%s)$' % against, val):
+            if _get_match_pattern(against).search(val):
                 matched = True
         elif isinstance(val, list):
             matched = (sorted(against) == sorted(val))
@@ -573,6 +600,69 @@ class SnapReviewDeclaration(SnapReview):
 
         return (decls, has_alternates)
 
+    def _has_alternates(self, interface):
+        '''Return if the base or snap declaration has alternate constraints
+           for the interface'''
+        for d in [self.base_declaration, self.snap_declaration]:
+            if d is None:
+                continue
+            for side in ["plugs", "slots"]:
+                if side not in d or interface not in d[side]:
+                    continue
+                for cstr in d[side][interface]:
+                    if isinstance(d[side][interface][cstr], list):
+                        return True
+        return False
+
+    def _get_combinations(self, d, interface, consulted):
+        '''Generate the combinations of the alternate constraints of the
+           interface in the declaration d, like _get_all_combinations(), but
+           lazily and only expanding the (side, constraint) pairs in
+           'consulted'. The other constraints are left as is, since the
+           combinations which only differ by them all verify the same.
+        '''
+        if d is None:
+            return
+
+        sides = []
+        to_expand = []
+        for side in ["plugs", "slots"]:
+            if side not in d or interface not in d[side]:
+                continue
+            sides.append(side)
+            for cstr in d[side][interface]:
+                if not isinstance(d[side][interface][cstr], list):
+                    continue
+                if len(d[side][interface][cstr]) == 0:
+                    # no alternate to choose, so there are no combinations
+                    return
+                if (side, cstr) in consulted:
+                    to_expand.append((side, cstr))
+
+        alternates = [d[side][interface][cstr] for (side, cstr) in to_expand]
+        for values in itertools.product(*alternates):
+            decl = dict((side, {interface: dict(d[side][interface])})
+                        for side in sides)
+            for ((side, cstr), val) in zip(to_expand, values):
+                decl[side][interface][cstr] = val
+            yield decl
+
+    def _get_consulted_constraints(self, interface, side, oside):
+        '''Return the (side, constraint) pairs of the base and snap
+           declarations that _verify_iface_by_declaration() looks at'''
+        consulted = {'base': set(), 'snap': set()}
+        for i in ['installation', 'connection']:
+            (decl, base_decl, decl_type) = \
+                self._get_decl(self.base_declaration, self.snap_declaration,
+                               side, interface, i)
+            for j in ['deny', 'allow']:
+                decl_key = "%s-%s" % (j, i)
+                consulted[decl_type].add((side, decl_key))
+                if base_decl:
+                    # for the plug-attributes of the other side
+                    consulted[decl_type].add((oside, decl_key))
+        return consulted
+
     def _verify_iface_by_declaration(self, base, snap, name, iface, interface, attribs, side, oside):
         # 'checked' is used to see if a particular check is made (eg, if
         # 'deny-connection' for this interface was performed).
@@ -784,17 +874,94 @@ class SnapReviewDeclaration(SnapReview):
             self._add_result(t, n, s)
             return
 
+        key = self._get_verdict_key(side, interface, attribs)
+        if key is not None and key in VERDICT_CACHE:
+            VERDICT_CACHE.move_to_end(key)
+            (require_manual, staged) = VERDICT_CACHE[key]
+            for (result_type, check, entry) in staged:
+                self._add_result(result_type,
+                                 self._get_check_name(check, app=iface,
+                                                      extra=interface),
+                                 entry['text'], link=entry.get('link'),
+                                 manual_review=entry['manual_review'],
+                                 stage=True)
+        else:
+            require_manual = self._verify_iface_by_declarations(
+                name, iface, interface, attribs, side, oside)
+            if key is not None:
+                self._save_verdict(key, require_manual, iface, interface)
+
+        # Apply our staged results if required, otherwise report all is ok
+        if require_manual:
+            self._apply_staged_results()
+        else:
+            self._discard_staged_results()
+            self._add_result('info',
+                             self._get_check_name("%s" % side, app=iface,
+                                                  extra=interface),
+                             "OK", manual_review=False)
+
+    def _get_verdict_key(self, side, interface, attribs):
+        '''Return the key of the verdict of verifying the plug or slot in
+           VERDICT_CACHE, made of everything the verdict depends on, or None
+           if it can't be cached'''
+        decls = []
+        try:
+            for d in [self.base_declaration, self.snap_declaration]:
+                if d is None:
+                    decls.append(None)
+                    continue
+                decls.append(dict((s, d[s][interface])
+                                  for s in ['plugs', 'slots']
+                                  if s in d and interface in d[s]))
+            snap_type = self.snap_yaml.get('type')
+            key = json.dumps([side, interface, attribs, decls, snap_type],
+                             sort_keys=True)
+        except (TypeError, ValueError):
+            return None
+        return hashlib.sha256(key.encode('UTF-8')).hexdigest()
+
+    def _save_verdict(self, key, require_manual, iface, interface):
+        '''Save the verdict of verifying the plug or slot iface, with the
+           staged results that go with it, in VERDICT_CACHE'''
+        staged = []
+        if require_manual:
+            for result_type in self.stage_report:
+                for name in self.stage_report[result_type]:
+                    check = name.split(':')[1]
+                    if name != self._get_check_name(check, app=iface,
+                                                    extra=interface):
+                        # can't be reported for another plug or slot
+                        return
+                    entry = dict(self.stage_report[result_type][name])
+                    staged.append((result_type, check, entry))
+
+        VERDICT_CACHE[key] = (require_manual, staged)
+        if len(VERDICT_CACHE) > VERDICT_CACHE_SIZE:
+            VERDICT_CACHE.popitem(last=False)
+
+    def _verify_iface_by_declarations(self, name, iface, interface, attribs,
+                                      side, oside):
+        '''Verify the plug or slot against the base and snap declarations,
+           staging the results. Return if it requires manual review.'''
         # To support alternates in the base and snap declaration, we need to
         # try each combination of snap alternate constraint and base alternate
         # constraint. If we have alternates and one passes and there are no
         # exact denials, then don't report. Otherwise report if require manual
-        # review.
-        (decls, has_alternates) = self._get_all_combinations(interface)
+        # review. The combinations are generated as they are tried, since
+        # trying stops at the first combination not exactly denied.
+        has_alternates = self._has_alternates(interface)
+        consulted = self._get_consulted_constraints(interface, side, oside)
         require_manual = False
 
         exact_deny = True
-        for b in decls['base']:
-            for s in decls['snap']:
+        for b in self._get_combinations(self.base_declaration, interface,
+                                        consulted['base']):
+            snaps = self._get_combinations(self.snap_declaration, interface,
+                                           consulted['snap'])
+            # We need at least one snap declaration, even if it is None
+            s = next(snaps, None)
+            for s in itertools.chain([s], snaps):
                 (manual, exact) = \
                     self._verify_iface_by_declaration(b, s, name, iface,
                                                       interface, attribs, side,
@@ -803,18 +970,14 @@ class SnapReviewDeclaration(SnapReview):
                     require_manual = True
                     if has_alternates and not exact:
                         exact_deny = False
+                        break
+            if not exact_deny:
+                break
 
         if has_alternates and not exact_deny:
             require_manual = False
 
-        # Apply our staged results if required, otherwise report all is ok
-        if require_manual:
-            self._apply_staged_results()
-        else:
-            self._add_result('info',
-                             self._get_check_name("%s" % side, app=iface,
-                                                  extra=interface),
-                             "OK", manual_review=False)
+        return require_manual
 
     def check_declaration(self):
         '''Check base/snap declaration requires manual review for top-level
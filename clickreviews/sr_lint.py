@@ -26,17 +26,19 @@ from clickreviews.overrides import (
     redflagged_snap_types_overrides,
     desktop_file_exception
 )
-import glob
 import os
 import re
 
 
 class SnapReviewLint(SnapReview):
     '''This class represents snap lint reviews'''
+    review_type = "lint-snap-v2"
+    needs = SnapReview.needs + ['binaries']
 
-    def __init__(self, fn, overrides=None):
+    def __init__(self, fn, overrides=None, context=None):
         '''Set up the class.'''
-        SnapReview.__init__(self, fn, "lint-snap-v2", overrides=overrides)
+        SnapReview.__init__(self, fn, self.review_type, overrides=overrides,
+                            context=context)
         if not self.is_snap2:
             return
 
@@ -49,19 +51,6 @@ class SnapReviewLint(SnapReview):
                                              's390x',
                                              ]
         self.valid_architectures = ['all'] + self.valid_compiled_architectures
-        self.vcs_files = ['.bzr*',
-                          # '.excludes',  # autogenerated by SDK
-                          '.git*',
-                          '.idea',
-                          '.svn*',
-                          '.hg',
-                          '.project',
-                          'CVS*',
-                          'RCS*'
-                          ]
-        self.iffy_files = ['^\..+\.swp$',  # vim
-                           ]
-
         self._list_all_compiled_binaries()
 
         self.redflagged_snap_types = ['kernel',
@@ -1129,7 +1118,8 @@ class SnapReviewLint(SnapReview):
         t = 'info'
         n = self._get_check_name('external_symlinks')
         s = 'OK'
-        links = find_external_symlinks(self._get_unpack_dir(), self.pkg_files,
+        links = find_external_symlinks(self._get_unpack_dir(),
+                                       self._list_all_symlinks(),
                                        self.snap_yaml['name'])
         if len(links) > 0:
             t = 'error'
@@ -1196,12 +1186,7 @@ class SnapReviewLint(SnapReview):
         t = 'info'
         n = self._get_check_name('vcs_files')
         s = 'OK'
-        found = []
-        for d in self.vcs_files:
-            entries = glob.glob("%s/%s" % (self._get_unpack_dir(), d))
-            if len(entries) > 0:
-                for i in entries:
-                    found.append(os.path.relpath(i, self.unpack_dir))
+        found = self._get_matching_files()['vcs']
         if len(found) > 0:
             t = 'warn'
             s = 'found VCS files in package: %s' % ", ".join(found)
@@ -1215,13 +1200,7 @@ class SnapReviewLint(SnapReview):
         t = 'info'
         n = self._get_check_name('iffy_files')
         s = 'OK'
-        found = []
-
-        for f in self.pkg_files:
-            fn = os.path.basename(f)
-            for d in self.iffy_files:
-                if re.search(r'%s' % d, fn):
-                    found.append(os.path.relpath(f, self.unpack_dir))
+        found = self._get_matching_files()['iffy']
 
         if len(found) > 0:
             t = 'warn'
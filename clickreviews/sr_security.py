@@ -18,10 +18,13 @@ from __future__ import print_function
 
 from clickreviews.sr_common import (
     SnapReview,
+    SquashfsInventory,
 )
 from clickreviews.common import (
     cmd,
     create_tempdir,
+    get_file_digest,
+    recursive_rm,
     ReviewException,
     AA_PROFILE_NAME_MAXLEN,
     AA_PROFILE_NAME_ADVLEN,
@@ -31,14 +34,82 @@ from clickreviews.overrides import (
     sec_mode_overrides,
     sec_browser_support_overrides,
 )
+from clickreviews.remote import DATA_DIR
+import hashlib
+import json
 import os
 import re
+import tempfile
+
+# Results of check_squashfs_resquash(), keyed by the sha512 of the snap and
+# the squashfs-tools version
+RESQUASH_CACHE_DIR = os.path.join(DATA_DIR, 'resquash')
+SQUASHFS_TOOLS_VERSION = None
+
+
+def get_squashfs_tools_version():
+    '''Return the version of mksquashfs (eg, '4.3') or None'''
+    global SQUASHFS_TOOLS_VERSION
+    if SQUASHFS_TOOLS_VERSION is None:
+        (rc, out) = cmd(['mksquashfs', '-version'])
+        m = re.search(r'^mksquashfs version (\S+)', out, re.MULTILINE)
+        if rc == 0 and m:
+            SQUASHFS_TOOLS_VERSION = m.group(1)
+    return SQUASHFS_TOOLS_VERSION
+
+
+def _get_resquash_cache_fn(snap_sum, version):
+    '''Return the cache file for the resquash of the snap with snap_sum'''
+    key = json.dumps([snap_sum, version, MKSQUASHFS_OPTS])
+    return os.path.join(RESQUASH_CACHE_DIR,
+                        hashlib.sha256(key.encode('UTF-8')).hexdigest())
+
+
+def read_resquash_cache(snap_sum, version):
+    '''Return whether the resquash of the snap with snap_sum matched or
+       None if it isn't known'''
+    try:
+        with open(_get_resquash_cache_fn(snap_sum, version), 'r') as f:
+            return json.load(f)['matches']
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def write_resquash_cache(snap_sum, version, matches):
+    '''Remember whether the resquash of the snap with snap_sum matched'''
+    fn = _get_resquash_cache_fn(snap_sum, version)
+    try:
+        if not os.path.isdir(RESQUASH_CACHE_DIR):
+            os.makedirs(RESQUASH_CACHE_DIR)
+        # write atomically since other reviews may be reading it
+        (fd, tmp) = tempfile.mkstemp(dir=RESQUASH_CACHE_DIR)
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'snap_sha512': snap_sum,
+                       'squashfs_tools': version,
+                       'matches': matches}, f)
+        os.rename(tmp, fn)
+    except (IOError, OSError):
+        pass
 
 
 class SnapReviewSecurity(SnapReview):
     '''This class represents snap security reviews'''
-    def __init__(self, fn, overrides=None):
-        SnapReview.__init__(self, fn, "security-snap-v2", overrides=overrides)
+    review_type = "security-snap-v2"
+    check_names = {
+        'check_squashfs_resquash': ['squashfs_repack_checksum',
+                                    'squashfs_resquash',
+                                    'squashfs_resquash_1555305',
+                                    'squashfs_supports_fstime',
+                                    'squashfs_lls'],
+        'check_squashfs_files': ['squashfs_files',
+                                 'squashfs_files_unsquash',
+                                 'squashfs_files_malformed output',
+                                 'squashfs_files_malformed_line'],
+    }
+
+    def __init__(self, fn, overrides=None, context=None):
+        SnapReview.__init__(self, fn, self.review_type, overrides=overrides,
+                            context=context)
 
         if not self.is_snap2:
             return
@@ -51,6 +122,16 @@ class SnapReviewSecurity(SnapReview):
         '''Run unsquashfs -lls on a snap package'''
         return cmd(['unsquashfs', '-lls', snap_pkg])
 
+    def _get_squashfs_inventory(self):
+        '''Get the squashfs inventory, running unsquashfs -lls only once per
+           package'''
+        def _build():
+            (rc, out) = self._unsquashfs_lls(
+                os.path.abspath(self.pkg_filename))
+            return SquashfsInventory(rc, out)
+
+        return self.context.get_shared('squashfs_inventory', _build)
+
     def check_security_plugs_browser_support_with_daemon(self):
         '''Check security plugs - browser-support not used with daemon'''
         def _plugref_is_interface(ref, iface):
@@ -127,11 +208,72 @@ class SnapReviewSecurity(SnapReview):
                                                       app))
             self._add_result(t, n, s)
 
+    def _resquash_matches(self, fn, fstime, orig_sum):
+        '''Unsquash and resquash the snap, returning whether the result
+           matches orig_sum. None is returned (and an error result added)
+           if this couldn't be done.'''
+        tmpdir = create_tempdir()  # this is autocleaned
+        tmp_unpack = os.path.join(tmpdir, 'squashfs-root')
+        tmp_repack = os.path.join(tmpdir, 'repack.snap')
+        # mksquashfs uses all the online CPUs by default, only use those we
+        # may run on
+        processors = str(len(os.sched_getaffinity(0)))
+
+        curdir = os.getcwd()
+        os.chdir(tmpdir)
+        # ensure we don't alter the permissions from the unsquashfs
+        old_umask = os.umask(000)
+
+        try:
+            (rc, out) = cmd(['unsquashfs', '-d', tmp_unpack, fn])
+            if rc != 0:
+                raise ReviewException("could not unsquash '%s': %s" %
+                                      (os.path.basename(fn), out))
+            args = ['mksquashfs', tmp_unpack, tmp_repack, '-fstime', fstime,
+                    '-processors', processors]
+            (rc, out) = cmd(args + MKSQUASHFS_OPTS)
+            if rc != 0:
+                raise ReviewException("could not mksquashfs '%s': %s" %
+                                      (os.path.relpath(tmp_unpack, tmpdir),
+                                       out))
+        except ReviewException as e:
+            t = 'error'
+            n = self._get_check_name('squashfs_resquash')
+            self._add_result(t, n, str(e))
+            return None
+        finally:
+            os.umask(old_umask)
+            os.chdir(curdir)
+
+        repack_sum = get_file_digest(tmp_repack, 'sha512')
+        if repack_sum is None:
+            t = 'error'
+            n = self._get_check_name('squashfs_repack_checksum')
+            s = "could not determine checksum of '%s'" % \
+                os.path.relpath(tmp_repack, tmpdir)
+            self._add_result(t, n, s)
+            return None
+
+        # don't keep a copy of the snap around any longer than needed
+        recursive_rm(tmp_unpack)
+        os.unlink(tmp_repack)
+
+        return orig_sum == repack_sum
+
     def check_squashfs_resquash(self):
         '''Check resquash of squashfs'''
         if not self.is_snap2:
             return
 
+        # 'off', 'cached' or 'always'
+        policy = self.overrides.get('snap_resquash', 'always')
+        if policy == 'off':
+            t = 'info'
+            n = self._get_check_name('squashfs_repack_checksum')
+            s = "SKIPPED (resquash disabled)"
+            self._add_result(t, n, s)
+            return
+
         fn = os.path.abspath(self.pkg_filename)
 
         # Verify squashfs supports the -fstime option, if not, warn (which
@@ -146,14 +288,14 @@ class SnapReviewSecurity(SnapReview):
         fstime = out.strip()
 
         # For now, skip the checks on if have symlinks due to LP: #1555305
-        (rc, out) = cmd(['unsquashfs', '-lls', fn])
-        if rc != 0:
+        inventory = self._get_squashfs_inventory()
+        if inventory.rc != 0:
             t = 'error'
             n = self._get_check_name('squashfs_lls')
             s = 'could not list contents of squashfs'
             self._add_result(t, n, s)
             return
-        elif 'lrwxrwxrwx' in out:
+        elif inventory.has_symlinks():
             t = 'info'
             n = self._get_check_name('squashfs_resquash_1555305')
             s = 'cannot reproduce squashfs'
@@ -162,58 +304,35 @@ class SnapReviewSecurity(SnapReview):
             return
         # end LP: #1555305 workaround
 
-        tmpdir = create_tempdir()  # this is autocleaned
-        tmp_unpack = os.path.join(tmpdir, 'squashfs-root')
-        tmp_repack = os.path.join(tmpdir, 'repack.snap')
-
-        curdir = os.getcwd()
-        os.chdir(tmpdir)
-        # ensure we don't alter the permissions from the unsquashfs
-        old_umask = os.umask(000)
-
-        try:
-            (rc, out) = cmd(['unsquashfs', '-d', tmp_unpack, fn])
-            if rc != 0:
-                raise ReviewException("could not unsquash '%s': %s" %
-                                      (os.path.basename(fn), out))
-            (rc, out) = cmd(['mksquashfs', tmp_unpack, tmp_repack,
-                             '-fstime', fstime] + MKSQUASHFS_OPTS)
-            if rc != 0:
-                raise ReviewException("could not mksquashfs '%s': %s" %
-                                      (os.path.relpath(tmp_unpack, tmpdir),
-                                       out))
-        except ReviewException as e:
-            t = 'error'
-            n = self._get_check_name('squashfs_resquash')
-            self._add_result(t, n, str(e))
-            return
-        finally:
-            os.umask(old_umask)
-            os.chdir(curdir)
-
-        # Now calculate the hashes
         t = 'info'
         n = self._get_check_name('squashfs_repack_checksum')
         s = "OK"
 
-        (rc, out) = cmd(['sha512sum', fn])
-        if rc != 0:
+        orig_sum = self.context.get_digest(fn, 'sha512')
+        if orig_sum is None:
             t = 'error'
             s = "could not determine checksum of '%s'" % os.path.basename(fn)
             self._add_result(t, n, s)
             return
-        orig_sum = out.split()[0]
-
-        (rc, out) = cmd(['sha512sum', tmp_repack])
-        if rc != 0:
-            t = 'error'
-            s = "could not determine checksum of '%s'" % \
-                os.path.relpath(tmp_repack, tmpdir)
-            self._add_result(t, n, s)
-            return
-        repack_sum = out.split()[0]
 
-        if orig_sum != repack_sum:
+        # The result only depends on the snap and squashfs-tools so it is
+        # cached with the 'cached' policy
+        version = None
+        if policy == 'cached':
+            version = get_squashfs_tools_version()
+        matches = None
+        if version is not None:
+            matches = read_resquash_cache(orig_sum, version)
+
+        if matches is None:
+            matches = self._resquash_matches(fn, fstime, orig_sum)
+            if matches is None:
+                # an error result was added
+                return
+            if version is not None:
+                write_resquash_cache(orig_sum, version, matches)
+
+        if not matches:
             if 'type' in self.snap_yaml and self.snap_yaml['type'] == 'os':
                 t = 'info'
                 s = 'checksums do not match (expected for os snap)'
@@ -244,50 +363,34 @@ class SnapReviewSecurity(SnapReview):
         if 'type' in self.snap_yaml:
             snap_type = self.snap_yaml['type']
 
-        fn = os.path.abspath(self.pkg_filename)
-
-        (rc, out) = self._unsquashfs_lls(fn)
-        if rc != 0:
+        inventory = self._get_squashfs_inventory()
+        if inventory.rc != 0:
             t = 'error'
             n = self._get_check_name('squashfs_files_unsquash')
             s = 'unsquashfs -lls <snap> failed'
             self._add_result(t, n, s)
             return
 
-        in_header = True
         malformed = []
         errors = []
 
-        fname_pat = re.compile(r'.* squashfs-root')
         date_pat = re.compile(r'^\d\d\d\d-\d\d-\d\d$')
         time_pat = re.compile(r'^\d\d:\d\d$')
-        mknod_pat_full = re.compile(r'.,.')
-        count = 0
-
-        for line in out.splitlines():
-            count += 1
-            if in_header:
-                if len(line) < 1:
-                    in_header = False
-                continue
 
-            tmp = line.split()
-            if len(tmp) < 6:
-                malformed.append("wrong number of fields in '%s'" % line)
+        for entry in inventory.entries:
+            if entry.error is not None:
+                malformed.append(entry.error)
                 continue
 
-            fname = fname_pat.sub('.', line)
-            ftype = tmp[0][0]
-
-            # Also see 'info ls', but we list only the Linux ones
-            ftype = line[0]
+            fname = entry.fname
+            ftype = entry.ftype
             if ftype not in ['b', 'c', 'd', 'l', 'p', 's', '-']:
                 errors.append("unknown type '%s' for entry '%s'" % (ftype,
                                                                     fname))
                 continue
 
             # verify mode
-            mode = tmp[0][1:]
+            mode = entry.mode
             if len(mode) != 9:
                 malformed.append("mode '%s' malformed for '%s'" % (mode,
                                                                    fname))
@@ -320,32 +423,20 @@ class SnapReviewSecurity(SnapReview):
                     continue
 
             # verify user and group
-            if '/' not in tmp[1]:
+            if '/' not in entry.owner:
                 malformed.append("user/group '%s' malformed for '%s'" %
-                                 (tmp[1], fname))
+                                 (entry.owner, fname))
                 continue
-            (user, group) = tmp[1].split('/')
+            (user, group) = entry.owner.split('/')
             # we enforce 'root/root'
             if snap_type != 'os' and (user != 'root' or group != 'root'):
-                errors.append("unusual user/group '%s' for '%s'" % (tmp[1],
-                                                                    fname))
+                errors.append("unusual user/group '%s' for '%s'" %
+                              (entry.owner, fname))
                 continue
 
-            date_idx = 3
-            time_idx = 4
             if ftype == 'b' or ftype == 'c':
-                # Account for unsquashfs -lls doing:
-                # crw-rw-rw- root/root             1,  8 2016-08-09 ...
-                # crw-rw---- root/root            10,141 2016-08-09 ...
-
-                if mknod_pat_full.search(tmp[2]):
-                    (major, minor) = tmp[2].split(',')
-                else:
-                    date_idx = 4
-                    time_idx = 5
-                    major = tmp[2][:-1]
-                    minor = tmp[3]
-
+                major = entry.major
+                minor = entry.minor
                 try:
                     int(major)
                 except ValueError:
@@ -357,7 +448,7 @@ class SnapReviewSecurity(SnapReview):
                     malformed.append("minor '%s' malformed for '%s'" %
                                      (minor, fname))
             else:
-                size = tmp[2]
+                size = entry.size
                 try:
                     int(size)
                 except ValueError:
@@ -365,19 +456,19 @@ class SnapReviewSecurity(SnapReview):
                                                                        fname))
                     continue
 
-            date = tmp[date_idx]
+            date = entry.date
             if not date_pat.search(date):
                 malformed.append("date '%s' malformed for '%s'" % (date,
                                                                    fname))
                 continue
 
-            time = tmp[time_idx]
+            time = entry.time
             if not time_pat.search(time):
                 malformed.append("time '%s' malformed for '%s'" % (time,
                                                                    fname))
                 continue
 
-        if count < 4:
+        if inventory.count < 4:
             t = 'error'
             n = self._get_check_name('squashfs_files_malformed output')
             s = "unsquashfs -lls ouput too short"
@@ -0,0 +1,72 @@
+'''streaming.py: write the results of the reviews as they are added'''
+#
+# Copyright (C) 2018 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import sys
+
+# The ResultEmitter the results are written to as the checks add them, None
+# when not streaming them
+EMITTER = None
+
+
+class ResultEmitter(object):
+    '''Write each result as a line of compact json as soon as it is added,
+       then a summary line:
+
+         {"section": ..., "result_type": ..., "name": ..., "text": ...,
+          "manual_review": ..., ["link": ...]}
+         {"summary": {...}}
+
+       A check may add a result with the same name more than once, in which
+       case the last line is what ends up in the report.
+    '''
+    def __init__(self, output=None):
+        if output is None:
+            output = sys.stdout
+        self.output = output
+        # the report section of the results being added
+        self.section = None
+
+    def _write(self, line):
+        self.output.write(json.dumps(line, sort_keys=True) + '\n')
+        # whoever reads this may act on each line as it arrives
+        self.output.flush()
+
+    def emit(self, result_type, name, result):
+        '''Write the result 'name' of type result_type'''
+        line = dict(result)
+        line.update({'section': self.section,
+                     'result_type': result_type,
+                     'name': name})
+        self._write(line)
+
+    def emit_report(self, section, report):
+        '''Write all the results of the report of section, for those not
+           written as they were added'''
+        self.section = section
+        for result_type in ['error', 'warn', 'info']:
+            for name in sorted(report.get(result_type, {})):
+                self.emit(result_type, name, report[result_type][name])
+
+    def summary(self, summary):
+        '''Write the summary line'''
+        self._write({'summary': summary})
+
+
+def emit(result_type, name, result):
+    '''Write the result 'name' of type result_type if streaming'''
+    if EMITTER is not None:
+        EMITTER.emit(result_type, name, result)
@@ -0,0 +1,156 @@
+'''test_click_review.py: tests for the click-review commands'''
+#
+# Copyright (C) 2018 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from clickreviews.tests import utils
+
+TOP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
+
+
+def start_bin(name, args, home=None, **kwargs):
+    '''Start bin/name with this tree's clickreviews, and home as HOME (for
+       the caches) if given'''
+    env = dict(os.environ)
+    env['PYTHONPATH'] = TOP_DIR
+    if home is not None:
+        env['HOME'] = home
+    cmd = [sys.executable, os.path.join(TOP_DIR, 'bin', name)] + args
+    kwargs.setdefault('stderr', subprocess.DEVNULL)
+    return subprocess.Popen(cmd, env=env, universal_newlines=True, **kwargs)
+
+
+def run_bin(name, args, home=None):
+    '''Run bin/name with this tree's clickreviews, returning its
+       (rc, stdout)'''
+    p = start_bin(name, args, home=home, stdout=subprocess.PIPE)
+    out = p.communicate()[0]
+    return (p.returncode, out)
+
+
+def review(pkg_fn):
+    '''Return what click-review --batch prints for pkg_fn when it is the
+       only package reviewed'''
+    (rc, out) = run_bin('click-review', ['--no-cache', '--json', pkg_fn])
+    return {'filename': pkg_fn, 'rc': rc, 'results': json.loads(out)}
+
+
+class ClickReviewTestCase(TestCase):
+    """Tests for reviewing packages with click-review."""
+    def mkdtemp(self):
+        """Create a temp dir which is cleaned up after test."""
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        return tmp_dir
+
+    def test_batch_snap_then_snap1(self):
+        '''Test --batch reviewing a snap v1 package after a squashfs snap'''
+        snap = utils.make_snap2(output_dir=self.mkdtemp())
+        snap1 = utils.make_snap1_hashes(output_dir=self.mkdtemp())
+        batch_list = os.path.join(self.mkdtemp(), 'list')
+        with open(batch_list, 'w') as f:
+            f.write('%s\n%s\n' % (snap, snap1))
+
+        (rc, out) = run_bin('click-review', ['--no-cache', '--batch',
+                                             batch_list])
+        lines = [json.loads(line) for line in out.splitlines()]
+
+        self.assertEqual([x['filename'] for x in lines], [snap, snap1])
+        # the snap v1 package got its own raw unpack to hash
+        expected = review(snap1)
+        errors = expected['results']['click,snap.v1_lint']['error']
+        self.assertNotIn("!= 'None'",
+                         errors['lint:hashes_archive-sha512_valid']['text'])
+        self.assertEqual(lines[1], expected)
+
+    def test_cached_fail_fast(self):
+        '''Test --fail-fast with the results cached'''
+        snap1 = utils.make_snap1_hashes(output_dir=self.mkdtemp())
+        home = self.mkdtemp()
+        (rc, out) = run_bin('click-review', ['--no-cache', '--json',
+                                             '--fail-fast', snap1])
+        expected = json.loads(out)
+
+        # cache the results of all the checks
+        run_bin('click-review', ['--json', snap1], home=home)
+        self.assertNotEqual(os.listdir(os.path.join(
+            home, '.cache/click-reviewers-tools/results')), [])
+        (rc, out) = run_bin('click-review', ['--json', '--fail-fast', snap1],
+                            home=home)
+
+        # the modules after the one with the error are not reported
+        self.assertEqual(sorted(json.loads(out)), sorted(expected))
+        self.assertIn('lint:hashes_archive-sha512_valid',
+                      json.loads(out)['click,snap.v1_lint']['error'])
+
+    def test_lazy_unpack_jobs(self):
+        '''Test --lazy-unpack with --jobs'''
+        click = utils.make_click(output_dir=self.mkdtemp())
+        p = start_bin('click-review', ['--lazy-unpack', '--jobs', '2',
+                                       click],
+                      stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        (out, err) = p.communicate()
+        self.assertEqual(p.returncode, 2)
+        self.assertEqual(out, '')
+        self.assertIn("--lazy-unpack can't be used with --jobs", err)
+
+
+class ClickReviewServerTestCase(TestCase):
+    """Tests for reviewing packages with click-review-server."""
+    def mkdtemp(self):
+        """Create a temp dir which is cleaned up after test."""
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        return tmp_dir
+
+    def _start_server(self, args):
+        '''Start the server and return the path of its socket'''
+        sock_fn = os.path.join(self.mkdtemp(), 'socket')
+        p = start_bin('click-review-server', args + [sock_fn])
+        self.addCleanup(p.wait)
+        self.addCleanup(p.terminate)
+        for i in range(300):
+            if os.path.exists(sock_fn):
+                break
+            time.sleep(0.1)
+        return sock_fn
+
+    def test_review_snap_then_snap1(self):
+        '''Test a worker reviewing a snap v1 package after a squashfs snap'''
+        snap = utils.make_snap2(output_dir=self.mkdtemp())
+        snap1 = utils.make_snap1_hashes(output_dir=self.mkdtemp())
+        # one worker reviews both packages
+        sock_fn = self._start_server(['--workers', '1'])
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.connect(sock_fn)
+            with s.makefile('rw') as f:
+                lines = []
+                for pkg_fn in [snap, snap1]:
+                    f.write(json.dumps({'filename': pkg_fn}) + '\n')
+                    f.flush()
+                    lines.append(json.loads(f.readline()))
+
+        self.assertEqual([x['filename'] for x in lines], [snap, snap1])
+        self.assertEqual(lines[1], review(snap1))
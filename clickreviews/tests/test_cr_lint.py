@@ -17,12 +17,24 @@
 from unittest import TestCase
 from unittest.mock import patch
 
-from clickreviews.common import cleanup_unpack
+from clickreviews.common import (
+    build_file_index,
+    cleanup_unpack,
+    ContentScanner,
+    FILE_INDEX_VERSION,
+    find_in_file,
+    PackageContext,
+    PathMatcher,
+    read_file_index,
+)
+from clickreviews.cr_functional import ClickReviewFunctional
 from clickreviews.cr_lint import ClickReviewLint
 from clickreviews.cr_lint import MINIMUM_CLICK_FRAMEWORK_VERSION
 from clickreviews.tests import utils
 import clickreviews.cr_tests as cr_tests
 
+import hashlib
+import json
 import os
 import shutil
 import stat
@@ -1994,3 +2006,315 @@ class ClickReviewLintTestCase(TestCase):
 
         errors = list(c.click_report['error'].keys())
         self.assertEqual(errors, ['lint:dot_click'])
+
+    def test_shared_context(self):
+        '''Test reviews sharing a PackageContext'''
+        package = utils.make_click(extra_files=['some/file'],
+                                   output_dir=self.mkdtemp())
+        context = PackageContext(package)
+        c = ClickReviewLint(package, context=context)
+        c2 = ClickReviewFunctional(package, context=context)
+
+        self.assertEqual(c.unpack_dir, c2.unpack_dir)
+        self.assertEqual(c.pkg_files, c2.pkg_files)
+        self.assertIn(os.path.join(c.unpack_dir, 'some/file'), c.pkg_files)
+        self.assertEqual(c.manifest, c2.manifest)
+
+        # each review gets its own copy of what is shared
+        c.pkg_files.append('extrafile')
+        self.assertNotIn('extrafile', c2.pkg_files)
+        c.manifest['name'] = 'changed'
+        self.assertNotEqual(c.manifest, c2.manifest)
+
+    def test_check_vcs(self):
+        '''Test check_vcs() - directories and files'''
+        package = utils.make_click(extra_files=['.git/', '.bzrignore',
+                                                'CVS/Root', 'some/.hg/',
+                                                'some/.gitignore'],
+                                   output_dir=self.mkdtemp())
+        c = ClickReviewLint(package)
+
+        c.check_vcs()
+
+        m = c.click_report['warn']['lint:vcs_files']['text']
+        self.assertEqual(m, 'found VCS files in package: .bzrignore, .git, '
+                            'CVS')
+
+    def test_shared_context_needs(self):
+        '''Test PackageContext() - what the reviews need'''
+        package = utils.make_click(extra_files=['some/file'],
+                                   output_dir=self.mkdtemp())
+        context = PackageContext(package, needs=['binaries'])
+        self.assertIsNone(context.raw_unpack_dir)
+        self.assertIsNotNone(context.unpack_dir)
+        cleanup_unpack()
+
+        context = PackageContext(package, needs=['raw_unpack'])
+        self.assertTrue(os.path.exists(os.path.join(context.raw_unpack_dir,
+                                                    'debian-binary')))
+
+    def test_list_all_symlinks(self):
+        '''Test PackageContext.list_all_symlinks()'''
+        package = utils.make_click(extra_files=['bin/foo', 'lib/',
+                                                'bin/foo,bin/link',
+                                                'lib,dirlink'],
+                                   output_dir=self.mkdtemp())
+        context = PackageContext(package)
+        link = os.path.join(context.unpack_dir, 'bin/link')
+        # symlinks to directories aren't in the file list either
+        self.assertEqual(context.list_all_symlinks(), {link: 'bin/foo'})
+        self.assertIn(link, context.list_all_files())
+        self.assertNotIn(os.path.join(context.unpack_dir, 'dirlink'),
+                         context.list_all_files())
+
+    def test_path_matcher(self):
+        '''Test PathMatcher()'''
+        matcher = PathMatcher({'a': ['^foo', 'bar$'], 'b': [r'\.swp$']})
+        self.assertEqual(matcher.match('foo.swp'), set(['a', 'b']))
+        self.assertEqual(matcher.match('xbar'), set(['a']))
+        self.assertEqual(matcher.match('xfoo'), set())
+        self.assertEqual(matcher.match('.x.swp'), set(['b']))
+
+    def test_list_all_compiled_binaries(self):
+        '''Test _list_all_compiled_binaries()'''
+        # 64-bit little endian ELF executable header
+        header = b'\x7fELF\x02\x01\x01' + b'\x00' * 9
+        header += b'\x02\x00\x3e\x00\x01'
+        elf = self._write_file(header + b'\x00' * (64 - len(header)))
+        notelf = self._write_file(b'\x00\x01\x02\x03')
+        package = utils.make_click(extra_files=['%s:bin/a' % elf,
+                                                '%s:bin/b' % notelf,
+                                                'bin/a,bin/link',
+                                                'some/file'],
+                                   output_dir=self.mkdtemp())
+        context = PackageContext(package)
+        c = ClickReviewLint(package, context=context)
+        self.assertEqual(c.pkg_bin_files,
+                         [os.path.join(c.unpack_dir, 'bin/a')])
+
+        # the other reviews reuse the result
+        with patch.object(context, 'get_mime_type') as m:
+            c2 = ClickReviewFunctional(package, context=context)
+        self.assertFalse(m.called)
+        self.assertEqual(c2.pkg_bin_files, c.pkg_bin_files)
+
+    def _write_md5sums(self, c, content):
+        with open(c.control_files["md5sums"], 'w') as f:
+            f.write(content)
+
+    def test_check_md5sums(self):
+        '''Test check_md5sums() - good sums'''
+        package = utils.make_click(extra_files=['some/file'],
+                                   output_dir=self.mkdtemp())
+        c = ClickReviewLint(package)
+        self._write_md5sums(c, "%s  some/file\n" %
+                            hashlib.md5(b'').hexdigest())
+
+        c.check_md5sums()
+
+        self.assertEqual(list(c.click_report['error'].keys()), [])
+        self.assertEqual(list(c.click_report['info'].keys()),
+                         ['lint:md5sums'])
+
+    def test_check_md5sums_bad(self):
+        '''Test check_md5sums() - bad and missing sums'''
+        package = utils.make_click(extra_files=['some/file'],
+                                   output_dir=self.mkdtemp())
+        c = ClickReviewLint(package)
+        self._write_md5sums(c, "%s  some/file\n%s  nonexistent\n" %
+                            (hashlib.md5(b'foo').hexdigest(),
+                             hashlib.md5(b'').hexdigest()))
+
+        c.check_md5sums()
+
+        m = c.click_report['error']['lint:md5sums']['text']
+        self.assertIn("some/file", m)
+        self.assertIn("nonexistent", m)
+
+    def test_get_digests(self):
+        '''Test PackageContext.get_digests()'''
+        package = utils.make_click(extra_files=['some/file'],
+                                   output_dir=self.mkdtemp())
+        context = PackageContext(package)
+        fn = os.path.join(context.unpack_dir, 'some/file')
+        missing = os.path.join(context.unpack_dir, 'nonexistent')
+
+        digests = context.get_digests([fn, missing], 'sha512')
+
+        self.assertEqual(digests[fn], hashlib.sha512(b'').hexdigest())
+        self.assertIsNone(digests[missing])
+        self.assertEqual(context.get_digest(fn, 'sha512'), digests[fn])
+
+    def _write_file(self, content):
+        fn = os.path.join(self.mkdtemp(), 'file')
+        with open(fn, 'wb') as f:
+            f.write(content)
+        return fn
+
+    def test_check_contents_for_hardcoded_paths(self):
+        '''Test check_contents_for_hardcoded_paths()'''
+        text = self._write_file(b'#!/bin/sh\n/opt/click.ubuntu.com/foo\n')
+        binary = self._write_file(b'\x7fELF\x00/opt/click.ubuntu.com/foo')
+        package = utils.make_click(extra_files=['%s:bin/a' % text,
+                                                '%s:bin/b' % text,
+                                                '%s:lib/c' % binary,
+                                                'bin/d'],
+                                   output_dir=self.mkdtemp())
+        c = ClickReviewLint(package)
+
+        c.check_contents_for_hardcoded_paths()
+
+        m = c.click_report['error']['lint:hardcoded_paths']['text']
+        self.assertIn("'bin/a'", m)
+        self.assertIn("'bin/b'", m)
+        self.assertNotIn("'lib/c'", m)
+        self.assertNotIn("'bin/d'", m)
+
+    def test_content_scanner(self):
+        '''Test ContentScanner() - overlapping strings'''
+        fn = self._write_file(b'foo /usr/lib/bar baz')
+        scanner = ContentScanner(['/usr', '/usr/lib', 'r/lib/b', 'nomatch'])
+        self.assertEqual(scanner.scan(fn), set(['/usr', '/usr/lib',
+                                                'r/lib/b']))
+
+    def test_content_scanner_across_blocks(self):
+        '''Test ContentScanner() - match spanning two blocks'''
+        fn = self._write_file(b'0123/usr/lib/bar')
+        scanner = ContentScanner(['/usr/lib'])
+        with patch('clickreviews.common.SCAN_BUFSIZE', 6):
+            self.assertEqual(scanner.scan(fn), set(['/usr/lib']))
+
+    def test_content_scanner_binary(self):
+        '''Test ContentScanner() - binary and missing files'''
+        fn = self._write_file(b'\x00\x01/usr/lib')
+        scanner = ContentScanner(['/usr/lib'])
+        self.assertIsNone(scanner.scan(fn))
+        self.assertIsNone(scanner.scan(fn + '.nonexistent'))
+
+    def test_find_in_file(self):
+        '''Test find_in_file()'''
+        fn = self._write_file(b'\x7fELF\x00\x01_ZN9QSettingsC1Ev\x00')
+        self.assertEqual(find_in_file(fn, [b'nomatch', b'QSettings']),
+                         b'QSettings')
+        self.assertIsNone(find_in_file(fn, [b'nomatch']))
+
+    def test_find_in_file_empty(self):
+        '''Test find_in_file() - empty and missing files'''
+        fn = self._write_file(b'')
+        self.assertIsNone(find_in_file(fn, [b'QSettings']))
+        self.assertIsNone(find_in_file(fn + '.nonexistent', [b'QSettings']))
+
+    def _make_baseline_click(self, content):
+        # 64-bit little endian ELF executable header
+        header = b'\x7fELF\x02\x01\x01' + b'\x00' * 9
+        header += b'\x02\x00\x3e\x00\x01'
+        elf = self._write_file(header + b'\x00' * (64 - len(header)))
+        data = self._write_file(content)
+        return utils.make_click(extra_files=['%s:bin/a' % elf,
+                                             '%s:some/file' % data],
+                                output_dir=self.mkdtemp())
+
+    def test_file_index(self):
+        '''Test PackageContext.get_file_index()'''
+        package = self._make_baseline_click(b'one')
+        context = PackageContext(package)
+        ClickReviewLint(package, context=context)
+        context.find_in_file(os.path.join(context.unpack_dir, 'bin/a'),
+                             [b'QSettings'])
+        context.scan_file(os.path.join(context.unpack_dir, 'some/file'),
+                          ContentScanner(['on', 'off']))
+
+        index = context.get_file_index()
+        self.assertEqual(index['version'], FILE_INDEX_VERSION)
+        entry = index['files']['some/file']
+        self.assertEqual(entry['size'], 3)
+        self.assertEqual(entry['digests']['sha256'],
+                         hashlib.sha256(b'one').hexdigest())
+        self.assertNotIn('mime', entry)
+        self.assertEqual(entry['scans'],
+                         [[[b'off'.hex(), b'on'.hex()], ['on']]])
+        entry = index['files']['bin/a']
+        self.assertIn('mime', entry)
+        self.assertEqual(entry['found'], [[[b'QSettings'.hex()], None]])
+
+    def test_use_baseline(self):
+        '''Test PackageContext.use_baseline()'''
+        package = self._make_baseline_click(b'one')
+        context = PackageContext(package)
+        c = ClickReviewLint(package, context=context)
+        c.check_md5sums()
+        context.get_digest(os.path.join(c.unpack_dir, 'bin/a'), 'md5')
+        scanner = ContentScanner(['/opt/click.ubuntu.com/'])
+        index = context.get_file_index()
+        index['files']['bin/a']['found'] = [[[b'QSettings'.hex()],
+                                             b'QSettings'.hex()]]
+        index['files']['bin/a']['scans'] = [[[x.hex() for x in
+                                              scanner.strings],
+                                             ['/opt/click.ubuntu.com/']]]
+        cleanup_unpack()
+
+        package = self._make_baseline_click(b'two')
+        context = PackageContext(package)
+        context.use_baseline(index)
+        bin_fn = os.path.join(context.unpack_dir, 'bin/a')
+        # the content scan of the unchanged binary is reused once its sha256
+        # is found to be the same
+        with patch.object(scanner, 'scan') as m:
+            self.assertEqual(context.scan_file(bin_fn, scanner),
+                             set(['/opt/click.ubuntu.com/']))
+        self.assertFalse(m.called)
+        self.assertEqual(context.get_digest(bin_fn, 'sha256'),
+                         index['files']['bin/a']['digests']['sha256'])
+        # and so are its libmagic type and md5
+        with patch('clickreviews.common.magic.open') as m:
+            c = ClickReviewLint(package, context=context)
+        self.assertFalse(m.called)
+        self.assertEqual(c.pkg_bin_files, [bin_fn])
+        self.assertEqual(context.find_in_file(bin_fn, [b'QSettings']),
+                         b'QSettings')
+        with patch('clickreviews.common.get_file_digest') as m:
+            self.assertEqual(context.get_digest(bin_fn, 'md5'),
+                             index['files']['bin/a']['digests']['md5'])
+        self.assertFalse(m.called)
+        # the changed file isn't
+        some_fn = os.path.join(c.unpack_dir, 'some/file')
+        self.assertEqual(context.get_digest(some_fn, 'md5'),
+                         hashlib.md5(b'two').hexdigest())
+        c.check_md5sums()
+        self.assertEqual(c.click_report['error'], {})
+
+    def test_use_baseline_not_needed(self):
+        '''Test PackageContext.use_baseline() - files only compared when
+           needed'''
+        package = self._make_baseline_click(b'one')
+        index = build_file_index(package)
+        cleanup_unpack()
+
+        package = self._make_baseline_click(b'one')
+        context = PackageContext(package)
+        context.use_baseline(index)
+        # libmagic costs less than comparing the files
+        ClickReviewLint(package, context=context)
+        self.assertEqual(context.digests, {})
+        self.assertIn(os.path.join(context.unpack_dir, 'bin/a'),
+                      context.baseline)
+
+    def test_use_baseline_bad_version(self):
+        '''Test PackageContext.use_baseline() - unsupported version'''
+        package = self._make_baseline_click(b'one')
+        context = PackageContext(package)
+        context.use_baseline({'version': FILE_INDEX_VERSION + 1,
+                              'files': {'some/file': {}}})
+        self.assertEqual(context.baseline, {})
+
+    def test_build_file_index(self):
+        '''Test build_file_index() and read_file_index()'''
+        package = self._make_baseline_click(b'one')
+        index = build_file_index(package)
+        self.assertIn('some/file', index['files'])
+        self.assertIn('mime', index['files']['bin/a'])
+        self.assertNotIn('mime', index['files']['some/file'])
+
+        self.assertIsNone(read_file_index(package))
+        fn = self._write_file(json.dumps(index).encode('UTF-8'))
+        self.assertEqual(read_file_index(fn), index)
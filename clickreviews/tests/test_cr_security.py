@@ -17,6 +17,7 @@
 from __future__ import print_function
 import sys
 
+from clickreviews.apparmor_policy import build_policy_index
 from clickreviews.cr_security import ClickReviewSecurity
 import clickreviews.cr_tests as cr_tests
 
@@ -2380,3 +2381,47 @@ class TestClickReviewSecurity(cr_tests.TestClickReview):
         report = c.click_report
         expected_counts = {'info': None, 'warn': 1, 'error': 0}
         self.check_results(report, expected_counts)
+
+    def test_aa_policy_shared(self):
+        '''Test the apparmor policy is shared and not modified'''
+        overrides = {'framework': {'nonexistent': {'state': 'available',
+                                                   'policy_vendor': 'foo',
+                                                   'policy_version': 9.9},
+                                   'nonexistent2': {'state': 'available',
+                                                    'policy_vendor': 'ubuntu',
+                                                    'policy_version': 9.9}}}
+        c = ClickReviewSecurity(self.test_name, overrides=overrides)
+        c2 = ClickReviewSecurity(self.test_name)
+        self.assertIs(c.aa_policy_index, c2.aa_policy_index)
+        self.assertIn('9.9', c.aa_policy['ubuntu'])
+        self.assertNotIn('9.9', c2.aa_policy['ubuntu'])
+        self.assertNotIn('foo', c2.aa_policy)
+
+    def test_aa_policy_lookups(self):
+        '''Test the apparmor policy lookups'''
+        policy = {'ubuntu': {'1.3': {
+            'templates': {'common': ['ubuntu-sdk', 'default'],
+                          'reserved': ['unconfined']},
+            'policy_groups': {'common': ['networking', 'audio'],
+                              'reserved': ['debug', 'audio']}}}}
+        c = ClickReviewSecurity(self.test_name)
+        c.aa_policy = policy
+        c.aa_policy_index = build_policy_index(policy)
+
+        self.assertEqual(c._get_templates('ubuntu', '1.3'),
+                         ['default', 'ubuntu-sdk', 'unconfined'])
+        self.assertEqual(c._get_templates('ubuntu', '1.3', 'common'),
+                         ['default', 'ubuntu-sdk'])
+        self.assertEqual(c._get_template_type('ubuntu', '1.3', 'unconfined'),
+                         'reserved')
+        self.assertEqual(c._get_template_type('ubuntu', '1.3', 'foo'), None)
+        self.assertEqual(c._get_policy_groups('ubuntu', 1.3),
+                         ['audio', 'audio', 'debug', 'networking'])
+        self.assertEqual(c._get_policy_groups('ubuntu', 1.3, 'reserved'),
+                         ['audio', 'debug'])
+        self.assertEqual(c._get_policy_groups('nonexistent', 1.3), [])
+        # the first type is used
+        self.assertEqual(c._get_policy_group_type('ubuntu', '1.3', 'audio'),
+                         'common')
+        self.assertEqual(c._get_policy_group_type('ubuntu', '1.3', 'foo'),
+                         None)
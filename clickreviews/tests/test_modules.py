@@ -1,4 +1,4 @@
-from clickreviews import modules, cr_tests
+from clickreviews import common, modules, cr_tests, profiling
 import clickreviews
 import glob
 
@@ -28,3 +28,161 @@ class TestModules(cr_tests.TestClickReview):
         self.assertEqual(count, len(self.modules),
                          'Not all files in clickreviews/[cs]r_*.py contain '
                          'classes named Click|Snap*Review.')
+
+    def test_find_main_class_cached(self):
+        '''Test that modules are only loaded once'''
+        module_name = self.modules[0]
+        review = modules.find_main_class(module_name)
+        self.assertIn(module_name, modules.MAIN_CLASSES)
+        self.assertIs(modules.find_main_class(module_name), review)
+
+    def test_run_module_checks_profile(self):
+        '''Test run_module_checks() - profiling'''
+        self.addCleanup(setattr, profiling, 'PROFILER', None)
+        profiling.PROFILER = profiling.Profiler()
+        (module, report, tb) = modules.run_module_checks('cr_skeleton',
+                                                         self.test_name)
+        self.assertIsNone(tb)
+        profile = profiling.PROFILER.report()
+        self.assertIn('ClickReviewSkeleton.__init__', profile)
+        self.assertEqual(profile['ClickReviewSkeleton.check_foo']['calls'], 1)
+        for k in ['wall', 'cpu', 'children_cpu', 'subprocesses',
+                  'maxrss_delta_kb']:
+            self.assertIn(k, profile['ClickReviewSkeleton.check_foo'])
+
+    def test_profile_subprocesses(self):
+        '''Test Profiler() - subprocesses'''
+        profiler = profiling.Profiler()
+        self.addCleanup(setattr, profiling, 'PROFILER', None)
+        profiling.PROFILER = profiler
+        profiler.run('test', common.cmd, ['true'])
+        profiler.run('test', common.cmd, ['true'])
+        self.assertEqual(profiler.report()['test']['subprocesses'], 2)
+        self.assertEqual(profiler.report()['test']['calls'], 2)
+
+    def test_run_module_checks_stop_after(self):
+        '''Test run_module_checks() - the remaining checks are cancelled'''
+        self.addCleanup(setattr, common, 'STOP_POLICY', None)
+        common.STOP_POLICY = common.StopPolicy(['warn'])
+        (module, report, tb) = modules.run_module_checks('cr_skeleton',
+                                                         self.test_name)
+        self.assertIsNone(tb)
+        # checks are run in alphabetical order
+        self.assertEqual(common.STOP_POLICY.stopped_by, 'skeleton:bar')
+        self.assertIn('skeleton:bar', report['error'])
+        self.assertEqual(report['warn'], {})
+        self.assertNotIn('skeleton:foo', report['info'])
+        self.assertNotIn('skeleton:foo', report['error'])
+
+    def test_stop_policy(self):
+        '''Test StopPolicy()'''
+        ok = {'text': 'OK', 'manual_review': False}
+        manual = {'text': 'bad', 'manual_review': True}
+        policy = common.StopPolicy(['error'])
+        self.assertTrue(policy.match('error', 'lint:a', ok))
+        self.assertFalse(policy.match('warn', 'lint:a', ok))
+        self.assertFalse(policy.match('info', 'lint:a', ok))
+
+        policy = common.StopPolicy(['warn'])
+        self.assertTrue(policy.match('error', 'lint:a', ok))
+        self.assertTrue(policy.match('warn', 'lint:a', ok))
+
+        policy = common.StopPolicy(['manual_review', 'lint:b'])
+        self.assertFalse(policy.match('error', 'lint:a', ok))
+        self.assertTrue(policy.match('error', 'lint:a', manual))
+        self.assertTrue(policy.match('error', 'lint:b:app', ok))
+        self.assertFalse(policy.match('warn', 'lint:b', ok))
+
+        # the first result matching stops the review
+        policy.add_report({'info': {},
+                           'warn': {'lint:b': ok},
+                           'error': {'lint:c': manual, 'lint:b': ok}})
+        self.assertEqual(policy.stopped_by, 'lint:b')
+        policy.add_result('error', 'lint:d', manual)
+        self.assertEqual(policy.stopped_by, 'lint:b')
+        policy.reset()
+        self.assertIsNone(policy.stopped_by)
+
+    def test_check_filter(self):
+        '''Test CheckFilter()'''
+        f = common.CheckFilter(only=['lint:*', 'security:check_*'],
+                               skip=['lint:vcs*'])
+        self.assertTrue(f.match('lint:dot_click'))
+        self.assertTrue(f.match('lint:hooks:app'))
+        self.assertFalse(f.match('lint:vcs_files'))
+        self.assertTrue(f.match('security:check_x:app'))
+        self.assertFalse(f.match('security:policy_version'))
+        self.assertTrue(f.may_match('lint'))
+        self.assertTrue(f.may_match('security'))
+        self.assertFalse(f.may_match('desktop'))
+
+        f = common.CheckFilter(skip=['desktop:*', 'lint:vcs*'])
+        self.assertTrue(f.match('security:policy_version'))
+        self.assertFalse(f.match('desktop:files_usable'))
+        self.assertFalse(f.may_match('desktop'))
+        self.assertTrue(f.may_match('lint'))
+
+        # patterns without review_type may match any review class
+        f = common.CheckFilter(only=['*vcs*'])
+        self.assertTrue(f.may_match('desktop'))
+        self.assertTrue(f.match('lint-snap-v2:vcs_files'))
+
+    def test_select_modules(self):
+        '''Test select_modules()'''
+        self.assertEqual(modules.select_modules(self.modules), self.modules)
+        selected = modules.select_modules(
+            self.modules, common.CheckFilter(only=['lint:*',
+                                                   'lint-snap-v2:*']))
+        self.assertEqual(selected, ['cr_lint', 'sr_lint'])
+        selected = modules.select_modules(
+            self.modules, common.CheckFilter(skip=['lint:*']))
+        self.assertNotIn('cr_lint', selected)
+        self.assertIn('sr_lint', selected)
+
+    def test_get_needs(self):
+        '''Test get_needs() and get_job_order()'''
+        self.assertEqual(modules.get_needs('cr_lint'),
+                         ['raw_unpack', 'binaries'])
+        self.assertEqual(modules.get_needs('cr_desktop'), [])
+        self.assertEqual(modules.get_needs('sr_security'), ['network_data'])
+        for module in self.modules:
+            for need in modules.get_needs(module):
+                self.assertIn(need, common.REVIEW_RESOURCES)
+
+        order = modules.get_job_order(['cr_desktop', 'cr_functional',
+                                       'cr_lint'])
+        self.assertEqual(order, ['cr_lint', 'cr_functional', 'cr_desktop'])
+
+    def test_run_module_checks_check_filter(self):
+        '''Test run_module_checks() - results not selected'''
+        self.addCleanup(setattr, common, 'CHECK_FILTER', None)
+        common.CHECK_FILTER = common.CheckFilter(skip=['skeleton:ba*'])
+        (module, report, tb) = modules.run_module_checks('cr_skeleton',
+                                                         self.test_name)
+        self.assertIsNone(tb)
+        names = [n for t in report for n in report[t]]
+        self.assertIn('skeleton:foo', names)
+        self.assertNotIn('skeleton:bar', names)
+        self.assertNotIn('skeleton:baz', names)
+
+    def test_summarise_results(self):
+        '''Test summarise_results() and get_rc()'''
+        results = {'one': {'error': {}, 'warn': {'a': {'text': 'meh'}},
+                           'info': {'b': {'text': 'OK'}}},
+                   'two': {'error': {}, 'warn': {},
+                           'info': {'c': {'text': 'OK'}}}}
+        summary = modules.summarise_results(results)
+        self.assertEqual(summary['error'], {})
+        self.assertEqual(summary['warn'], {'a': {'text': 'meh'}})
+        self.assertEqual(sorted(summary['info']), ['b', 'c'])
+        self.assertEqual(modules.get_rc(summary['error'], summary['warn']),
+                         3)
+
+        results['two']['error']['d'] = {'text': 'bad'}
+        summary = modules.summarise_results(results)
+        self.assertEqual(modules.get_rc(summary['error'], summary['warn']),
+                         2)
+        # runtime errors win
+        self.assertEqual(modules.get_rc(summary['error'], summary['warn'],
+                                        1), 1)
+        self.assertEqual(modules.get_rc({}, {}), 0)
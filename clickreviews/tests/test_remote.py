@@ -1,8 +1,16 @@
+import os
+import shutil
+import tempfile
 import time
 from unittest import TestCase
 from unittest.mock import patch
 
-from clickreviews.remote import UPDATE_INTERVAL, _update_is_necessary
+from clickreviews.remote import (
+    CR_FILE_CACHE,
+    UPDATE_INTERVAL,
+    _update_is_necessary,
+    read_cr_file,
+)
 
 
 class RemoteTestCase(TestCase):
@@ -36,3 +44,79 @@ class RemoteTestCase(TestCase):
         self.mock_path.getmtime.return_value = now - UPDATE_INTERVAL - 10
 
         self.assertTrue(_update_is_necessary('some-file'))
+
+    def test_read_cr_file_cached(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        fn = os.path.join(tmp_dir, 'some-file.json')
+        with open(fn, 'w') as f:
+            f.write('{"foo": ["bar"]}')
+
+        d = read_cr_file(None, None, local_copy_fn=fn)
+        self.assertEqual(d, {'foo': ['bar']})
+
+        # callers get their own copy
+        d['foo'].append('baz')
+        with patch('clickreviews.remote.json.loads') as mock_loads:
+            d = read_cr_file(None, None, local_copy_fn=fn)
+            self.assertFalse(mock_loads.called)
+        self.assertEqual(d, {'foo': ['bar']})
+
+        # reparsed when the file changes
+        with open(fn, 'w') as f:
+            f.write('{"foo": ["bar", "norf"]}')
+        d = read_cr_file(None, None, local_copy_fn=fn)
+        self.assertEqual(d, {'foo': ['bar', 'norf']})
+
+    def test_read_cr_file_shared(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        fn = os.path.join(tmp_dir, 'some-file.json')
+        with open(fn, 'w') as f:
+            f.write('{"foo": ["bar"]}')
+
+        d = read_cr_file(None, None, local_copy_fn=fn, copy_data=False)
+        self.assertEqual(d, {'foo': ['bar']})
+        self.assertIs(read_cr_file(None, None, local_copy_fn=fn,
+                                   copy_data=False), d)
+        self.assertIsNot(read_cr_file(None, None, local_copy_fn=fn), d)
+
+    def test_read_cr_file_yaml_compiled(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        p = patch('clickreviews.remote.COMPILED_DIR',
+                  os.path.join(tmp_dir, 'compiled'))
+        p.start()
+        self.addCleanup(p.stop)
+        fn = os.path.join(tmp_dir, 'some-file.yaml')
+        with open(fn, 'w') as f:
+            f.write('foo:\n- bar\n')
+
+        d = read_cr_file(None, None, local_copy_fn=fn, as_yaml=True)
+        self.assertEqual(d, {'foo': ['bar']})
+        self.assertEqual(len(os.listdir(os.path.join(tmp_dir, 'compiled'))),
+                         1)
+
+        # the compiled form is used when the file is read by another
+        # process
+        CR_FILE_CACHE.pop((fn, True))
+        with patch('clickreviews.remote.yaml.load') as mock_load:
+            d = read_cr_file(None, None, local_copy_fn=fn, as_yaml=True)
+            self.assertFalse(mock_load.called)
+        self.assertEqual(d, {'foo': ['bar']})
+
+    def test_read_cr_file_yaml_not_compiled(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        p = patch('clickreviews.remote.COMPILED_DIR',
+                  os.path.join(tmp_dir, 'compiled'))
+        p.start()
+        self.addCleanup(p.stop)
+        fn = os.path.join(tmp_dir, 'some-file.yaml')
+        with open(fn, 'w') as f:
+            # json doesn't have integer keys
+            f.write('1: foo\n')
+
+        d = read_cr_file(None, None, local_copy_fn=fn, as_yaml=True)
+        self.assertEqual(d, {1: 'foo'})
+        self.assertFalse(os.path.exists(os.path.join(tmp_dir, 'compiled')))
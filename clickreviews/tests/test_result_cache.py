@@ -0,0 +1,140 @@
+'''test_result_cache.py: tests for the result_cache module'''
+#
+# Copyright (C) 2018 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+from unittest.mock import patch
+import os
+import shutil
+import tempfile
+
+from clickreviews import common, result_cache
+
+
+class ResultCacheTestCase(TestCase):
+    """Tests for the result cache."""
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.cache_dir = os.path.join(self.tmp_dir, 'results')
+        p = patch('clickreviews.result_cache.CACHE_DIR', self.cache_dir)
+        p.start()
+        self.addCleanup(p.stop)
+
+    def _write_pkg(self, content):
+        fn = os.path.join(self.tmp_dir, 'test.snap')
+        with open(fn, 'wb') as f:
+            f.write(content)
+        return fn
+
+    def test_get_key(self):
+        '''Test get_key()'''
+        fn = self._write_pkg(b'one')
+        key = result_cache.get_key(fn, None)
+        self.assertEqual(result_cache.get_key(fn, None), key)
+        self.assertNotEqual(result_cache.get_key(fn, {'foo': 'bar'}), key)
+        self.assertEqual(result_cache.get_key(fn, {'foo': 'bar'}),
+                         result_cache.get_key(fn, {'foo': 'bar'}))
+
+        # and so do the checks selected
+        self.assertNotEqual(result_cache.get_key(fn, None,
+                                                 {'only': ['lint:*']}), key)
+
+        # and so does unpacking lazily
+        with patch('clickreviews.common.LAZY_UNPACK',
+                   not common.LAZY_UNPACK):
+            self.assertNotEqual(result_cache.get_key(fn, None), key)
+
+        # the package contents matter, not its name
+        self._write_pkg(b'two')
+        self.assertNotEqual(result_cache.get_key(fn, None), key)
+
+        # and so does the code of the checks
+        key = result_cache.get_key(fn, None)
+        with patch('clickreviews.result_cache.TOOL_DIGEST', 'other'):
+            self.assertNotEqual(result_cache.get_key(fn, None), key)
+
+        # and so does the version of the squashfs-tools, or them missing
+        with patch('clickreviews.sr_security.get_squashfs_tools_version',
+                   return_value='4.3'):
+            key = result_cache.get_key(fn, None)
+        with patch('clickreviews.sr_security.get_squashfs_tools_version',
+                   return_value=None):
+            self.assertNotEqual(result_cache.get_key(fn, None), key)
+
+    def test_get_key_data_files(self):
+        '''Test get_key() - data files'''
+        fn = self._write_pkg(b'one')
+        key = result_cache.get_key(fn, None)
+        with patch('clickreviews.result_cache._get_data_digests',
+                   return_value={'snapd-base-declaration.yaml': 'other'}):
+            self.assertNotEqual(result_cache.get_key(fn, None), key)
+
+    def test_update_data_files(self):
+        '''Test update_data_files()'''
+        data_fn = os.path.join(self.tmp_dir, 'test-data.json')
+
+        def _update_cr_file(fn, url):
+            with open(fn, 'w') as f:
+                f.write('{}')
+        with patch('clickreviews.result_cache.DATA_FILES',
+                   [(data_fn, 'http://example.com/test-data.json')]), \
+                patch('clickreviews.remote.update_cr_file',
+                      side_effect=_update_cr_file) as update:
+            result_cache.update_data_files()
+            digests = result_cache._get_data_digests()
+        update.assert_called_once_with(data_fn,
+                                       'http://example.com/test-data.json')
+        self.assertEqual(digests,
+                         {'test-data.json':
+                          common.get_file_digest(data_fn, 'sha256')})
+
+    def test_get_key_missing(self):
+        '''Test get_key() - missing package'''
+        self.assertIsNone(result_cache.get_key(
+            os.path.join(self.tmp_dir, 'nonexistent'), None))
+
+    def test_save_load(self):
+        '''Test save() and load()'''
+        results = {'snap.v2_lint': {'error': {}, 'warn': {},
+                                    'info': {'lint:foo': {'text': 'OK'}}}}
+        self.assertIsNone(result_cache.load('somekey'))
+        result_cache.save('somekey', results)
+        self.assertEqual(result_cache.load('somekey'), results)
+        self.assertEqual(os.listdir(self.cache_dir), ['somekey.json'])
+
+    def test_save_unwritable(self):
+        '''Test save() - cache not writable'''
+        with open(self.cache_dir, 'w') as f:
+            f.write('not a directory')
+        result_cache.save('somekey', {})
+        self.assertIsNone(result_cache.load('somekey'))
+
+    def test_trim(self):
+        '''Test save() - least recently used results dropped'''
+        p = patch('clickreviews.result_cache.CACHE_SIZE', 2500)
+        p.start()
+        self.addCleanup(p.stop)
+        results = {'text': 'x' * 1000}
+        for (i, key) in enumerate(['one', 'two']):
+            result_cache.save(key, results)
+            fn = os.path.join(self.cache_dir, '%s.json' % key)
+            os.utime(fn, (1000 + i, 1000 + i))
+
+        # 'one' is used, so 'two' is the least recently used
+        self.assertIsNotNone(result_cache.load('one'))
+        result_cache.save('three', results)
+        self.assertEqual(sorted(os.listdir(self.cache_dir)),
+                         ['one.json', 'three.json'])
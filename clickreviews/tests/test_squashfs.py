@@ -0,0 +1,239 @@
+'''test_squashfs.py: tests for the squashfs module'''
+#
+# Copyright (C) 2018 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+from unittest.mock import Mock, patch
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+
+from clickreviews import common
+from clickreviews.squashfs import SquashfsError, SquashfsImage
+from clickreviews.tests import utils
+
+
+class SquashfsImageTestCase(TestCase):
+    """Tests for reading squashfs images."""
+    def mkdtemp(self):
+        """Create a temp dir which is cleaned up after test."""
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        return tmp_dir
+
+    def _open_snap(self, extra_files=None):
+        package = utils.make_snap2(output_dir=self.mkdtemp(),
+                                   extra_files=extra_files)
+        image = SquashfsImage(package)
+        self.addCleanup(image.close)
+        return image
+
+    def test_walk(self):
+        '''Test walk()'''
+        image = self._open_snap(extra_files=['bin/foo', 'some/dir/',
+                                             'bin/foo,bin/link'])
+        entries = dict(image.walk())
+        for path in ['meta', 'meta/snap.yaml', 'bin', 'bin/foo', 'some',
+                     'some/dir']:
+            self.assertIn(path, entries)
+        self.assertTrue(entries['some/dir'].is_dir())
+        self.assertTrue(entries['bin/foo'].is_file())
+        self.assertEqual(entries['bin/foo'].size, 0)
+        self.assertTrue(entries['bin/link'].is_symlink())
+        self.assertEqual(entries['bin/link'].target, 'bin/foo')
+        self.assertEqual(sorted(image.listdir('some')), ['dir'])
+
+    def test_read(self):
+        '''Test read()'''
+        image = self._open_snap()
+        content = image.read('meta/snap.yaml').decode('UTF-8')
+        self.assertIn('name: test\n', content)
+        self.assertEqual(image.lookup('meta/snap.yaml').size,
+                         len(content))
+
+    def test_open_seek(self):
+        '''Test open() and seek()'''
+        image = self._open_snap()
+        with image.open('meta/snap.yaml') as f:
+            f.seek(-4, os.SEEK_END)
+            self.assertEqual(f.read(), image.read('meta/snap.yaml')[-4:])
+
+    def test_extract(self):
+        '''Test extract()'''
+        image = self._open_snap(extra_files=['bin/foo,bin/link'])
+        output_dir = self.mkdtemp()
+        image.extract(image.lookup('meta/snap.yaml'),
+                      os.path.join(output_dir, 'snap.yaml'))
+        image.extract(image.lookup('bin/link'),
+                      os.path.join(output_dir, 'link'))
+        with open(os.path.join(output_dir, 'snap.yaml'), 'rb') as f:
+            self.assertEqual(f.read(), image.read('meta/snap.yaml'))
+        self.assertEqual(os.readlink(os.path.join(output_dir, 'link')),
+                         'bin/foo')
+
+    def test_lookup_missing(self):
+        '''Test lookup() - missing file'''
+        image = self._open_snap()
+        self.assertRaises(FileNotFoundError, image.lookup, 'nonexistent')
+        self.assertRaises(FileNotFoundError, image.lookup,
+                          'meta/snap.yaml/foo')
+
+    def test_not_squashfs(self):
+        '''Test SquashfsImage() - not a squashfs image'''
+        fn = os.path.join(self.mkdtemp(), 'test.snap')
+        with open(fn, 'wb') as f:
+            f.write(b'\x00' * 4096)
+        self.assertRaises(SquashfsError, SquashfsImage, fn)
+
+    def test_empty(self):
+        '''Test SquashfsImage() - empty file'''
+        fn = os.path.join(self.mkdtemp(), 'test.snap')
+        open(fn, 'wb').close()
+        self.assertRaises(SquashfsError, SquashfsImage, fn)
+
+    def _patch_metadata(self, image, old, new):
+        '''Replace old by new in the metadata blocks read from image'''
+        orig = image._read_metadata_block
+
+        def _read_metadata_block(pos):
+            (data, next_pos) = orig(pos)
+            return (data.replace(old, new), next_pos)
+        patcher = patch.object(image, '_read_metadata_block',
+                               side_effect=_read_metadata_block)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_walk_invalid_name(self):
+        '''Test walk() - names escaping the directory'''
+        for name in [b'../', b'a/c', b'a\0c']:
+            image = self._open_snap(extra_files=['bin/abc'])
+            self._patch_metadata(image, b'abc', name)
+            self.assertRaises(SquashfsError, list, image.walk())
+
+    def test_walk_deep(self):
+        '''Test walk() - more levels than the recursion limit'''
+        image = self._open_snap()
+        depth = sys.getrecursionlimit() + 10
+        dirs = [Mock(number=i, **{'is_dir.return_value': True})
+                for i in range(depth + 1)]
+
+        def _iterdir(inode):
+            if inode.number < depth:
+                yield ('d', dirs[inode.number + 1])
+        with patch.object(image, 'iterdir', side_effect=_iterdir):
+            entries = [path for (path, inode) in image.walk(dirs[0])]
+        self.assertEqual(len(entries), depth)
+        self.assertEqual(entries[-1], '/'.join(['d'] * depth))
+
+    def test_walk_truncated(self):
+        '''Test walk() - truncated metadata'''
+        image = self._open_snap(extra_files=['bin/foo'])
+        with patch.object(image, '_read_metadata',
+                          return_value=(b'\0', 0, 0)):
+            self.assertRaises(SquashfsError, list, image.walk())
+
+
+class LazyUnpackTestCase(TestCase):
+    """Tests for unpacking snaps lazily."""
+    def setUp(self):
+        self.addCleanup(common.cleanup_unpack)
+        super().setUp()
+
+    def mkdtemp(self):
+        """Create a temp dir which is cleaned up after test."""
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        return tmp_dir
+
+    def _unpack_snap(self):
+        output_dir = self.mkdtemp()
+        src = os.path.join(output_dir, 'foo.txt')
+        with open(src, 'w') as f:
+            f.write('some content\n')
+        package = utils.make_snap2(output_dir=output_dir,
+                                   extra_files=['%s:bin/foo.txt' % src,
+                                                'foo.txt,bin/link'])
+        common.UNPACK_DIR = common.unpack_pkg(package, lazy=True)
+        return (package, common.UNPACK_DIR)
+
+    def test_unpack(self):
+        '''Test unpack_pkg() - lazy'''
+        (package, unpack_dir) = self._unpack_snap()
+        fn = os.path.join(unpack_dir, 'bin/foo.txt')
+        lazy = common.LAZY_UNPACKS[unpack_dir]
+
+        self.assertIn(fn, lazy.pending)
+        self.assertEqual(os.path.getsize(fn), len('some content\n'))
+        self.assertEqual(os.readlink(os.path.join(unpack_dir, 'bin/link')),
+                         'foo.txt')
+
+        with common.open_file_read(fn) as f:
+            self.assertEqual(f.read(), 'some content\n')
+        self.assertNotIn(fn, lazy.pending)
+
+    def test_unpack_symlink(self):
+        '''Test unpack_pkg() - lazy, reading through a symlink'''
+        (package, unpack_dir) = self._unpack_snap()
+        link = os.path.join(unpack_dir, 'bin/link')
+        self.assertEqual(common.get_file_digest(link, 'md5'),
+                         hashlib.md5(b'some content\n').hexdigest())
+        self.assertNotIn(os.path.join(unpack_dir, 'bin/foo.txt'),
+                         common.LAZY_UNPACKS[unpack_dir].pending)
+
+    def test_unpack_mtime(self):
+        '''Test unpack_pkg() - lazy, materialized files keep their mtime'''
+        (package, unpack_dir) = self._unpack_snap()
+        fn = os.path.join(unpack_dir, 'bin/foo.txt')
+        mtime = os.stat(fn).st_mtime
+        common.materialize(fn)
+        self.assertEqual(os.stat(fn).st_mtime, mtime)
+
+    def test_unpack_outside(self):
+        '''Test unpack_pkg() - lazy, paths outside of the unpack dir'''
+        (package, unpack_dir) = self._unpack_snap()
+        lazy = common.LAZY_UNPACKS[unpack_dir]
+        for rel in ['../foo', 'bin/../../foo', '/foo', 'bin//foo', './foo']:
+            self.assertRaises(SquashfsError, lazy._get_path, rel)
+
+        # through a symlink to a directory outside
+        outside = self.mkdtemp()
+        os.symlink(outside, os.path.join(unpack_dir, 'out'))
+        self.assertRaises(SquashfsError, lazy._get_path, 'out/foo')
+
+        # a file of the package is never written through a symlink leading
+        # outside of the unpack dir
+        fn = os.path.join(outside, 'foo.txt')
+        open(fn, 'w').close()
+        lazy.pending[fn] = lazy.pending[os.path.join(unpack_dir,
+                                                     'bin/foo.txt')]
+        common.materialize(os.path.join(unpack_dir, 'out/foo.txt'))
+        self.assertEqual(os.path.getsize(fn), 0)
+
+    def test_mime_type(self):
+        '''Test PackageContext.get_mime_type() - lazy'''
+        (package, unpack_dir) = self._unpack_snap()
+        fn = os.path.join(unpack_dir, 'bin/foo.txt')
+        context = common.PackageContext(package)
+        self.assertIn('text/plain', context.get_mime_type(fn))
+        self.assertNotIn(fn, common.LAZY_UNPACKS[unpack_dir].pending)
+
+    def test_cleanup(self):
+        '''Test cleanup_unpack() - lazy'''
+        (package, unpack_dir) = self._unpack_snap()
+        common.cleanup_unpack()
+        self.assertNotIn(unpack_dir, common.LAZY_UNPACKS)
+        self.assertFalse(os.path.exists(unpack_dir))
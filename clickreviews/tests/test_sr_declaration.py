@@ -14,7 +14,12 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+from unittest.mock import patch
+import os
+
 from clickreviews.sr_declaration import SnapReviewDeclaration, SnapDeclarationException
+import clickreviews.sr_common as sr_common
+import clickreviews.sr_declaration as sr_declaration
 import clickreviews.sr_tests as sr_tests
 import yaml
 
@@ -1387,6 +1392,112 @@ slots:
         self.assertTrue(len(decls['base']) == 0)
         self.assertTrue(len(decls['snap']) == 8)
 
+    def test__get_combinations(self):
+        '''Test _get_combinations()'''
+        c = SnapReviewDeclaration(self.test_name)
+        iface = 'someiface'
+        snap = {
+            'slots': {
+                iface: {
+                    'foo': '1',
+                    'bar': ['2', '3'],
+                    'baz': '4',
+                    'norf': ['5', '6'],
+                }
+            },
+            'plugs': {
+                iface: {
+                    'qux': '7',
+                    'quux': ['8', '9'],
+                }
+            }
+        }
+
+        consulted = set([('slots', 'bar'), ('plugs', 'quux')])
+        decls = list(c._get_combinations(snap, iface, consulted))
+        self.assertEqual(len(decls), 4)
+        self.assertEqual([(d['plugs'][iface]['quux'], d['slots'][iface]['bar'])
+                          for d in decls],
+                         [('8', '2'), ('8', '3'), ('9', '2'), ('9', '3')])
+        # constraints not consulted are not expanded
+        self.assertEqual(decls[0]['slots'][iface]['norf'], ['5', '6'])
+        self.assertEqual(decls[0]['slots'][iface]['foo'], '1')
+
+        self.assertEqual(len(list(c._get_combinations(snap, iface, set()))),
+                         1)
+        self.assertEqual(list(c._get_combinations(None, iface, set())), [])
+        snap['plugs'][iface]['quux'] = []
+        self.assertEqual(list(c._get_combinations(snap, iface, set())), [])
+
+    def test_check_declaration_alternates_unconsulted(self):
+        '''Test check_declaration - alternates not affecting the checks'''
+        plugs = {'iface': {'interface': 'foo', 'name': 'one'}}
+        self.set_test_snap_yaml("plugs", plugs)
+        c = SnapReviewDeclaration(self.test_name)
+        base = {
+            'plugs': {
+                'foo': {
+                    'allow-installation': True,
+                    'allow-auto-connection': [
+                        {'plug-attributes': {'name': str(i)}}
+                        for i in range(20)],
+                    'deny-auto-connection': [
+                        {'plug-attributes': {'name': str(i)}}
+                        for i in range(20)],
+                }
+            }
+        }
+        self._set_base_declaration(c, base)
+
+        p = patch.dict(sr_declaration.VERDICT_CACHE, clear=True)
+        p.start()
+        self.addCleanup(p.stop)
+        with patch.object(c, '_verify_iface_by_declaration',
+                          wraps=c._verify_iface_by_declaration) as mock_v:
+            c.check_declaration()
+            self.assertEqual(mock_v.call_count, 1)
+        r = c.click_report
+        expected_counts = {'info': 1, 'warn': 0, 'error': 0}
+        self.check_results(r, expected_counts)
+
+    def test_check_declaration_alternates_not_leaked(self):
+        '''Test check_declaration - alternates allowed not reported with
+           the next denied interface'''
+        plugs = {'iface': {'interface': 'foo', 'name': 'one'},
+                 'iface2': {'interface': 'bar'}}
+        self.set_test_snap_yaml("plugs", plugs)
+        c = SnapReviewDeclaration(self.test_name)
+        base = {
+            'plugs': {
+                'foo': {
+                    'deny-installation': False,
+                    'deny-connection': [
+                        {'plug-attributes': {'name': 'one'}},
+                        {'plug-attributes': {'name': 'two'}},
+                    ]
+                },
+                'bar': {
+                    'deny-connection': True,
+                },
+            }
+        }
+        self._set_base_declaration(c, base)
+
+        c.check_declaration()
+        r = c.click_report
+        expected_counts = {'info': 1, 'warn': 0, 'error': 1}
+        self.check_results(r, expected_counts)
+
+        expected = dict()
+        expected['error'] = dict()
+        expected['warn'] = dict()
+        expected['info'] = dict()
+        name = 'declaration-snap-v2:plugs:iface:foo'
+        expected['info'][name] = {"text": "OK"}
+        name = 'declaration-snap-v2:plugs_deny-connection:iface2:bar'
+        expected['error'][name] = {"text": "human review required due to 'deny-connection' constraint from base declaration"}
+        self.check_results(r, expected=expected)
+
     def test_check_declaration_unknown_interface(self):
         '''Test check_declaration - unknown interface'''
         slots = {'iface-foo': {'interface': 'bar'}}
@@ -4040,3 +4151,123 @@ slots:
         name = 'declaration-snap-v2:slots:iface:serial-port'
         expected['info'][name] = {"text": "OK"}
         self.check_results(r, expected=expected)
+
+    def test_base_declaration_shared(self):
+        '''Test base declaration is built once and shared'''
+        c = SnapReviewDeclaration(self.test_name)
+        c2 = SnapReviewDeclaration(self.test_name)
+        self.assertIs(c.base_declaration, c2.base_declaration)
+        self.assertIn('home', c.base_declaration['slots'])
+
+    def test_base_declaration_inprogress(self):
+        '''Test base declaration - in-progress interfaces'''
+        inprogress = {'16': {'plugs': {},
+                             'slots': {'foo': {'allow-installation': False},
+                                       'home': {}}}}
+        p = patch.object(SnapReviewDeclaration, 'inprogress_interfaces',
+                         inprogress)
+        p.start()
+        self.addCleanup(p.stop)
+        p = patch.dict(sr_common.BASE_DECLARATION_CACHE, clear=True)
+        p.start()
+        self.addCleanup(p.stop)
+        p = patch.dict(sr_common.SnapReview.interfaces)
+        p.start()
+        self.addCleanup(p.stop)
+
+        c = SnapReviewDeclaration(self.test_name)
+        self.assertEqual(c.base_declaration['slots']['foo'],
+                         {'allow-installation': False})
+        # the base declaration isn't overridden
+        self.assertNotEqual(c.base_declaration['slots']['home'], {})
+        self.assertIn('foo', c.interfaces)
+
+        # the parsed file isn't modified
+        fn = os.path.join(os.path.dirname(sr_common.__file__),
+                          '../data/snapd-base-declaration.yaml')
+        p = sr_common.snapd_base_declaration.SnapdBaseDeclaration(
+            fn, shared=True)
+        self.assertNotIn('foo', p.decl['16']['slots'])
+
+    def test_check_declaration_verdict_cached(self):
+        '''Test check_declaration - verdict reused for another plug'''
+        p = patch.dict(sr_declaration.VERDICT_CACHE, clear=True)
+        p.start()
+        self.addCleanup(p.stop)
+        base = {
+            'plugs': {
+                'foo': {
+                    'deny-connection': {'plug-attributes': {'name': 'one'}},
+                }
+            }
+        }
+        expected_text = "human review required due to 'deny-connection' constraint for 'plug-attributes' from base declaration"
+
+        plugs = {'iface': {'interface': 'foo', 'name': 'one'}}
+        self.set_test_snap_yaml("plugs", plugs)
+        c = SnapReviewDeclaration(self.test_name)
+        self._set_base_declaration(c, base)
+        c.check_declaration()
+        self.assertEqual(len(sr_declaration.VERDICT_CACHE), 1)
+
+        plugs = {'iface2': {'interface': 'foo', 'name': 'one'}}
+        self.set_test_snap_yaml("plugs", plugs)
+        c = SnapReviewDeclaration(self.test_name)
+        self._set_base_declaration(c, base)
+        with patch.object(c, '_verify_iface_by_declarations') as mock_v:
+            c.check_declaration()
+            self.assertFalse(mock_v.called)
+        r = c.click_report
+        expected_counts = {'info': 0, 'warn': 0, 'error': 1}
+        self.check_results(r, expected_counts)
+        expected = dict()
+        expected['error'] = dict()
+        expected['warn'] = dict()
+        expected['info'] = dict()
+        name = 'declaration-snap-v2:plugs_deny-connection:iface2:foo'
+        expected['error'][name] = {"text": expected_text}
+        self.check_results(r, expected=expected)
+
+        # different attributes aren't cached
+        plugs = {'iface': {'interface': 'foo', 'name': 'two'}}
+        self.set_test_snap_yaml("plugs", plugs)
+        c = SnapReviewDeclaration(self.test_name)
+        self._set_base_declaration(c, base)
+        c.check_declaration()
+        r = c.click_report
+        expected_counts = {'info': 1, 'warn': 0, 'error': 0}
+        self.check_results(r, expected_counts)
+        self.assertEqual(len(sr_declaration.VERDICT_CACHE), 2)
+
+    def test_check_declaration_verdict_cache_size(self):
+        '''Test check_declaration - least recently used verdicts dropped'''
+        p = patch.dict(sr_declaration.VERDICT_CACHE, clear=True)
+        p.start()
+        self.addCleanup(p.stop)
+        p = patch('clickreviews.sr_declaration.VERDICT_CACHE_SIZE', 2)
+        p.start()
+        self.addCleanup(p.stop)
+
+        plugs = {'one': {'interface': 'foo', 'name': 'one'},
+                 'two': {'interface': 'foo', 'name': 'two'},
+                 'three': {'interface': 'foo', 'name': 'three'}}
+        self.set_test_snap_yaml("plugs", plugs)
+        c = SnapReviewDeclaration(self.test_name)
+        self._set_base_declaration(c, {'plugs': {'foo': {}}})
+        c.check_declaration()
+        self.assertEqual(len(sr_declaration.VERDICT_CACHE), 2)
+        self.assertNotIn(c._get_verdict_key('plugs', 'foo', {'name': 'one'}),
+                         sr_declaration.VERDICT_CACHE)
+
+    def test_match_pattern_cache_size(self):
+        '''Test _match() - compiled patterns bounded'''
+        c = SnapReviewDeclaration(self.test_name)
+        self.assertTrue(c._match('fo+', 'foo'))
+        self.assertFalse(c._match('fo+', 'foobar'))
+        self.assertFalse(c._match('fo+', 'afoo'))
+
+        sr_declaration._get_match_pattern.cache_clear()
+        for i in range(sr_declaration.MATCH_PATTERN_CACHE_SIZE + 10):
+            c._match('foo%d' % i, 'foo')
+        self.assertEqual(sr_declaration._get_match_pattern.cache_info().currsize,
+                         sr_declaration.MATCH_PATTERN_CACHE_SIZE)
@@ -16,10 +16,12 @@
 
 from __future__ import print_function
 from unittest import TestCase
+from unittest.mock import patch
 import os
 import shutil
 import tempfile
 
+from clickreviews import common
 from clickreviews.common import cleanup_unpack
 from clickreviews.common import check_results as common_check_results
 from clickreviews.sr_security import SnapReviewSecurity
@@ -856,6 +858,34 @@ brw-rw-rw- root/root                8,12a 2016-03-11 12:25 squashfs-root/foo
         expected['error'][name] = {"text": "malformed lines in unsquashfs output: 'time 'z2:25' malformed for './foo''"}
         self.check_results(report, expected=expected)
 
+    def test_check_squashfs_files_shared_inventory(self):
+        '''Test check_squashfs_files() - unsquashfs -lls run once'''
+        out = '''Parallel unsquashfs: Using 4 processors
+8 inodes (8 blocks) to write
+
+crw-rw-rw- root/root                1,  8 2016-03-11 12:25 squashfs-root/foo
+lrwxrwxrwx root/root                 3 2016-03-11 12:25 squashfs-root/bar -> foo
+'''
+        self.set_test_snap_yaml("type", "os")
+        c = SnapReviewSecurity(self.test_name)
+        c2 = SnapReviewSecurity(self.test_name, context=c.context)
+        with patch.object(SnapReviewSecurity, '_unsquashfs_lls',
+                          return_value=(0, out)) as m:
+            c.check_squashfs_files()
+            c2.check_squashfs_files()
+        self.assertEqual(m.call_count, 1)
+        self.check_results(c.click_report, {'info': 1, 'warn': 0,
+                                            'error': 0})
+        self.check_results(c2.click_report, {'info': 1, 'warn': 0,
+                                             'error': 0})
+
+        inventory = c._get_squashfs_inventory()
+        self.assertTrue(inventory.has_symlinks())
+        entry = inventory.entries[0]
+        self.assertEqual((entry.ftype, entry.major, entry.minor, entry.date),
+                         ('c', '1', '8', '2016-03-11'))
+        self.assertEqual(inventory.entries[1].fname, './bar -> foo')
+
 
 class TestSnapReviewSecurityNoMock(TestCase):
     """Tests without mocks where they are not needed."""
@@ -889,6 +919,65 @@ class TestSnapReviewSecurityNoMock(TestCase):
         expected_counts = {'info': 1, 'warn': 0, 'error': 0}
         self.check_results(report, expected_counts)
 
+    def test_check_squashfs_resquash_not_selected(self):
+        '''Test do_checks() - squashfs checks not selected'''
+        package = utils.make_snap2(output_dir=self.mkdtemp())
+        self.addCleanup(setattr, common, 'CHECK_FILTER', None)
+        common.CHECK_FILTER = common.CheckFilter(
+            skip=['security-snap-v2:squashfs_*'])
+        c = SnapReviewSecurity(package)
+        with patch('clickreviews.sr_security.cmd',
+                   return_value=[1, '']) as m:
+            c.do_checks()
+        self.assertFalse(m.called)
+
+        common.CHECK_FILTER = common.CheckFilter(
+            only=['security-snap-v2:squashfs_lls'])
+        c = SnapReviewSecurity(package)
+        with patch('clickreviews.sr_security.cmd',
+                   return_value=[1, '']) as m:
+            c.do_checks()
+        m.assert_any_call(['unsquashfs', '-fstime', os.path.abspath(package)])
+
+    def test_check_squashfs_resquash_off(self):
+        '''Test check_squashfs_resquash() - off'''
+        package = utils.make_snap2(output_dir=self.mkdtemp())
+        c = SnapReviewSecurity(package, overrides={'snap_resquash': 'off'})
+        with patch.object(SnapReviewSecurity, '_resquash_matches') as m:
+            c.check_squashfs_resquash()
+        self.assertFalse(m.called)
+        report = c.click_report
+        expected_counts = {'info': 1, 'warn': 0, 'error': 0}
+        self.check_results(report, expected_counts)
+
+        expected = dict()
+        expected['error'] = dict()
+        expected['warn'] = dict()
+        expected['info'] = dict()
+        name = 'security-snap-v2:squashfs_repack_checksum'
+        expected['info'][name] = {"text": "SKIPPED (resquash disabled)"}
+        self.check_results(report, expected=expected)
+
+    def test_check_squashfs_resquash_cached(self):
+        '''Test check_squashfs_resquash() - cached'''
+        package = utils.make_snap2(output_dir=self.mkdtemp())
+        overrides = {'snap_resquash': 'cached'}
+        cache_dir = os.path.join(self.mkdtemp(), 'resquash')
+        with patch('clickreviews.sr_security.RESQUASH_CACHE_DIR', cache_dir), \
+                patch('clickreviews.sr_security.SQUASHFS_TOOLS_VERSION',
+                      '4.3'):
+            c = SnapReviewSecurity(package, overrides=overrides)
+            c.check_squashfs_resquash()
+            self.check_results(c.click_report)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+            # the second review of the same snap doesn't resquash
+            c = SnapReviewSecurity(package, overrides=overrides)
+            with patch.object(SnapReviewSecurity, '_resquash_matches') as m:
+                c.check_squashfs_resquash()
+            self.assertFalse(m.called)
+            self.check_results(c.click_report)
+
     def test_check_squashfs_resquash_no_fstime(self):
         '''Test check_squashfs_resquash() - no -fstime'''
         output_dir = self.mkdtemp()
@@ -977,99 +1066,40 @@ exit 1
         self.check_results(report, expected_counts)
 
     def test_check_squashfs_resquash_sha512sum_fail(self):
-        '''Test check_squashfs_resquash() - sha512sum failure'''
+        '''Test check_squashfs_resquash() - sha512 failure'''
         output_dir = self.mkdtemp()
         package = utils.make_snap2(output_dir=output_dir)
         c = SnapReviewSecurity(package)
 
-        # fake sha512sum
-        sha512sum = os.path.join(output_dir, 'sha512sum')
-        content = '''#!/bin/sh
-bn=`basename "$1"`
-if [ "$bn" = "test_1.0_all.snap" ]; then
-    echo test error: sha512sum failure
-    exit 1
-fi
-exit 0
-'''
-        with open(sha512sum, 'w') as f:
-            f.write(content)
-        os.chmod(sha512sum, 0o775)
-
-        old_path = os.environ['PATH']
-        if old_path:
-            os.environ['PATH'] = "%s:%s" % (output_dir, os.environ['PATH'])
-        else:
-            os.environ['PATH'] = output_dir  # pragma: nocover
-
-        c.check_squashfs_resquash()
-        os.environ['PATH'] = old_path
+        with patch.object(c.context, 'get_digest', return_value=None):
+            c.check_squashfs_resquash()
         report = c.click_report
         expected_counts = {'info': None, 'warn': 0, 'error': 1}
         self.check_results(report, expected_counts)
 
     def test_check_squashfs_resquash_sha512sum_fail_repacked(self):
-        '''Test check_squashfs_resquash() - sha512sum failure (repacked)'''
+        '''Test check_squashfs_resquash() - sha512 failure (repacked)'''
         output_dir = self.mkdtemp()
         package = utils.make_snap2(output_dir=output_dir)
         c = SnapReviewSecurity(package)
 
-        # fake sha512sum
-        sha512sum = os.path.join(output_dir, 'sha512sum')
-        content = '''#!/bin/sh
-bn=`basename "$1"`
-if [ "$bn" != "test_1.0_all.snap" ]; then
-    echo test error: sha512sum failure
-    exit 1
-fi
-echo deadbeef $1
-exit 0
-'''
-        with open(sha512sum, 'w') as f:
-            f.write(content)
-        os.chmod(sha512sum, 0o775)
-
-        old_path = os.environ['PATH']
-        if old_path:
-            os.environ['PATH'] = "%s:%s" % (output_dir, os.environ['PATH'])
-        else:
-            os.environ['PATH'] = output_dir  # pragma: nocover
-
-        c.check_squashfs_resquash()
-        os.environ['PATH'] = old_path
+        with patch('clickreviews.sr_security.get_file_digest',
+                   return_value=None):
+            c.check_squashfs_resquash()
         report = c.click_report
         expected_counts = {'info': None, 'warn': 0, 'error': 1}
         self.check_results(report, expected_counts)
 
     def test_check_squashfs_resquash_sha512sum_mismatch(self):
-        '''Test check_squashfs_resquash() - sha512sum mismatch'''
+        '''Test check_squashfs_resquash() - sha512 mismatch'''
         output_dir = self.mkdtemp()
         package = utils.make_snap2(output_dir=output_dir)
         c = SnapReviewSecurity(package)
 
-        # fake sha512sum
-        sha512sum = os.path.join(output_dir, 'sha512sum')
-        content = '''#!/bin/sh
-bn=`basename "$1"`
-if [ "$bn" = "test_1.0_all.snap" ]; then
-    echo beefeeee $1
-else
-    echo deadbeef $1
-fi
-exit 0
-'''
-        with open(sha512sum, 'w') as f:
-            f.write(content)
-        os.chmod(sha512sum, 0o775)
-
-        old_path = os.environ['PATH']
-        if old_path:
-            os.environ['PATH'] = "%s:%s" % (output_dir, os.environ['PATH'])
-        else:
-            os.environ['PATH'] = output_dir  # pragma: nocover
-
-        c.check_squashfs_resquash()
-        os.environ['PATH'] = old_path
+        with patch.object(c.context, 'get_digest', return_value='beefeeee'), \
+                patch('clickreviews.sr_security.get_file_digest',
+                      return_value='deadbeef'):
+            c.check_squashfs_resquash()
         report = c.click_report
         # FIXME: this should error but we've turned it into an info until the
         # squashfs-tools bugs can be fixed
@@ -1078,7 +1108,7 @@ exit 0
         self.check_results(report, expected_counts)
 
     def test_check_squashfs_resquash_sha512sum_mismatch_os(self):
-        '''Test check_squashfs_resquash() - sha512sum mismatch - os snap'''
+        '''Test check_squashfs_resquash() - sha512 mismatch - os snap'''
         output_dir = self.mkdtemp()
         package = utils.make_snap2(output_dir=output_dir)
 
@@ -1100,29 +1130,10 @@ type: os
 
         c = SnapReviewSecurity(package)
 
-        # fake sha512sum
-        sha512sum = os.path.join(output_dir, 'sha512sum')
-        content = '''#!/bin/sh
-bn=`basename "$1"`
-if [ "$bn" = "test_1.0_all.snap" ]; then
-    echo beefeeee $1
-else
-    echo deadbeef $1
-fi
-exit 0
-'''
-        with open(sha512sum, 'w') as f:
-            f.write(content)
-        os.chmod(sha512sum, 0o775)
-
-        old_path = os.environ['PATH']
-        if old_path:
-            os.environ['PATH'] = "%s:%s" % (output_dir, os.environ['PATH'])
-        else:
-            os.environ['PATH'] = output_dir  # pragma: nocover
-
-        c.check_squashfs_resquash()
-        os.environ['PATH'] = old_path
+        with patch.object(c.context, 'get_digest', return_value='beefeeee'), \
+                patch('clickreviews.sr_security.get_file_digest',
+                      return_value='deadbeef'):
+            c.check_squashfs_resquash()
         report = c.click_report
         expected_counts = {'info': 1, 'warn': 0, 'error': 0}
         self.check_results(report, expected_counts)
@@ -0,0 +1,89 @@
+'''test_streaming.py: tests for the streaming module'''
+#
+# Copyright (C) 2018 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from unittest.mock import patch
+import io
+import json
+
+from clickreviews import streaming
+from clickreviews.sr_lint import SnapReviewLint
+import clickreviews.sr_tests as sr_tests
+
+
+class TestStreaming(sr_tests.TestSnapReview):
+    """Tests for streaming the results."""
+    def setUp(self):
+        super().setUp()
+        self.set_test_pkgfmt("snap", "16.04")
+        self.output = io.StringIO()
+        self.emitter = streaming.ResultEmitter(self.output)
+        self.emitter.section = 'snap.v2_lint'
+
+    def _get_lines(self):
+        return [json.loads(line) for line in
+                self.output.getvalue().splitlines()]
+
+    def test_emit_report(self):
+        '''Test ResultEmitter.emit_report()'''
+        report = {'info': {'b': {'text': 'OK', 'manual_review': False},
+                           'a': {'text': 'OK', 'manual_review': False}},
+                  'warn': {},
+                  'error': {'c': {'text': 'bad', 'manual_review': True,
+                                  'link': 'http://example.com'}}}
+        self.emitter.emit_report('click,snap.v1_lint', report)
+        self.emitter.summary({'rc': 2})
+
+        lines = self._get_lines()
+        self.assertEqual([(x.get('result_type'), x.get('name'))
+                          for x in lines],
+                         [('error', 'c'), ('info', 'a'), ('info', 'b'),
+                          (None, None)])
+        self.assertEqual(lines[0], {'section': 'click,snap.v1_lint',
+                                    'result_type': 'error',
+                                    'name': 'c',
+                                    'text': 'bad',
+                                    'manual_review': True,
+                                    'link': 'http://example.com'})
+        self.assertEqual(lines[-1], {'summary': {'rc': 2}})
+
+    def test_add_result(self):
+        '''Test results being written as they are added'''
+        c = SnapReviewLint(self.test_name)
+        with patch('clickreviews.streaming.EMITTER', self.emitter):
+            c._add_result('error', 'lint:one', 'bad', manual_review=True)
+            self.assertEqual(len(self._get_lines()), 1)
+            # staged results are only written once applied
+            c._add_result('warn', 'lint:two', 'meh', stage=True)
+            self.assertEqual(len(self._get_lines()), 1)
+            c._apply_staged_results()
+
+        self.assertEqual(self._get_lines(),
+                         [{'section': 'snap.v2_lint',
+                           'result_type': 'error',
+                           'name': 'lint:one',
+                           'text': 'bad',
+                           'manual_review': True},
+                          {'section': 'snap.v2_lint',
+                           'result_type': 'warn',
+                           'name': 'lint:two',
+                           'text': 'meh',
+                           'manual_review': False}])
+
+    def test_add_result_not_streaming(self):
+        '''Test results not being written when not streaming'''
+        c = SnapReviewLint(self.test_name)
+        c._add_result('error', 'lint:one', 'bad')
+        self.assertEqual(self.output.getvalue(), '')
@@ -299,3 +299,37 @@ def build_package(path, name, version, pkgfmt_type, pkgfmt_version,
         # construct the click without filtering any files in the build dir.
         subprocess.check_call(['dpkg-deb', '-b', path, output_path])
     return output_path
+
+
+def make_snap1_hashes(output_dir, archive_sha512='0'):
+    '''Return the path to a snap v1 package with a DEBIAN/hashes.yaml, for
+       the checks which read the raw unpack of the package.
+
+    Caller is responsible for deleting the output_dir afterwards.
+    '''
+    data_dir = tempfile.mkdtemp()
+    try:
+        package_yaml = os.path.join(data_dir, 'package.yaml')
+        with open(package_yaml, 'w') as f:
+            f.write("name: test\nversion: 1.0\n"
+                    "vendor: Someone <someone@example.com>\n")
+        hashes_yaml = os.path.join(data_dir, 'hashes.yaml')
+        with open(hashes_yaml, 'w') as f:
+            f.write("archive-sha512: '%s'\n" % archive_sha512)
+        pkg_path = make_click(pkgfmt_type='snap', pkgfmt_version='15.04',
+                              extra_files=['%s:meta/package.yaml' %
+                                           package_yaml,
+                                           '%s:DEBIAN/hashes.yaml' %
+                                           hashes_yaml],
+                              output_dir=output_dir)
+
+        # check_snappy_hashes() hashes data.tar.gz, which dpkg-deb only
+        # writes when asked to
+        build_dir = os.path.join(data_dir, 'build')
+        subprocess.check_call(['dpkg-deb', '-R', pkg_path, build_dir])
+        subprocess.check_call(['dpkg-deb', '-Zgzip', '-b', build_dir,
+                               pkg_path], stdout=open(os.devnull, 'w'))
+    finally:
+        shutil.rmtree(data_dir)
+
+    return pkg_path